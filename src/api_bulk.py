@@ -0,0 +1,66 @@
+# Bulk lookups of many buildings in one request. The id_lokal_id values are
+# looked up in chunks (see api_sql_queries.stream_bygning) and every row is
+# written to the response as soon as its chunk has been fetched, either as a
+# line of JSON (NDJSON) or as a CSV row.
+
+import csv
+import io
+
+from fastapi.responses import StreamingResponse
+from psycopg_pool import AsyncConnectionPool
+from typing import Any, AsyncIterator, Iterable
+from uuid import UUID
+
+from src.api_sql_queries import stream_bygning
+from src.env import API_BULK_CHUNK_SIZE
+from src.type_models import BygningResponse
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Reads one id_lokal_id per line of an uploaded file. Blank lines and a header
+# line are skipped.
+def parse_id_lokal_ids(lines: Iterable[str]) -> list[UUID]:
+    ids = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip().strip('"')
+        if line == "" or (number == 1 and line == "id_lokal_id"):
+            continue
+        try:
+            ids.append(UUID(line))
+        except ValueError:
+            raise ValueError(f"Line {number} is not a valid UUID: {line}")
+    return ids
+
+
+async def ndjson_lines(rows: AsyncIterator[BygningResponse]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield row.model_dump_json() + "\n"
+
+
+async def csv_lines(rows: AsyncIterator[BygningResponse]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(BygningResponse.model_fields))
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(row.model_dump(mode="json"))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+# Runs one of the bulk queries of api_sql_queries for the ids, where ids that
+# are repeated are only looked up once.
+def bulk_response(
+    pool: AsyncConnectionPool,
+    query: str,
+    id_lokal_ids: list[UUID],
+    params: tuple[Any, ...],
+    format: str,
+) -> StreamingResponse:
+    rows = stream_bygning(
+        pool, query, list(dict.fromkeys(id_lokal_ids)), params, API_BULK_CHUNK_SIZE
+    )
+    lines = ndjson_lines(rows) if format == "ndjson" else csv_lines(rows)
+    return StreamingResponse(lines, media_type=MEDIA_TYPES[format])
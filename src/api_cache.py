@@ -0,0 +1,92 @@
+# In-process LRU cache of /bygning responses.
+# Responses only change when the data pipeline upserts new data, and every
+# upsert bumps the data version in metadata.data_version, for tables with a
+# current-state table only after that has been refreshed. The API polls the
+# version in the background, and the cache is emptied as soon as it changes.
+# A response is only stored if the data version did not change while it was
+# fetched, so a response from before a load can't outlive the invalidation.
+
+import asyncio
+import logging
+
+from collections import OrderedDict
+from psycopg import Connection, Error
+from psycopg_pool import AsyncConnectionPool
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.version: int | None = None
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: Hashable, value: Any, version: int | None) -> None:
+        if self.max_size <= 0 or version != self.version:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def set_version(self, version: int | None) -> None:
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+
+# Marks that api_exposed has changed, and commits. Called by the data
+# pipeline once the changed rows can be read from every table the API reads
+# them from.
+def bump_data_version(cnx: Connection[tuple[Any, ...]]) -> None:
+    with cnx.cursor() as cur:
+        cur.execute(
+            """--sql
+            INSERT INTO metadata.data_version (version) VALUES (1)
+            ON CONFLICT (singleton) DO UPDATE
+            SET version = data_version.version + 1, updated_at = NOW()
+        """
+        )
+    cnx.commit()
+
+
+async def get_data_version(pool: AsyncConnectionPool) -> int | None:
+    try:
+        async with pool.connection() as cnx, cnx.cursor() as cur:
+            await cur.execute("SELECT version FROM metadata.data_version")
+            row = await cur.fetchone()
+    except Error:
+        return None
+    return None if row is None else row[0]
+
+
+# on_change is awaited when the data version has moved, before the cache is
+# emptied. An error is logged and doesn't end the watcher: the cache is still
+# emptied, and a failed on_change is retried at the next poll.
+async def watch_data_version(
+    pool: AsyncConnectionPool,
+    cache: ResponseCache,
+    interval: float,
+    on_change: Callable[[], Awaitable[None]] | None = None,
+) -> None:
+    pending = False
+    while True:
+        version = cache.version
+        try:
+            version = await get_data_version(pool)
+            pending = pending or version != cache.version
+            if pending and on_change is not None:
+                await on_change()
+            pending = False
+        except Exception:
+            logger.exception("Watching the data version failed")
+        cache.set_version(version)
+        await asyncio.sleep(interval)
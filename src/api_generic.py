@@ -0,0 +1,178 @@
+# Generic read API for every api_exposed table, generated from the latest
+# schemas in the schema registry.
+# POST /v1/{table}/ streams the rows of a table as NDJSON, one object per
+# line. Query parameters:
+#   fields    comma separated columns to return, id is always returned
+#   after     id of the last row of the previous page (keyset pagination)
+#   limit     rows per page
+#   gyldig    only the latest registration of each period, like /bygning
+#   ibrug     only the periods in effect today, like /bygning
+#   <column>  equality filter on an indexed column, typed like the column
+# Pages are ordered by id. A page with fewer than limit rows is the last.
+
+import json
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from psycopg import Error
+from psycopg_pool import AsyncConnectionPool
+from typing import Any, AsyncIterator, Mapping
+from uuid import UUID
+
+from src.current_state import current_table, has_current_state
+from src.indexes import table_indexes
+from src.type_models import DbSchema, TableInfo
+from src.typed_staging import converter, is_geometry_type
+
+RESERVED_PARAMS = {"fields", "after", "limit", "gyldig", "ibrug"}
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+BOOLEANS = {"true": True, "1": True, "false": False, "0": False}
+
+
+# The latest schema of every table with columns, by table name.
+async def load_api_schema(pool: AsyncConnectionPool) -> dict[str, DbSchema]:
+    try:
+        async with pool.connection() as cnx, cnx.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT DISTINCT ON (object_list) db_schema
+                FROM metadata.schema_registry
+                ORDER BY object_list, version DESC
+            """
+            )
+            rows = await cur.fetchall()
+    except Error:
+        return {}
+    schemas = [DbSchema.model_validate(row[0]) for row in rows]
+    return {s.db_table_name: s for s in schemas if s.columns != {}}
+
+
+# The tables of api_exposed. A table's current-state table (see
+# current_state.py) is only read once it is among them, as the API may run
+# before the first load that creates it.
+async def load_api_tables(pool: AsyncConnectionPool) -> set[str]:
+    try:
+        async with pool.connection() as cnx, cnx.cursor() as cur:
+            await cur.execute(
+                "SELECT tablename FROM pg_tables WHERE schemaname = 'api_exposed'"
+            )
+            rows = await cur.fetchall()
+    except Error:
+        return set()
+    return {row[0] for row in rows}
+
+
+def column_types(table_schema: DbSchema) -> dict[str, str | None]:
+    return {c.db_column_name: c.db_type for c in table_schema.columns.values()}
+
+
+# Columns that can be filtered on: id and the leading column of every btree
+# index of the table (see indexes.py), so a filter never scans the table.
+def filter_columns(table_schema: DbSchema) -> dict[str, str]:
+    types = column_types(table_schema)
+    filters = {"id": "UUID"}
+    for index in table_indexes(table_schema):
+        column = index.columns[0].split()[0]
+        if index.using == "btree" and types.get(column) is not None:
+            filters[column] = types[column]
+    return filters
+
+
+def table_info(table_schema: DbSchema) -> TableInfo:
+    return TableInfo(
+        table=table_schema.db_table_name,
+        columns=column_types(table_schema),
+        filters=list(filter_columns(table_schema)),
+    )
+
+
+def parse_bool(name: str, value: str) -> bool:
+    if value.lower() not in BOOLEANS:
+        raise ValueError(f"{name} must be true or false, got {value}")
+    return BOOLEANS[value.lower()]
+
+
+# Builds the query for the request parameters and returns it with its
+# parameters and the names of the returned columns. Invalid parameters raise
+# a ValueError. current_state tells whether the current-state table of the
+# table exists.
+def read_query(
+    table_schema: DbSchema, params: Mapping[str, str], current_state: bool = True
+) -> tuple[str, list[Any], list[str]]:
+    types = column_types(table_schema)
+    fields = (
+        [f.strip() for f in params["fields"].split(",") if f.strip()]
+        if "fields" in params
+        else list(types)
+    )
+    unknown = [f for f in fields if f not in types and f != "id"]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    names = ["id"] + [f for f in fields if f != "id"]
+    select = ", ".join(
+        (
+            f"ST_AsGeoJSON({n})::JSON AS {n}"
+            if is_geometry_type(types.get(n) or "")
+            else n
+        )
+        for n in names
+    )
+
+    limit = int(params.get("limit", DEFAULT_LIMIT))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    gyldig = parse_bool("gyldig", params.get("gyldig", "true"))
+    ibrug = parse_bool("ibrug", params.get("ibrug", "true"))
+    after = UUID(params["after"]) if "after" in params else None
+
+    table = table_schema.db_table_name
+    temporal = has_current_state(table_schema)
+    conditions = ["id > COALESCE(%s::UUID, '00000000-0000-0000-0000-000000000000')"]
+    values: list[Any] = [after]
+    filters = filter_columns(table_schema)
+    for name, value in params.items():
+        if name in RESERVED_PARAMS:
+            continue
+        if name not in filters:
+            raise ValueError(
+                f"Can't filter on {name}, filters are: {', '.join(filters)}"
+            )
+        try:
+            values.append(converter(filters[name], timezone.utc)(value))
+        except (ValueError, ArithmeticError):
+            raise ValueError(f"{name} must be of type {filters[name]}, got {value}")
+        conditions.append(f"{name} = %s")
+    if temporal and gyldig and ibrug and current_state:
+        table = current_table(table)
+    elif temporal:
+        if ibrug:
+            conditions.append("virkning_til IS NULL")
+        if gyldig:
+            conditions.append("registrering_til IS NULL")
+    values.append(limit)
+    query = f"""
+        SELECT {select}
+        FROM api_exposed.{table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+        LIMIT %s
+    """
+    return query, values, names
+
+
+def json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+# Rows are streamed from postgres as they arrive and written as NDJSON.
+async def stream_rows(
+    pool: AsyncConnectionPool, query: str, values: list[Any], names: list[str]
+) -> AsyncIterator[str]:
+    async with pool.connection() as cnx, cnx.cursor() as cur:
+        async for row in cur.stream(query, values):
+            yield json.dumps(dict(zip(names, row)), default=json_value) + "\n"
@@ -1,17 +1,294 @@
-from fastapi import FastAPI, Query, Header, HTTPException
-from typing import Annotated
+import asyncio
 
-from src.type_models import BygningQuery, BygningResponse
-from src.api_sql_queries import get_bygning
-from src.env import API_KEY
+from contextlib import asynccontextmanager, suppress
+from fastapi import Body, FastAPI, Query, Header, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Any
+from uuid import UUID
 
-app = FastAPI()
+from src.type_models import (
+    BboxQuery,
+    BygningAsOfBulkQuery,
+    BygningAsOfQuery,
+    BygningBulkQuery,
+    BygningQuery,
+    BygningResponse,
+    RadiusQuery,
+    SpatialPage,
+    SpatialQuery,
+    TableInfo,
+)
+from src.api_generic import (
+    load_api_schema,
+    load_api_tables,
+    read_query,
+    stream_rows,
+    table_info,
+)
+from src.api_bulk import bulk_response, parse_id_lokal_ids
+from src.api_spatial import polygon_wkb, search, spatial_tables
+from src.api_cache import ResponseCache, get_data_version, watch_data_version
+from src.api_sql_queries import (
+    BYGNING_AS_OF_BULK_QUERY,
+    BYGNING_BULK_QUERIES,
+    create_pool,
+    get_bygning,
+    get_bygning_as_of,
+)
+from src.current_state import current_table
+from src.env import API_KEY, API_CACHE_SIZE, API_CACHE_POLL_SECONDS
+
+
+# The connection pool lives as long as the app. It is opened before the first
+# request is served and drained when the server shuts down. Alongside it a
+# background task watches the data version to invalidate the response cache
+# and reload the table schemas of the generic API and the tables that exist.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.pool = create_pool()
+    await app.state.pool.open()
+    app.state.cache = ResponseCache(API_CACHE_SIZE)
+    app.state.cache.set_version(await get_data_version(app.state.pool))
+    app.state.schema = await load_api_schema(app.state.pool)
+    app.state.tables = await load_api_tables(app.state.pool)
+
+    # A load may have registered new schemas and created current-state tables.
+    async def reload_schema() -> None:
+        app.state.schema = await load_api_schema(app.state.pool)
+        app.state.tables = await load_api_tables(app.state.pool)
+
+    watcher = asyncio.create_task(
+        watch_data_version(
+            app.state.pool, app.state.cache, API_CACHE_POLL_SECONDS, reload_schema
+        )
+    )
+    yield
+    # The watcher is awaited, so it can't use the pool once it is closed.
+    watcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await watcher
+    await app.state.pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def has_current_table(request: Request, table: str) -> bool:
+    return current_table(table) in request.app.state.tables
 
 
 @app.post("/bygning/", response_model=list[BygningResponse])
 async def read_root(
-    query_params: Annotated[BygningQuery, Query()], token: Annotated[str, Header()]
+    request: Request,
+    query_params: Annotated[BygningQuery, Query()],
+    token: Annotated[str, Header()],
 ) -> list[BygningResponse]:
     if token != API_KEY:
         raise HTTPException(status_code=401, detail="Invalid token")
-    return get_bygning(query_params)
+    cache = request.app.state.cache
+    key = (query_params.id_lokal_id, query_params.gyldig, query_params.ibrug)
+    response = cache.get(key)
+    if response is None:
+        version = cache.version
+        response = await get_bygning(
+            request.app.state.pool, query_params, has_current_table(request, "bygning")
+        )
+        cache.put(key, response, version)
+    return response
+
+
+# Bulk lookup of the id_lokal_id values in the request body. The response is
+# streamed as NDJSON or CSV.
+@app.post("/bygning/bulk/")
+async def read_bulk(
+    request: Request,
+    query_params: Annotated[BygningBulkQuery, Query()],
+    id_lokal_ids: Annotated[list[UUID], Body()],
+    token: Annotated[str, Header()],
+) -> StreamingResponse:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return bulk_response(
+        request.app.state.pool,
+        BYGNING_BULK_QUERIES[
+            (
+                query_params.gyldig,
+                query_params.ibrug,
+                has_current_table(request, "bygning"),
+            )
+        ],
+        id_lokal_ids,
+        (),
+        query_params.format,
+    )
+
+
+# Same as /bygning/bulk/, with the id_lokal_id values in an uploaded file of
+# one UUID per line. The file is read without blocking the event loop, as
+# the synchronous file of UploadFile may be spooled to disk.
+@app.post("/bygning/bulk/file/")
+async def read_bulk_file(
+    request: Request,
+    query_params: Annotated[BygningBulkQuery, Query()],
+    file: UploadFile,
+    token: Annotated[str, Header()],
+) -> StreamingResponse:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    try:
+        id_lokal_ids = parse_id_lokal_ids(
+            (await file.read()).decode("utf-8-sig").splitlines()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return bulk_response(
+        request.app.state.pool,
+        BYGNING_BULK_QUERIES[
+            (
+                query_params.gyldig,
+                query_params.ibrug,
+                has_current_table(request, "bygning"),
+            )
+        ],
+        id_lokal_ids,
+        (),
+        query_params.format,
+    )
+
+
+# The registrations of a building as the registry had them at
+# registrering_tid, for the periods that were in effect at virkning_tid.
+@app.post("/bygning/as_of/", response_model=list[BygningResponse])
+async def read_as_of(
+    request: Request,
+    query_params: Annotated[BygningAsOfQuery, Query()],
+    token: Annotated[str, Header()],
+) -> list[BygningResponse]:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return await get_bygning_as_of(request.app.state.pool, query_params)
+
+
+# As-of lookup of the id_lokal_id values in the request body, streamed like
+# /bygning/bulk/.
+@app.post("/bygning/as_of/bulk/")
+async def read_as_of_bulk(
+    request: Request,
+    query_params: Annotated[BygningAsOfBulkQuery, Query()],
+    id_lokal_ids: Annotated[list[UUID], Body()],
+    token: Annotated[str, Header()],
+) -> StreamingResponse:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return bulk_response(
+        request.app.state.pool,
+        BYGNING_AS_OF_BULK_QUERY,
+        id_lokal_ids,
+        (query_params.virkning_tid, query_params.registrering_tid),
+        query_params.format,
+    )
+
+
+# Spatial search, see api_spatial.py.
+@app.post("/spatial/{table}/bbox/", response_model=SpatialPage)
+async def read_bbox(
+    request: Request,
+    table: str,
+    query_params: Annotated[BboxQuery, Query()],
+    token: Annotated[str, Header()],
+) -> SpatialPage:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    geoms = spatial_tables(request.app.state.schema)
+    if table not in geoms:
+        raise HTTPException(status_code=404, detail=f"Unknown spatial table {table}")
+    return await search(
+        request.app.state.pool,
+        table,
+        geoms[table],
+        "bbox",
+        query_params,
+        (
+            query_params.min_x,
+            query_params.min_y,
+            query_params.max_x,
+            query_params.max_y,
+        ),
+    )
+
+
+@app.post("/spatial/{table}/radius/", response_model=SpatialPage)
+async def read_radius(
+    request: Request,
+    table: str,
+    query_params: Annotated[RadiusQuery, Query()],
+    token: Annotated[str, Header()],
+) -> SpatialPage:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    geoms = spatial_tables(request.app.state.schema)
+    if table not in geoms:
+        raise HTTPException(status_code=404, detail=f"Unknown spatial table {table}")
+    return await search(
+        request.app.state.pool,
+        table,
+        geoms[table],
+        "radius",
+        query_params,
+        (query_params.x, query_params.y, query_params.radius),
+    )
+
+
+# The polygon is a GeoJSON Polygon or MultiPolygon in the request body.
+@app.post("/spatial/{table}/polygon/", response_model=SpatialPage)
+async def read_polygon(
+    request: Request,
+    table: str,
+    query_params: Annotated[SpatialQuery, Query()],
+    polygon: Annotated[dict[str, Any], Body()],
+    token: Annotated[str, Header()],
+) -> SpatialPage:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    geoms = spatial_tables(request.app.state.schema)
+    if table not in geoms:
+        raise HTTPException(status_code=404, detail=f"Unknown spatial table {table}")
+    try:
+        wkb = polygon_wkb(polygon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await search(
+        request.app.state.pool, table, geoms[table], "polygon", query_params, (wkb,)
+    )
+
+
+# Generic read API for every table, see api_generic.py.
+@app.post("/v1/", response_model=list[TableInfo])
+async def read_tables(
+    request: Request, token: Annotated[str, Header()]
+) -> list[TableInfo]:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return [table_info(s) for s in request.app.state.schema.values()]
+
+
+@app.post("/v1/{table}/")
+async def read_table(
+    request: Request, table: str, token: Annotated[str, Header()]
+) -> StreamingResponse:
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if table not in request.app.state.schema:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    try:
+        query, values, names = read_query(
+            request.app.state.schema[table],
+            request.query_params,
+            has_current_table(request, table),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        stream_rows(request.app.state.pool, query, values, names),
+        media_type="application/x-ndjson",
+    )
@@ -0,0 +1,124 @@
+# Spatial search in the tables with a geometry column: everything inside a
+# bounding box, within a radius of a point, or intersecting a polygon. The
+# coordinates of BBR are EPSG:25832 (ETRS89 / UTM zone 32N) in metres and are
+# stored without SRID, so the search areas are built the same way.
+# Results are paged by id (keyset pagination): a page holds the first limit
+# rows with an id after the last id of the previous page, which postgres
+# finds through the primary key however deep the page is. The geometry
+# filters use the GiST indexes of the geometry columns (see indexes.py).
+# The searchable tables are those whose registered schema has a geometry
+# column and the bitemporal columns, so a table gaining them in a load is
+# searchable once the API has reloaded the schemas.
+
+import shapely
+
+from psycopg_pool import AsyncConnectionPool
+from typing import Any
+
+from src.current_state import has_current_state
+from src.type_models import DbSchema, SpatialFeature, SpatialPage, SpatialQuery
+from src.typed_staging import is_geometry_type
+
+# Column of a feature: the types it can be returned from.
+FEATURE_TYPES = {
+    "id_lokal_id": ["UUID"],
+    "virkning_fra": ["TIMESTAMPTZ", "TIMESTAMP"],
+    "registrering_fra": ["TIMESTAMPTZ", "TIMESTAMP"],
+}
+
+# Filter per kind of search, with the geometry column as {geom}.
+SPATIAL_FILTERS = {
+    "bbox": "{geom} && ST_MakeEnvelope(%s::FLOAT8, %s::FLOAT8, %s::FLOAT8, %s::FLOAT8)",
+    "radius": "ST_DWithin({geom}, ST_MakePoint(%s::FLOAT8, %s::FLOAT8), %s::FLOAT8)",
+    "polygon": "ST_Intersects({geom}, ST_GeomFromWKB(%s::BYTEA))",
+}
+
+
+# Table: geometry column, of the bitemporal tables with a geometry column. A
+# table with several geometry columns is searched by the first of them.
+# Features are returned with the columns of SpatialFeature, and gyldig and
+# ibrug filter on virkning_til and registrering_til, so a table lacking any
+# of them is not searchable.
+def spatial_tables(schema: dict[str, DbSchema]) -> dict[str, str]:
+    tables = {}
+    for table, table_schema in schema.items():
+        types = {c.db_column_name: c.db_type for c in table_schema.columns.values()}
+        if not has_current_state(table_schema) or any(
+            types.get(c) not in column_types
+            for c, column_types in FEATURE_TYPES.items()
+        ):
+            continue
+        geoms = [
+            c for c, tp in types.items() if tp is not None and is_geometry_type(tp)
+        ]
+        if geoms:
+            tables[table] = geoms[0]
+    return tables
+
+
+# The query takes the simplification tolerance, the parameters of the
+# filter, the id to start after and the page size.
+def spatial_query(table: str, geom: str, search: str, gyldig: bool, ibrug: bool) -> str:
+    query = f"""
+        SELECT id, id_lokal_id, virkning_fra, registrering_fra,
+            ST_AsGeoJSON(ST_SimplifyPreserveTopology({geom}, COALESCE(%s::FLOAT8, 0)))::JSON
+        FROM api_exposed.{table}
+        WHERE {SPATIAL_FILTERS[search].format(geom=geom)}
+            AND id > COALESCE(%s::UUID, '00000000-0000-0000-0000-000000000000')
+    """
+    if ibrug:
+        query += " AND virkning_til IS NULL"
+    if gyldig:
+        query += " AND registrering_til IS NULL"
+    query += " ORDER BY id LIMIT %s"
+    return query
+
+
+# Polygons are given as GeoJSON, and handed to postgres as WKB.
+def polygon_wkb(geojson: dict[str, Any]) -> bytes:
+    try:
+        polygon = shapely.geometry.shape(geojson)
+    except (shapely.errors.ShapelyError, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid GeoJSON geometry: {e}")
+    if polygon.geom_type not in ("Polygon", "MultiPolygon"):
+        raise ValueError(f"Expected a Polygon or MultiPolygon, got {polygon.geom_type}")
+    if not polygon.is_valid:
+        raise ValueError("The polygon is not valid")
+    return shapely.to_wkb(polygon)
+
+
+async def search(
+    pool: AsyncConnectionPool,
+    table: str,
+    geom: str,
+    search: str,
+    query_params: SpatialQuery,
+    filter_params: tuple[Any, ...],
+) -> SpatialPage:
+    query = spatial_query(table, geom, search, query_params.gyldig, query_params.ibrug)
+    async with pool.connection() as cnx, cnx.cursor() as cur:
+        await cur.execute(
+            query,
+            (
+                query_params.simplify,
+                *filter_params,
+                query_params.after,
+                query_params.limit,
+            ),
+            prepare=True,
+        )
+        rows = await cur.fetchall()
+    features = [
+        SpatialFeature(
+            id=row[0],
+            id_lokal_id=row[1],
+            virkning_fra=row[2],
+            registrering_fra=row[3],
+            geometry=row[4],
+        )
+        for row in rows
+    ]
+    return SpatialPage(
+        features=features,
+        next_after=features[-1].id if len(features) == query_params.limit else None,
+    )
@@ -1,35 +1,144 @@
-from psycopg import connect
+from psycopg_pool import AsyncConnectionPool
+from typing import Any, AsyncIterator
+from uuid import UUID
 
-from src.env import POSTGRES_CONNECTION_STRING
-from src.type_models import BygningQuery, BygningResponse
+from src.env import (
+    POSTGRES_CONNECTION_STRING,
+    POSTGRES_POOL_MIN_SIZE,
+    POSTGRES_POOL_MAX_SIZE,
+)
+from src.type_models import BygningAsOfQuery, BygningQuery, BygningResponse
 
+BYGNING_QUERY = """
+    SELECT id, byg007_bygningsnummer, byg021_bygningens_anvendelse, id_lokal_id, grund, virkning_fra, registrering_fra
+    FROM api_exposed.{table}
+"""
 
-def get_bygning(query_params: BygningQuery) -> list[BygningResponse]:
-    cnx = connect(POSTGRES_CONNECTION_STRING)
-    cnx.autocommit = True
-    query = """
-        SELECT id, byg007_bygningsnummer, byg021_bygningens_anvendelse, id_lokal_id, grund, virkning_fra, registrering_fra
-        FROM api_exposed.bygning
-        WHERE id_lokal_id = %s
-    """
-    if query_params.ibrug:
+
+# The bulk variant looks up a whole chunk of id_lokal_id values at once.
+# Rows that are both valid and in use are read from the current-state table
+# maintained by the data pipeline (see current_state.py), which holds only
+# those rows. Until the pipeline has created it (current_state=False) they
+# are filtered from the full table.
+def bygning_query(
+    gyldig: bool, ibrug: bool, bulk: bool = False, current_state: bool = True
+) -> str:
+    current = current_state and gyldig and ibrug
+    query = BYGNING_QUERY.format(table="bygning_current" if current else "bygning")
+    query += "WHERE id_lokal_id = ANY(%s)" if bulk else "WHERE id_lokal_id = %s"
+    if ibrug and not current:
         query += " AND virkning_til IS NULL"
-    if query_params.gyldig:
+    if gyldig and not current:
         query += " AND registrering_til IS NULL"
     query += " ORDER BY id_lokal_id, virkning_fra DESC, registrering_fra DESC"
-    with cnx.cursor() as cur:
-        cur.execute("SET search_path TO api_exposed, public")
-        cur.execute(query, (query_params.id_lokal_id,))
-        rows = cur.fetchall()
-    return [
-        BygningResponse(
-            id=row[0],
-            byg007_bygningsnummer=row[1],
-            byg021_bygningens_anvendelse=row[2],
-            id_lokal_id=row[3],
-            grund=row[4],
-            virkning_fra=row[5],
-            registrering_fra=row[6],
-        )
-        for row in rows
-    ]
+    return query
+
+
+# The gyldig/ibrug/current_state variants of the query. Each is prepared on
+# the server the first time a pooled connection executes it and reused from
+# then on.
+BYGNING_QUERIES = {
+    (gyldig, ibrug, current_state): bygning_query(gyldig, ibrug, False, current_state)
+    for gyldig in (True, False)
+    for ibrug in (True, False)
+    for current_state in (True, False)
+}
+BYGNING_BULK_QUERIES = {
+    (gyldig, ibrug, current_state): bygning_query(gyldig, ibrug, True, current_state)
+    for gyldig in (True, False)
+    for ibrug in (True, False)
+    for current_state in (True, False)
+}
+
+
+# As-of lookups through the generated validity periods (see bitemporal.py).
+# A missing time means now.
+def bygning_as_of_query(bulk: bool = False) -> str:
+    query = BYGNING_QUERY.format(table="bygning")
+    query += "WHERE id_lokal_id = ANY(%s)" if bulk else "WHERE id_lokal_id = %s"
+    query += " AND virkning @> COALESCE(%s::TIMESTAMPTZ, NOW())"
+    query += " AND registrering @> COALESCE(%s::TIMESTAMPTZ, NOW())"
+    query += " ORDER BY id_lokal_id, virkning_fra DESC, registrering_fra DESC"
+    return query
+
+
+BYGNING_AS_OF_QUERY = bygning_as_of_query()
+BYGNING_AS_OF_BULK_QUERY = bygning_as_of_query(bulk=True)
+
+
+# The pool is opened at app startup and closed on shutdown (see api_main).
+# search_path is set once per connection instead of on every request.
+def create_pool() -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        POSTGRES_CONNECTION_STRING,
+        min_size=POSTGRES_POOL_MIN_SIZE,
+        max_size=POSTGRES_POOL_MAX_SIZE,
+        kwargs={"autocommit": True, "options": "-c search_path=api_exposed,public"},
+        open=False,
+    )
+
+
+async def get_bygning(
+    pool: AsyncConnectionPool, query_params: BygningQuery, current_state: bool = True
+) -> list[BygningResponse]:
+    return await fetch_bygning(
+        pool,
+        BYGNING_QUERIES[(query_params.gyldig, query_params.ibrug, current_state)],
+        (query_params.id_lokal_id,),
+    )
+
+
+async def get_bygning_as_of(
+    pool: AsyncConnectionPool, query_params: BygningAsOfQuery
+) -> list[BygningResponse]:
+    return await fetch_bygning(
+        pool,
+        BYGNING_AS_OF_QUERY,
+        (
+            query_params.id_lokal_id,
+            query_params.virkning_tid,
+            query_params.registrering_tid,
+        ),
+    )
+
+
+async def fetch_bygning(
+    pool: AsyncConnectionPool, query: str, params: tuple[Any, ...]
+) -> list[BygningResponse]:
+    async with pool.connection() as cnx, cnx.cursor() as cur:
+        await cur.execute(query, params, prepare=True)
+        rows = await cur.fetchall()
+    return [bygning_response(row) for row in rows]
+
+
+def bygning_response(row: tuple[Any, ...]) -> BygningResponse:
+    return BygningResponse(
+        id=row[0],
+        byg007_bygningsnummer=row[1],
+        byg021_bygningens_anvendelse=row[2],
+        id_lokal_id=row[3],
+        grund=row[4],
+        virkning_fra=row[5],
+        registrering_fra=row[6],
+    )
+
+
+# Looks up the id_lokal_id values chunk_size at a time with one of the bulk
+# queries, which take the chunk as their first parameter and params after
+# it. The rows of each chunk are yielded as soon as it has been fetched, so
+# neither the database nor the API ever holds the whole result.
+async def stream_bygning(
+    pool: AsyncConnectionPool,
+    query: str,
+    id_lokal_ids: list[UUID],
+    params: tuple[Any, ...],
+    chunk_size: int,
+) -> AsyncIterator[BygningResponse]:
+    for i in range(0, len(id_lokal_ids), chunk_size):
+        async with pool.connection() as cnx, cnx.cursor() as cur:
+            await cur.execute(
+                query, (id_lokal_ids[i : i + chunk_size], *params), prepare=True
+            )
+            rows = await cur.fetchall()
+        for row in rows:
+            yield bygning_response(row)
@@ -0,0 +1,207 @@
+# Benchmark of the data pipeline against a local postgres.
+# Runs every stage of data_main on a file, e.g. one written by
+# synthetic_data.py, one stage at a time over all tables, and appends the
+# wall time, throughput and peak resident memory of each stage as one json
+# line to the results file, so runs can be compared over time.
+# The peak memory is the peak of the process so far, as reported by the
+# kernel after each stage.
+#
+# python -m src.benchmark --file data/synthetic.zip
+#
+# The benchmark writes to the database of POSTGRES_CONNECTION_STRING.
+
+import argparse
+import os
+import subprocess
+import time
+
+from datetime import datetime, timezone
+from functools import partial
+from psycopg import Connection, connect
+from typing import Any, Callable
+
+from src.current_state import current_state_setup, refresh_current_state
+from src.data_load import (
+    check_upload_and_api_exposed_table_match,
+    check_upload_and_file_table_match,
+    cleanup,
+    upload_data,
+    upsert_table,
+)
+from src.database_creation import database_setup, map_schema, widen_columns
+from src.env import POSTGRES_CONNECTION_STRING
+from src.schema_registry import (
+    evolve_schema,
+    load_schema_registry,
+    save_schema_registry,
+)
+from src.run_report import peak_rss_mb
+from src.scheduler import TableStage
+from src.type_models import BenchmarkResult, DbSchema, StageTiming
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(stage: str, rows: int, run: Callable[[], Any]) -> tuple[Any, StageTiming]:
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    timing = StageTiming(
+        stage=stage,
+        seconds=seconds,
+        rows=rows,
+        rows_per_second=rows / seconds if seconds > 0 else 0.0,
+        peak_rss_mb=peak_rss_mb(),
+    )
+    print(f"{stage}: {seconds:.2f} s, {timing.peak_rss_mb:,.0f} MB peak RSS")
+    return result, timing
+
+
+def run_tables(
+    saved_schema: dict[str, DbSchema],
+    stage: TableStage,
+    cnx: Connection[tuple[Any, ...]],
+) -> None:
+    for t in saved_schema:
+        if saved_schema[t].columns != {}:
+            stage(t, saved_schema[t], cnx)
+            cnx.commit()
+
+
+def run_benchmark(
+    file_path: str,
+    typed_staging: bool = False,
+    batch_size: int = 50000,
+    batch_workers: int = 1,
+    merge: bool = False,
+    mutable_hash: str = "md5",
+) -> BenchmarkResult:
+    started_at = datetime.now(timezone.utc)
+    timings = []
+    with connect(POSTGRES_CONNECTION_STRING) as cnx:
+        # Every key is inferred, as on a first run.
+        inferred_schema, timing = timed("map_schema", 0, lambda: map_schema(file_path))
+        timings.append(timing)
+        registered_schema = load_schema_registry(cnx)
+        saved_schema = evolve_schema(registered_schema, inferred_schema)
+
+        def setup() -> None:
+            widen_columns(registered_schema, saved_schema, cnx)
+            database_setup(saved_schema, cnx, typed_staging)
+            current_state_setup(registered_schema, saved_schema, cnx)
+            save_schema_registry(registered_schema, saved_schema, cnx)
+
+        _, timing = timed("database_setup", 0, setup)
+        timings.append(timing)
+
+        file_digests, upload_timing = timed(
+            "upload_data",
+            0,
+            lambda: upload_data(
+                saved_schema, cnx, file_path, typed_staging, mutable_hash
+            ),
+        )
+        timings.append(upload_timing)
+        # The rows of the file are only known after the upload, so the
+        # throughput of map_schema and upload_data is set afterwards.
+        rows = sum(d.rows for d in file_digests.values())
+        print(f"{rows} rows in {file_path}.")
+        for timing in [timings[0], upload_timing]:
+            timing.rows = rows
+            timing.rows_per_second = rows / timing.seconds if timing.seconds else 0.0
+
+        with cnx.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP")
+            run_started = cur.fetchone()[0]
+        cnx.commit()
+        for stage, table_stage in [
+            (
+                "check_upload_and_file_table_match",
+                partial(
+                    check_upload_and_file_table_match,
+                    file_digests=file_digests,
+                    typed_staging=typed_staging,
+                ),
+            ),
+            (
+                "upsert_table",
+                partial(
+                    upsert_table,
+                    typed_staging=typed_staging,
+                    batch_size=batch_size,
+                    batch_workers=batch_workers,
+                    merge=merge,
+                ),
+            ),
+            (
+                "check_upload_and_api_exposed_table_match",
+                partial(
+                    check_upload_and_api_exposed_table_match,
+                    typed_staging=typed_staging,
+                ),
+            ),
+            (
+                "refresh_current_state",
+                partial(refresh_current_state, since=run_started),
+            ),
+        ]:
+            _, timing = timed(
+                stage, rows, lambda: run_tables(saved_schema, table_stage, cnx)
+            )
+            timings.append(timing)
+        _, timing = timed("cleanup", rows, lambda: cleanup(cnx, None))
+        timings.append(timing)
+
+    return BenchmarkResult(
+        started_at=started_at,
+        commit=git_commit(),
+        file=file_path,
+        file_bytes=os.path.getsize(file_path),
+        rows=rows,
+        options={
+            "typed_staging": typed_staging,
+            "batch_size": batch_size,
+            "batch_workers": batch_workers,
+            "merge": merge,
+            "mutable_hash": mutable_hash,
+        },
+        stages=timings,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline.")
+    parser.add_argument("--file", required=True, help="BBR json or zip file.")
+    parser.add_argument(
+        "--results",
+        default="benchmarks/results.jsonl",
+        help="File the results are appended to.",
+    )
+    parser.add_argument("--typed-staging", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--batch-workers", type=int, default=1)
+    parser.add_argument("--merge", action="store_true")
+    parser.add_argument("--mutable-hash", choices=["md5", "blake2b"], default="md5")
+    args = parser.parse_args()
+    result = run_benchmark(
+        args.file,
+        args.typed_staging,
+        args.batch_size,
+        args.batch_workers,
+        args.merge,
+        args.mutable_hash,
+    )
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as file:
+        file.write(result.model_dump_json() + "\n")
+    print(f"Results appended to {args.results}.")
@@ -0,0 +1,39 @@
+# Validity periods of the bitemporal tables as ranges.
+# virkning_fra/virkning_til and registrering_fra/registrering_til are exposed
+# as the generated tstzrange columns virkning and registrering, where an open
+# end (NULL) is an unbounded range. "What did the registry say at time R
+# about time V" then becomes virkning @> V AND registrering @> R, which a GiST
+# index over both ranges answers without scanning the history (see the
+# periods index in indexes.py).
+
+from src.type_models import DbSchema
+
+# Range column: (from column, to column).
+PERIODS = {
+    "virkning": ("virkning_fra", "virkning_til"),
+    "registrering": ("registrering_fra", "registrering_til"),
+}
+
+
+# The periods of a table whose from and to columns are both TIMESTAMPTZ, as
+# only those can be turned into a tstzrange by an immutable expression.
+def period_columns(table_schema: DbSchema) -> dict[str, tuple[str, str]]:
+    types = {c.db_column_name: c.db_type for c in table_schema.columns.values()}
+    return {
+        period: bounds
+        for period, bounds in PERIODS.items()
+        if all(types.get(c) == "TIMESTAMPTZ" for c in bounds)
+    }
+
+
+def add_period_query(table: str, period: str) -> str:
+    fra, til = PERIODS[period]
+    return f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {period} TSTZRANGE GENERATED ALWAYS AS (tstzrange({fra}, {til}, '[)')) STORED"
+
+
+# The period that is generated from a column, if any.
+def column_period(column: str) -> str | None:
+    for period, bounds in PERIODS.items():
+        if column in bounds:
+            return period
+    return None
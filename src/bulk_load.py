@@ -0,0 +1,45 @@
+# Bulk-load mode (--bulk-load), for large loads such as the first load of a
+# full dump:
+# - The staging tables are UNLOGGED (see database_setup). cleanup throws the
+#   staged rows away anyway, so writing them to the WAL is wasted work. An
+#   unlogged table is emptied after a crash. The run ledger then still
+#   records the upload as done, so data_main counts the rows of unlogged
+#   staging tables before it resumes, and stages the file again if rows are
+#   missing (see data_load.lost_staging_tables).
+# - The load sessions commit without waiting for the WAL flush, and get more
+#   memory for index builds and vacuum. A crash can only lose the last
+#   commits, which a rerun redoes.
+# - The secondary indexes of an empty api_exposed table are dropped before
+#   the upsert (see indexes.drop_deferred_indexes) and built after it,
+#   instead of being maintained row by row.
+# - Tables whose rows were updated are vacuumed after the upsert.
+# Touched tables are analyzed after every load, so the planner has fresh
+# statistics right away instead of waiting for autovacuum.
+
+from psycopg import Connection, connect
+from typing import Any
+
+from src.env import BULK_MAINTENANCE_WORK_MEM, POSTGRES_CONNECTION_STRING
+
+BULK_SESSION_SETTINGS = {
+    "synchronous_commit": "off",
+    "maintenance_work_mem": BULK_MAINTENANCE_WORK_MEM,
+}
+
+
+# Applies the bulk-load settings to the session of cnx, for the rest of the
+# session.
+def tune_session(cnx: Connection[tuple[Any, ...]]) -> None:
+    with cnx.cursor() as cur:
+        for name, value in BULK_SESSION_SETTINGS.items():
+            cur.execute("SELECT set_config(%s, %s, false)", (name, value))
+
+
+# Analyzes a table whose rows have been committed. VACUUM can't run inside a
+# transaction, so it runs on a connection of its own in autocommit mode.
+def analyze_table(table: str, vacuum: bool = False, bulk_load: bool = False) -> None:
+    with connect(POSTGRES_CONNECTION_STRING, autocommit=True) as cnx:
+        if bulk_load:
+            tune_session(cnx)
+        cnx.execute(f"VACUUM (ANALYZE) {table}" if vacuum else f"ANALYZE {table}")
+    print(f"{table} {'vacuumed and analyzed' if vacuum else 'analyzed'}.")
@@ -0,0 +1,125 @@
+# Current-state tables.
+# Next to every bitemporal api_exposed table with virkning_til and
+# registrering_til, api_exposed.<table>_current holds only the rows that are
+# current, i.e. in use (virkning_til IS NULL) and valid (registrering_til IS
+# NULL). That is the state most queries ask for, and a small fraction of the
+# history.
+# The table is filled in full when it is created or when the schema of its
+# table has changed. Otherwise only the rows the upsert inserted or changed
+# in this run, found by their updated_at, are replaced.
+
+from datetime import datetime
+from psycopg import Connection
+from typing import Any
+
+from src.api_cache import bump_data_version
+from src.type_models import DbSchema
+
+CURRENT_COLUMNS = ["virkning_til", "registrering_til"]
+CURRENT_FILTER = " AND ".join(f"{c} IS NULL" for c in CURRENT_COLUMNS)
+
+
+def has_current_state(table_schema: DbSchema) -> bool:
+    names = {c.db_column_name for c in table_schema.columns.values()}
+    return set(CURRENT_COLUMNS) <= names
+
+
+def current_table(table: str) -> str:
+    return f"{table}_current"
+
+
+def current_columns(table_schema: DbSchema) -> str:
+    columns = [c.db_column_name for c in table_schema.columns.values()]
+    return ", ".join(["id", *columns, "created_at", "updated_at", "mutable"])
+
+
+# Creates the current-state tables that are missing, and recreates those
+# whose table has a new schema, after database_setup and widen_columns have
+# brought the api_exposed tables up to date.
+def current_state_setup(
+    registered_schema: dict[str, DbSchema],
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+) -> None:
+    with cnx.cursor() as cur:
+        for t in saved_schema:
+            if not has_current_state(saved_schema[t]):
+                continue
+            table = saved_schema[t].db_table_name
+            current = current_table(table)
+            cur.execute("SELECT to_regclass(%s)", (f"api_exposed.{current}",))
+            if cur.fetchone()[0] is not None and saved_schema[
+                t
+            ] == registered_schema.get(t):
+                continue
+            columns = current_columns(saved_schema[t])
+            cur.execute(f"DROP TABLE IF EXISTS api_exposed.{current}")
+            cur.execute(
+                f"CREATE TABLE api_exposed.{current} (LIKE api_exposed.{table} INCLUDING DEFAULTS INCLUDING GENERATED, PRIMARY KEY (id))"
+            )
+            cur.execute(
+                f"CREATE INDEX {current}_id_lokal_id_idx ON api_exposed.{current} (id_lokal_id, virkning_fra DESC, registrering_fra DESC)"
+            )
+            cur.execute(
+                f"""
+                INSERT INTO api_exposed.{current} ({columns})
+                SELECT {columns}
+                FROM api_exposed.{table}
+                WHERE {CURRENT_FILTER}
+            """
+            )
+            print(f"{current} created with {cur.rowcount} rows.")
+    cnx.commit()
+
+
+# Table stage (see scheduler.py) replacing the rows that were inserted or
+# changed since the run started. A changed row may no longer be current, so
+# every changed row is deleted and only the current ones are inserted again.
+# The table is analyzed when rows changed.
+# The data version is bumped here rather than by the upsert, in the same
+# transaction as the refresh, so the API can't cache a response read from the
+# stale current-state table under the new version.
+def refresh_current_state(
+    t: str,
+    table_schema: DbSchema,
+    cnx: Connection[tuple[Any, ...]],
+    since: datetime,
+) -> None:
+    if not has_current_state(table_schema):
+        return
+    table = table_schema.db_table_name
+    current = current_table(table)
+    columns = current_columns(table_schema)
+    with cnx.cursor() as cur:
+        cur.execute(
+            f"""
+            DELETE FROM api_exposed.{current}
+            WHERE id IN (SELECT id FROM api_exposed.{table} WHERE updated_at >= %s)
+        """,
+            (since,),
+        )
+        deleted = cur.rowcount
+        cur.execute(
+            f"""
+            INSERT INTO api_exposed.{current} ({columns})
+            SELECT {columns}
+            FROM api_exposed.{table}
+            WHERE updated_at >= %s AND {CURRENT_FILTER}
+        """,
+            (since,),
+        )
+        added = cur.rowcount
+        if deleted + added > 0:
+            # ANALYZE sees the changes of its own transaction.
+            cur.execute(f"ANALYZE api_exposed.{current}")
+            changed = True
+        else:
+            # Changed rows that were not current before nor are now.
+            cur.execute(
+                f"SELECT EXISTS (SELECT 1 FROM api_exposed.{table} WHERE updated_at >= %s)",
+                (since,),
+            )
+            changed = cur.fetchone()[0]
+        print(f"{current} refreshed ({deleted} rows removed, {added} rows added).")
+    if changed:
+        bump_data_version(cnx)
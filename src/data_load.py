@@ -4,15 +4,37 @@
 # "ON CONFLICT DO UPDATE" and hashsums. This is the fastest way to identify
 # new data and update existing rows that have changed.
 
-import hashlib
-import ijson
 import os
+import time
 
-from psycopg import Connection, connect
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import groupby
+from operator import itemgetter
+from psycopg import Connection, Cursor, connect
 from typing import Any
 
-from src.type_models import DbSchema
+from src.api_cache import bump_data_version
+from src.bulk_load import analyze_table, tune_session
+from src.current_state import has_current_state
 from src.env import POSTGRES_CONNECTION_STRING
+from src.type_models import DbSchema, TableDigest, UpsertCounts
+from src.ressources import iter_records, open_data_file
+from src.row_hashes import (
+    id_positions,
+    row_digest,
+    row_id,
+    row_mutable,
+    sql_row_digest,
+    staged_texts,
+)
+from src.verification import verify_table
+from src.typed_staging import (
+    STAGING_SLOTS,
+    copy_type,
+    is_geometry_type,
+    row_converter,
+    staging_schema,
+)
 
 # Terminal font colors
 RED = "\033[31m"  # Red text
@@ -20,192 +42,430 @@ GREEN = "\033[32m"  # Green text
 RESET = "\033[0m"  # Reset to default color
 
 
-# For each data object found in the json file, upload data entries in the
-# object to the corresponding table in the postgres database.
+# All data objects found in the json file are uploaded in a single pass over
+# the file. Rows are routed to the corresponding table in the upload schema as
+# they are parsed, and since the rows of a data object are contiguous in the
+# file, one COPY is opened per data object and closed when the next begins.
 # We are using psycopg's copy method for fastest bulk load from file to db.
 # Setting search path to the upload schema to ensure data is uploaded to
 # the correct schema
+# The id and mutable hash of every row are computed here and staged with the
+# row, so postgres only has to compare them in the upsert.
+# With typed staging the rows are converted to their inferred types, and
+# written to the upload_typed schema with a binary COPY.
+# While streaming, the digest of every staged row is summed per table, so the
+# file side of the upload check needs no second pass over the file.
+# slot selects the staging schema (see typed_staging.staging_schema).
+# With bulk_load the session is tuned for the load (see bulk_load.py).
 def upload_data(
-    saved_schema: dict[str, DbSchema], cnx: Connection[tuple[Any, ...]], file_path: str
-) -> None:
-    file = open(file_path, "rb")
-    with cnx.cursor() as cur:
-        cur.execute("SET search_path TO upload, public")
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+    file_path: str,
+    typed_staging: bool = False,
+    mutable_hash: str = "md5",
+    slot: int = 0,
+    bulk_load: bool = False,
+) -> dict[str, TableDigest]:
+    file_digests: dict[str, TableDigest] = {}
+    staging = staging_schema(typed_staging, slot)
+    if bulk_load:
+        tune_session(cnx)
+    with open_data_file(file_path) as file, cnx.cursor() as cur:
+        cur.execute(f"SET search_path TO {staging}, public")
         for t in saved_schema:
-            file.seek(0)
             if saved_schema[t].columns != {}:
-                columns = saved_schema[t].columns
-                cur.execute(f"TRUNCATE TABLE upload.{saved_schema[t].db_table_name}")
-                with cur.copy(
-                    f"COPY upload.{saved_schema[t].db_table_name} ({', '.join([columns[c].db_column_name for c in columns])}) FROM STDIN"
-                ) as copy:
-                    for rec in ijson.items(file, f"{t}.item"):
-                        copy.write_row([rec[c] for c in columns])
+                cur.execute(f"TRUNCATE TABLE {staging}.{saved_schema[t].db_table_name}")
+                file_digests[t] = TableDigest()
+        for t, records in groupby(iter_records(file), key=itemgetter(0)):
+            if t not in saved_schema or saved_schema[t].columns == {}:
+                continue
+            columns = saved_schema[t].columns
+            column_names = [columns[c].db_column_name for c in columns]
+            digest = file_digests[t]
+            positions = id_positions(saved_schema[t])
+            copy_sql = f"COPY {staging}.{saved_schema[t].db_table_name} (id, {', '.join(column_names)}, mutable) FROM STDIN"
+            if typed_staging:
+                copy_sql += " (FORMAT BINARY)"
+                convert = row_converter(saved_schema[t], cnx.info.timezone)
+            with cur.copy(copy_sql) as copy:
+                if typed_staging:
+                    copy.set_types(
+                        ["uuid"]
+                        + [copy_type(columns[c].db_type) for c in columns]
+                        + ["uuid"]
+                    )
+                for _, rec in records:
+                    texts = staged_texts(rec, saved_schema[t])
+                    id = row_id(texts, positions)
+                    mutable = row_mutable(texts, mutable_hash)
+                    if typed_staging:
+                        copy.write_row([id] + convert(texts) + [mutable])
+                        digest.checksum += row_digest(
+                            [None if id is None else str(id), str(mutable)]
+                        )
+                    else:
+                        copy.write_row([id] + texts + [mutable])
+                        digest.checksum += row_digest(texts)
+                    digest.rows += 1
         cnx.commit()
+    return file_digests
+
+
+# Tables whose staged rows are no longer all there. Unlogged staging tables
+# (see bulk_load.py) are emptied when the server crashes, so the rows a run
+# ledger records as staged may be gone. Logged staging tables are not
+# counted.
+def lost_staging_tables(
+    saved_schema: dict[str, DbSchema],
+    file_digests: dict[str, TableDigest],
+    cnx: Connection[tuple[Any, ...]],
+    typed_staging: bool = False,
+) -> list[str]:
+    lost = []
+    with cnx.cursor() as cur:
+        for t, digest in file_digests.items():
+            table = f"{staging_schema(typed_staging)}.{saved_schema[t].db_table_name}"
+            cur.execute(
+                "SELECT relpersistence = 'u' FROM pg_class WHERE oid = %s::REGCLASS",
+                (table,),
+            )
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            if cur.fetchone()[0] != digest.rows:
+                lost.append(t)
+    cnx.commit()
+    return lost
+
+
+class DataMismatchError(Exception):
+    pass
 
 
 # Every table in the api_exposed schema is updated by dynamically creating
 # an query that selects data from the corresponding table in the upload
 # schema and upserting the result se into the api_exposed table.
-def upsert_data(
-    saved_schema: dict[str, DbSchema], cnx: Connection[tuple[Any, ...]]
-) -> None:
-    id = "MD5(id_lokal_id || virkning_fra || registrering_fra)::UUID"
-    for t in saved_schema:
-        if saved_schema[t].columns != {}:
-            table = saved_schema[t].db_table_name
-            columns = [
-                saved_schema[t].columns[c].db_column_name
-                for c in saved_schema[t].columns
-            ]
-            column_types = [
-                saved_schema[t].columns[c].db_type for c in saved_schema[t].columns
-            ]
-            # mutable is used to identify if a row has changed
-            mutable = "||".join("COALESCE(" + c + ", '')" for c in columns)
-            mutable = f"MD5({mutable})::UUID"
-            select_columns = ", ".join(
-                "NULLIF(" + c + ", '')::" + tp for c, tp in zip(columns, column_types)
+# Typed staging tables already hold typed values, so their rows are inserted
+# as they are.
+# The query upserts a window of staged rows by seq_id, given as the query
+# parameters. With merge=True postgres' MERGE is used instead of
+# INSERT ... ON CONFLICT.
+def upsert_query(
+    table_schema: DbSchema,
+    typed_staging: bool = False,
+    merge: bool = False,
+    slot: int = 0,
+) -> str:
+    table = table_schema.db_table_name
+    columns = [table_schema.columns[c].db_column_name for c in table_schema.columns]
+    column_types = [table_schema.columns[c].db_type for c in table_schema.columns]
+    # id and mutable (used to identify if a row has changed) are computed by
+    # upload_data and staged with the rows.
+    id = "id"
+    mutable = "mutable"
+    staging_table = f"{staging_schema(typed_staging, slot)}.{table}"
+    if typed_staging:
+        select_columns = ", ".join(
+            f"ST_GeomFromEWKB({c}) AS {c}" if is_geometry_type(tp) else c
+            for c, tp in zip(columns, column_types)
+        )
+    else:
+        select_columns = ", ".join(
+            "NULLIF(" + c + ", '')::" + tp + " AS " + c
+            for c, tp in zip(columns, column_types)
+        )
+    if merge:
+        return f"""
+            MERGE INTO api_exposed.{table} AS target
+            USING (
+                SELECT {id} AS id, {select_columns}, {mutable} AS mutable
+                FROM {staging_table}
+                WHERE seq_id >= %s AND seq_id < %s
+            ) AS source
+            ON target.id = source.id
+            WHEN MATCHED AND target.mutable <> source.mutable THEN
+                UPDATE SET
+                    {', '.join([c + ' = source.' + c for c in columns])},
+                    mutable = source.mutable,
+                    updated_at = NOW()
+            WHEN NOT MATCHED THEN
+                INSERT (id, {', '.join(columns)}, mutable)
+                VALUES (source.id, {', '.join(['source.' + c for c in columns])}, source.mutable);
+        """
+    # xmax is 0 for a row version created by an insert, and set for one
+    # created by the update of a conflicting row.
+    return f"""
+        WITH upserted AS (
+            INSERT INTO api_exposed.{table}
+            (id, {', '.join(columns)}, mutable)
+            SELECT {id}, {select_columns}, {mutable}
+            FROM {staging_table}
+            WHERE seq_id >= %s AND seq_id < %s
+            ON CONFLICT (id)
+            DO
+                UPDATE SET
+                    {', '.join([c + ' = EXCLUDED.' + c for c in columns])},
+                    mutable = EXCLUDED.mutable,
+                    updated_at = NOW()
+                WHERE
+                    api_exposed.{table}.mutable <> EXCLUDED.mutable
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE inserted),
+            COUNT(*) FILTER (WHERE NOT inserted)
+        FROM upserted;
+    """
+
+
+# MERGE can't return the rows it touched before postgres 17, so the staged
+# rows of a window that are new to the api_exposed table are counted before
+# it runs. Every other row MERGE touches is an update.
+def merge_inserts_query(
+    table_schema: DbSchema, typed_staging: bool = False, slot: int = 0
+) -> str:
+    table = table_schema.db_table_name
+    return f"""
+        SELECT COUNT(*)
+        FROM {staging_schema(typed_staging, slot)}.{table} AS source
+        WHERE seq_id >= %s AND seq_id < %s
+            AND NOT EXISTS (
+                SELECT 1 FROM api_exposed.{table} AS target WHERE target.id = source.id
             )
-            query = f"""
-                INSERT INTO api_exposed.{table}
-                (id, {', '.join(columns)}, mutable)
-                SELECT {id}, {select_columns}, {mutable}
-                FROM upload.{table}
-                ON CONFLICT (id)
-                DO
-                    UPDATE SET
-                        {', '.join([c + ' = EXCLUDED.' + c for c in columns])},
-                        mutable = EXCLUDED.mutable,
-                        updated_at = NOW()
-                    WHERE
-                        api_exposed.{table}.mutable <> EXCLUDED.mutable;
-            """
+    """
+
+
+# Runs the upsert of a window and returns the number of inserted and updated
+# rows.
+def run_upsert(
+    cur: Cursor[tuple[Any, ...]],
+    query: str,
+    window: tuple[int, int],
+    inserts_query: str | None = None,
+) -> tuple[int, int]:
+    if inserts_query is None:
+        cur.execute(query, window)
+        return cur.fetchone()
+    cur.execute(inserts_query, window)
+    inserted = cur.fetchone()[0]
+    cur.execute(query, window)
+    return inserted, cur.rowcount - inserted
+
+
+def upsert_batch(
+    query: str,
+    window: tuple[int, int],
+    inserts_query: str | None = None,
+    bulk_load: bool = False,
+) -> tuple[int, int]:
+    with connect(POSTGRES_CONNECTION_STRING) as cnx:
+        if bulk_load:
+            tune_session(cnx)
+        with cnx.cursor() as cur:
+            return run_upsert(cur, query, window, inserts_query)
+
+
+# The seq_id windows [low, high) of batch_size rows covering the staged
+# seq_ids first to last. The last window holds the remaining rows, and
+# batch_size=0 gives a single window.
+def upsert_windows(first: int, last: int, batch_size: int) -> list[tuple[int, int]]:
+    batch_size = batch_size or last - first + 1
+    return [
+        (low, min(low + batch_size, last + 1))
+        for low in range(first, last + 1, batch_size)
+    ]
+
+
+# The staged rows are upserted in batches of batch_size rows by seq_id, and
+# every batch is committed on its own. This keeps transactions, WAL bursts and
+# lock times short, and lets vacuum and replicas keep up during a long load.
+# With batch_workers > 1 the batches run in parallel on their own connections.
+# batch_size=0 upserts the whole table in one statement.
+# A table the upsert changed is analyzed afterwards, and with bulk_load also
+# vacuumed if rows were updated (see bulk_load.py).
+def upsert_table(
+    t: str,
+    table_schema: DbSchema,
+    cnx: Connection[tuple[Any, ...]],
+    typed_staging: bool = False,
+    batch_size: int = 50000,
+    batch_workers: int = 1,
+    merge: bool = False,
+    slot: int = 0,
+    bulk_load: bool = False,
+) -> UpsertCounts:
+    table = table_schema.db_table_name
+    if bulk_load:
+        tune_session(cnx)
+    staging_table = f"{staging_schema(typed_staging, slot)}.{table}"
+    query = upsert_query(table_schema, typed_staging, merge, slot)
+    inserts_query = (
+        merge_inserts_query(table_schema, typed_staging, slot) if merge else None
+    )
+    with cnx.cursor() as cur:
+        cur.execute(f"SELECT MIN(seq_id), MAX(seq_id), COUNT(*) FROM {staging_table}")
+        first, last, staged = cur.fetchone()
+    if first is None:
+        print(f"{table} upserted (no staged rows).")
+        return UpsertCounts()
+    windows = upsert_windows(first, last, batch_size)
+    total = last - first + 1
+    processed = 0
+    inserted = 0
+    updated = 0
+    start = time.perf_counter()
+
+    def report(window: tuple[int, int], counts: tuple[int, int]) -> None:
+        nonlocal processed, inserted, updated
+        processed += window[1] - window[0]
+        inserted += counts[0]
+        updated += counts[1]
+        rate = processed / max(time.perf_counter() - start, 1e-9)
+        print(
+            f"{table}: {processed}/{total} staged rows, {inserted} inserted, {updated} updated ({rate:,.0f} rows/s)"
+        )
+
+    if batch_workers > 1:
+        with ThreadPoolExecutor(max_workers=batch_workers) as executor:
+            futures = {
+                executor.submit(
+                    upsert_batch, query, window, inserts_query, bulk_load
+                ): window
+                for window in windows
+            }
+            for future in as_completed(futures):
+                report(futures[future], future.result())
+    else:
+        for window in windows:
             with cnx.cursor() as cur:
-                cur.execute(query)
-    cnx.commit()
+                counts = run_upsert(cur, query, window, inserts_query)
+            cnx.commit()
+            report(window, counts)
+    if inserted + updated > 0:
+        # The data version of a table with a current-state table is bumped
+        # once that is refreshed (see current_state.refresh_current_state).
+        if not has_current_state(table_schema):
+            bump_data_version(cnx)
+        analyze_table(
+            f"api_exposed.{table}",
+            vacuum=bulk_load and updated > 0,
+            bulk_load=bulk_load,
+        )
+    print(f"{table} upserted.")
+    return UpsertCounts(
+        staged=staged,
+        inserted=inserted,
+        updated=updated,
+        unchanged=staged - inserted - updated,
+    )
 
 
 # After upload we check if data matches between the file and the upload schema
-# for each table in the upload schema, by calculating the hashsum of the entire
-# uploaded data.
-def check_upload_and_file_data_match(
-    file_path: str, saved_schema: dict[str, DbSchema]
+# for a table in the upload schema. The row count and checksum of the file are
+# computed by upload_data, and the same checksum is computed over the staged
+# table inside postgres, so the data never leaves the database.
+# Typed staging tables no longer hold the texts of the file, so for them the
+# id and mutable hash of every row, both computed from those texts, are
+# compared instead.
+def check_upload_and_file_table_match(
+    t: str,
+    table_schema: DbSchema,
+    cnx: Connection[tuple[Any, ...]],
+    file_digests: dict[str, TableDigest],
+    typed_staging: bool = False,
+    slot: int = 0,
 ) -> None:
-    for t in saved_schema:
-        if saved_schema[t].columns != {}:
-            columns = saved_schema[t].columns
-            file = open(file_path, "rb")
-            md5_hash = hashlib.md5()
-            for rec in ijson.items(file, f"{t}.item"):
-                md5_hash.update(
-                    str(
-                        tuple(
-                            [rec[c] if rec[c] is None else str(rec[c]) for c in columns]
-                        )
-                    ).encode("utf-8")
-                )
-            query = f"""--sql
-                SELECT {', '.join([columns[c].db_column_name for c in columns])}
-                from upload.{saved_schema[t].db_table_name}
-                ORDER BY seq_id
-            """
-            db_md5_hash = hashlib.md5()
-            with connect(POSTGRES_CONNECTION_STRING) as stream_cnx:
-                with stream_cnx.cursor(name="stream_cursor") as stream_cur:
-                    stream_cur.execute(query)
-
-                    for row in stream_cur:
-                        db_md5_hash.update(str(row).encode("utf-8"))
-            if md5_hash.hexdigest() == db_md5_hash.hexdigest():
-                print(f"{t} match between file and upload table {GREEN}OK{RESET}!")
-            else:
-                print(f"{t} mismatch between file and upload table {RED}ERROR{RESET}!")
-                exit()
+    columns = table_schema.columns
+    staging_table = (
+        f"{staging_schema(typed_staging, slot)}.{table_schema.db_table_name}"
+    )
+    if typed_staging:
+        digest = sql_row_digest(["id::TEXT", "mutable::TEXT"])
+    else:
+        digest = sql_row_digest([columns[c].db_column_name for c in columns])
+    with cnx.cursor() as cur:
+        cur.execute(
+            f"""--sql
+            SELECT COUNT(*), COALESCE(SUM({digest}), 0)
+            FROM {staging_table}
+        """
+        )
+        rows, checksum = cur.fetchone()
+    file_digest = file_digests[t]
+    if rows == file_digest.rows and checksum == file_digest.checksum:
+        print(f"{t} match between file and upload table {GREEN}OK{RESET}!")
+    else:
+        print(f"{t} mismatch between file and upload table {RED}ERROR{RESET}!")
+        raise DataMismatchError(
+            f"{t} mismatch between file and upload table ({file_digest.rows} rows in file, {rows} rows in upload table)"
+        )
 
 
 # After upsert we check if data matches between the upload schema and the
-# api_exposed schema, by calculating the hashsum of the entire upserted data.
-def check_upload_and_api_exposed_data_match(
-    saved_schema: dict[str, DbSchema], cnx: Connection[tuple[Any, ...]]
+# api_exposed schema. Every staged row is compared with the api_exposed row of
+# the same id through digests of id_lokal_id ranges (see verification.py),
+# which also point out the ranges and rows that differ.
+def check_upload_and_api_exposed_table_match(
+    t: str,
+    table_schema: DbSchema,
+    cnx: Connection[tuple[Any, ...]],
+    typed_staging: bool = False,
+    workers: int = 2,
+    slot: int = 0,
 ) -> None:
-    for t in saved_schema:
-        if saved_schema[t].columns != {}:
-            columns = saved_schema[t].columns
-            with cnx.cursor() as cur:
-                hash_columns_str = ", ".join(
-                    [
-                        "COALESCE(" + columns[c].db_column_name + "::text, '')"
-                        for c in columns
-                    ]
-                )
-                cur.execute(
-                    f"""
-                    SELECT MD5(STRING_AGG(ROW_TO_JSON(t)::TEXT, '')) AS checksum
-                    from (
-                        select 
-                            {hash_columns_str}
-                        from api_exposed.{saved_schema[t].db_table_name} b
-                        where b.updated_at = (select max(updated_at) from api_exposed.{saved_schema[t].db_table_name})
-                        order by 
-                            b.id_lokal_id, 
-                            b.virkning_fra, 
-                            b.registrering_fra
-                    ) t;
-                """
-                )
-                api_table_md5_hash = cur.fetchone()[0]
-                hash_columns_str = ", ".join(
-                    [
-                        "COALESCE("
-                        + columns[c].db_column_name
-                        + "::"
-                        + columns[c].db_type
-                        + "::TEXT, '')"
-                        for c in columns
-                    ]
-                )
-                cur.execute(
-                    f"""
-                    SELECT MD5(STRING_AGG(ROW_TO_JSON(t)::TEXT, '')) AS checksum
-                    from (
-                        select 
-                            {hash_columns_str}
-                        from upload.{saved_schema[t].db_table_name} b 
-                        order by 
-                            b.id_lokal_id::UUID, 
-                            b.virkning_fra::TIMESTAMPTZ, 
-                            b.registrering_fra::TIMESTAMPTZ
-                    ) t;
-                """
-                )
-                upload_table_md5_hash = cur.fetchone()[0]
-            if api_table_md5_hash == upload_table_md5_hash:
-                print(
-                    f"{saved_schema[t].db_table_name} match between upload and api_exposed table {GREEN}OK{RESET}!"
-                )
-            else:
-                print(
-                    f"{saved_schema[t].db_table_name} mismatch between upload and api_exposed table {RED}ERROR{RESET}!"
-                )
-                exit()
+    mismatches = verify_table(
+        table_schema, staging_schema(typed_staging, slot), workers
+    )
+    if not mismatches:
+        print(
+            f"{table_schema.db_table_name} match between upload and api_exposed table {GREEN}OK{RESET}!"
+        )
+        return
+    print(
+        f"{table_schema.db_table_name} mismatch between upload and api_exposed table {RED}ERROR{RESET}!"
+    )
+    for mismatch in mismatches:
+        print(
+            f"  id_lokal_id {mismatch.id_lokal_id_from} to {mismatch.id_lokal_id_to}: "
+            f"{mismatch.upload_rows} upload rows, {mismatch.api_exposed_rows} api_exposed rows"
+        )
+        for row in mismatch.rows:
+            print(f"    {row}")
+    raise DataMismatchError(
+        f"{table_schema.db_table_name} mismatch between upload and api_exposed table in {len(mismatches)} id_lokal_id ranges"
+    )
 
 
 # We do a cleanup, where each table in the upload schema is truncated.
 # Since this is only a data staging schema, we erase the data to keep a lean db.
-# Also the json file is deleted to save storage.
-def cleanup(cnx: Connection[tuple[Any, ...]], file_path: str) -> None:
+# Also the extracted json file is deleted to save storage, if it exists. When
+# the data was streamed directly from the zip archive there is no file to
+# delete.
+# slots limits the cleanup to the staging schemas of the given slots, by
+# default those of every slot are truncated.
+def cleanup(
+    cnx: Connection[tuple[Any, ...]],
+    file_path: str | None,
+    slots: list[int] | None = None,
+) -> None:
+    schemas = [
+        staging_schema(typed_staging, slot)
+        for typed_staging in (False, True)
+        for slot in (range(STAGING_SLOTS) if slots is None else slots)
+    ]
     with cnx.cursor() as cur:
         cur.execute(
             """
-            SELECT table_name
+            SELECT table_schema, table_name
             FROM information_schema.tables
-            WHERE table_schema = 'upload'
+            WHERE table_schema = ANY(%s)
             AND table_type = 'BASE TABLE';
-        """
+        """,
+            (schemas,),
         )
         tables = cur.fetchall()
         for table in tables:
-            cur.execute(f"TRUNCATE TABLE upload.{table[0]} RESTART IDENTITY")
-        os.remove(file_path)
+            cur.execute(f"TRUNCATE TABLE {table[0]}.{table[1]} RESTART IDENTITY")
+        if file_path is not None and os.path.exists(file_path):
+            os.remove(file_path)
     cnx.commit()
@@ -2,48 +2,323 @@
 # 1. schema mapping of json file
 # 2. Schema from 1 is used to create tables in the database
 # 3. Data is loaded into new tables
-# 4. Data is checked.
+# 4. Per table, on a pool of workers: staging data is checked against the
+#    file, upserted, checked against the api_exposed table, and the secondary
+#    indexes of the api_exposed table are built concurrently.
+#    The current-state table is refreshed from the rows the upsert changed.
 # 5. Delete staging data and files.
+#
+# The schema is mapped on top of the latest schema in the schema registry, so
+# only keys that are new since the last run are inferred. With --reinfer every
+# key is inferred again and registered types are widened where needed.
+#
+# With --typed-staging values are converted on the client side and staged
+# with binary COPY in typed tables, so the upsert needs no casts.
+#
+# Every stage, and every stage of every table, is timed and written to a json
+# run report (--report), and optionally in the Prometheus text format.
+#
+# Completed stages are recorded in a run ledger (see run_ledger.py). A rerun
+# of the same file resumes at the first stage that did not complete, per
+# table, unless --restart is given.
+#
+# With --bulk-load the data is staged in UNLOGGED tables, the load sessions
+# are tuned, and the indexes of empty tables are built after the upsert (see
+# bulk_load.py).
+#
+# With --engine spark the schema is mapped and the data uploaded with Spark
+# (see spark_load.py), for files too large for a single ijson stream.
+#
+# With --no-extract the json file is read directly from the zip archive
+# through a decompressing stream, and nothing is written to disk.
+#
+# This loads a single file. delta_ingest.py loads every delta file of a
+# directory in order.
 
+import argparse
+
+from datetime import datetime
 from psycopg import connect
 
+from src.current_state import current_state_setup
 from src.env import POSTGRES_CONNECTION_STRING
-from src.database_creation import map_schema, database_setup
-from src.data_load import (
-    upload_data,
-    upsert_data,
-    check_upload_and_file_data_match,
-    check_upload_and_api_exposed_data_match,
-    cleanup,
-)
+from src.database_creation import map_schema, database_setup, widen_columns
+from src.data_load import RED, RESET, cleanup, lost_staging_tables, upload_data
+from src.indexes import report_indexes
 from src.ressources import unzip_data_file
+from src.run_ledger import RunLedger, run_ledger_setup, source_id
+from src.run_report import RunRecorder, data_bytes, write_report
+from src.scheduler import run_table_stages, table_stages
+from src.type_models import DbSchema, TableDigest
+from src.schema_registry import (
+    evolve_schema,
+    load_schema_registry,
+    save_schema_registry,
+)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load BBR data into postgres.")
+    parser.add_argument(
+        "--no-extract",
+        action="store_true",
+        help="Stream the json file from the zip archive instead of extracting it.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of tables processed in parallel, each on its own connection.",
+    )
+    parser.add_argument(
+        "--reinfer",
+        action="store_true",
+        help="Infer the type of every column, not only of columns new since the last run.",
+    )
+    parser.add_argument(
+        "--typed-staging",
+        action="store_true",
+        help="Stage typed values with binary COPY instead of TEXT columns.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50000,
+        help="Staged rows upserted and committed per batch, 0 for one batch per table.",
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=1,
+        help="Number of upsert batches of a table run in parallel.",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Upsert with MERGE instead of INSERT ... ON CONFLICT.",
+    )
+    parser.add_argument(
+        "--mutable-hash",
+        choices=["md5", "blake2b"],
+        default="md5",
+        help="Hash used to detect changed rows. Switching it makes every row look changed once.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["ijson", "spark"],
+        default="ijson",
+        help="Engine mapping and uploading the file. spark reads the extracted json file in parallel.",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Stage in UNLOGGED tables, tune the load sessions and build the indexes of empty tables after the upsert.",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Forget the stages completed by earlier runs of the file and start over.",
+    )
+    parser.add_argument(
+        "--report",
+        default="src/output.json",
+        help="File the json run report is written to.",
+    )
+    parser.add_argument(
+        "--prometheus",
+        default=None,
+        help="Also write the run report in the Prometheus text format to this file.",
+    )
+    args = parser.parse_args()
+    if args.engine == "spark" and (args.no_extract or args.typed_staging):
+        raise SystemExit(
+            "The spark engine reads the extracted file and stages TEXT, so it can't be used with --no-extract or --typed-staging."
+        )
+
     cnx = connect(POSTGRES_CONNECTION_STRING)
     zip_path = "data/BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.zip"
-    file_path = "data/BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.json"
-    print("Unzipping data file...")
-    unzip_data_file(zip_path)
-    print("Data file unzipped.")
-    print("Mapping schema...")
-    saved_schema = map_schema(file_path)
-    print("Schema mapped.")
-    print("Setting up database...")
-    database_setup(saved_schema, cnx)
-    print("Database setup completed.")
-    print("Uploading data...")
-    upload_data(saved_schema, cnx, file_path)
-    print("Data uploaded.")
-    print("Upserting data...")
-    upsert_data(saved_schema, cnx)
-    print("Data upserted.")
-    print("Comparing hashsum of staging and file data...")
-    check_upload_and_file_data_match(file_path, saved_schema)
-    print("Data match between staging and file data checked.")
-    print("Comparing hashsum of staging and api_exposed data...")
-    check_upload_and_api_exposed_data_match(saved_schema, cnx)
-    print("Data match between staging and api_exposed data checked.")
+    run_ledger_setup(cnx)
+    ledger = RunLedger.load(source_id(zip_path), cnx)
+    if args.restart:
+        ledger.clear(cnx)
+    if ledger.done("run"):
+        print(
+            f"{ledger.source} has already been loaded, use --restart to load it again."
+        )
+        cnx.close()
+        raise SystemExit(0)
+    if ledger.done("upload"):
+        staged_typed = ledger.result("upload")["typed_staging"]
+        if staged_typed != args.typed_staging:
+            cnx.close()
+            raise SystemExit(
+                f"The data of {ledger.source} was staged with typed_staging={staged_typed}, rerun with the same setting or use --restart."
+            )
+        # Unlogged staging tables are emptied by a crash of the server. Then
+        # the file is staged again, and its tables go through every stage
+        # again.
+        lost = lost_staging_tables(
+            {
+                t: DbSchema.model_validate(schema)
+                for t, schema in ledger.result("database setup").items()
+            },
+            {
+                t: TableDigest.model_validate(digest)
+                for t, digest in ledger.result("upload")["digests"].items()
+            },
+            cnx,
+            args.typed_staging,
+        )
+        if lost:
+            print(f"Staged rows of {', '.join(lost)} are gone, staging the file again.")
+            ledger.forget(
+                cnx, [k for k in ledger.completed if k[0] == "upload" or k[1] != ""]
+            )
+    # The file is only read until the data has been staged.
+    extracted_path = "data/BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.json"
+    if not args.no_extract and not ledger.done("upload"):
+        file_path = extracted_path
+        print("Unzipping data file...")
+        unzip_data_file(zip_path)
+        print("Data file unzipped.")
+    else:
+        file_path = zip_path
+    recorder = RunRecorder(file_path)
+    spark = None
+    if args.engine == "spark":
+        # pyspark is only imported with the spark engine.
+        from src.spark_load import spark_session
+
+        spark = spark_session()
+    file_size = data_bytes(file_path)
+    if ledger.done("database setup"):
+        print("Database setup completed by an earlier run.")
+        saved_schema = {
+            t: DbSchema.model_validate(schema)
+            for t, schema in ledger.result("database setup").items()
+        }
+    else:
+        print("Mapping schema...")
+        with recorder.stage("map schema", bytes_read=file_size):
+            registered_schema = load_schema_registry(cnx)
+            known_schema = None if args.reinfer else registered_schema
+            if args.engine == "spark":
+                from src.spark_load import spark_map_schema
+
+                file_schema = spark_map_schema(spark, file_path, known_schema)
+            else:
+                file_schema = map_schema(file_path, known_schema)
+            saved_schema = evolve_schema(registered_schema, file_schema)
+        print("Schema mapped.")
+        print("Setting up database...")
+        with recorder.stage("database setup"):
+            widen_columns(registered_schema, saved_schema, cnx)
+            database_setup(
+                saved_schema, cnx, args.typed_staging, bulk_load=args.bulk_load
+            )
+            current_state_setup(registered_schema, saved_schema, cnx)
+            save_schema_registry(registered_schema, saved_schema, cnx)
+            ledger.record(
+                "database setup",
+                cnx,
+                result={t: saved_schema[t].model_dump() for t in saved_schema},
+            )
+            cnx.commit()
+        print("Database setup completed.")
+    if ledger.done("upload"):
+        print("Data uploaded by an earlier run.")
+        file_digests = {
+            t: TableDigest.model_validate(digest)
+            for t, digest in ledger.result("upload")["digests"].items()
+        }
+    else:
+        print("Uploading data...")
+        with recorder.stage("upload", bytes_read=file_size) as upload_timing:
+            if args.engine == "spark":
+                from src.spark_load import spark_upload_data
+
+                file_digests = spark_upload_data(
+                    spark, saved_schema, cnx, file_path, mutable_hash=args.mutable_hash
+                )
+            else:
+                file_digests = upload_data(
+                    saved_schema,
+                    cnx,
+                    file_path,
+                    args.typed_staging,
+                    args.mutable_hash,
+                    bulk_load=args.bulk_load,
+                )
+            upload_timing.rows = sum(d.rows for d in file_digests.values())
+            ledger.record(
+                "upload",
+                cnx,
+                result={
+                    "typed_staging": args.typed_staging,
+                    "digests": {t: d.model_dump() for t, d in file_digests.items()},
+                },
+            )
+            cnx.commit()
+        print("Data uploaded.")
+    if spark is not None:
+        spark.stop()
+    rows = sum(d.rows for d in file_digests.values())
+    # The rows of the file are only known after the upload. Other stages,
+    # e.g. the database setup, don't process rows.
+    for timing in recorder.report.stages:
+        if timing.stage not in ("map schema", "upload"):
+            continue
+        timing.rows = rows
+        timing.rows_per_second = rows / timing.seconds if timing.seconds else 0.0
+    recorder.file_digests(
+        file_digests, {t: saved_schema[t].db_table_name for t in file_digests}
+    )
+    print("Checking and upserting data...")
+    # Rows the upsert inserts or changes get an updated_at after this. A
+    # resumed run keeps the start of the run it resumes, as the upsert may
+    # have changed rows then.
+    if ledger.done("checks started"):
+        run_started = datetime.fromisoformat(ledger.result("checks started"))
+    else:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP")
+            run_started = cur.fetchone()[0]
+        ledger.record("checks started", cnx, result=run_started.isoformat())
+        cnx.commit()
+    with recorder.stage("check and upsert", rows=rows):
+        failures = run_table_stages(
+            saved_schema,
+            table_stages(
+                file_digests,
+                run_started,
+                args.typed_staging,
+                args.batch_size,
+                args.batch_workers,
+                args.merge,
+                bulk_load=args.bulk_load,
+            ),
+            args.workers,
+            recorder,
+            ledger,
+        )
+    if failures:
+        for failure in failures:
+            print(
+                f"{failure.table} failed at stage '{failure.stage}' {RED}ERROR{RESET}: {failure.error}"
+            )
+        write_report(recorder.finish(False), args.report, args.prometheus)
+        # Staging data is kept for inspection of the failed tables.
+        cnx.close()
+        raise SystemExit(1)
+    print("Data checked and upserted.")
+    recorder.report.indexes = report_indexes(saved_schema, cnx)
     print("Cleaning up...")
-    cleanup(cnx, file_path)
+    with recorder.stage("cleanup"):
+        ledger.record("run", cnx)
+        # A failed run may have extracted the file that this run resumes from
+        # the staged data, so the extracted file is deleted whichever run
+        # extracted it.
+        cleanup(cnx, extracted_path)
     print("Cleanup completed.")
+    write_report(recorder.finish(True), args.report, args.prometheus)
+    print(f"Run report written to {args.report}.")
     cnx.close()
@@ -2,35 +2,90 @@
 import ijson
 from psycopg import Connection
 from typing import Any
-from src.type_models import DbSchema
 
 # Modules import
-from src.ressources import sqlify_names, get_type, set_type
+from src.bitemporal import add_period_query, column_period, period_columns
+from src.ressources import sqlify_names, open_data_file
+from src.schema_registry import widen_type
+from src.type_inference import ColumnTypeInference
 from src.type_models import DbSchema, ColumnSchema
+from src.typed_staging import staging_schema, staging_type
 
 
 # Based on the schema mapped from the json file
 # this function creates all the tables in the database.
+# Staging tables are created in the staging schemas of the first `slots`
+# staging slots (see typed_staging.staging_schema). With bulk_load they are UNLOGGED,
+# and existing ones are switched to UNLOGGED (see bulk_load.py).
 def database_setup(
-    saved_schema: dict[str, DbSchema], cnx: Connection[tuple[Any, ...]]
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+    typed_staging: bool = False,
+    slots: int = 1,
+    bulk_load: bool = False,
 ) -> None:
+    unlogged = "UNLOGGED " if bulk_load else ""
     with cnx.cursor() as cur:
         cur.execute("CREATE EXTENSION IF NOT EXISTS postgis")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS upload")
         cur.execute("CREATE SCHEMA IF NOT EXISTS api_exposed")
-        cur.execute("SET search_path TO upload, public")
+        # Bumped by every upsert that changes api_exposed, so the API knows
+        # when its cached responses are stale.
+        cur.execute("CREATE SCHEMA IF NOT EXISTS metadata")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata.data_version (
+                singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+                version BIGINT NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """
+        )
 
-        for t in saved_schema:
-            if saved_schema[t].columns != {}:
-                upload_schema = f"CREATE TABLE IF NOT EXISTS upload.{saved_schema[t].db_table_name} ("
-                for c in saved_schema[t].columns:
-                    # Upload schema columns are all formatted as TEXT simply to make it
-                    # easier to check data match between file and upload schema.
-                    upload_schema += (
-                        f"{saved_schema[t].columns[c].db_column_name} TEXT, "
-                    )
-                upload_schema += "seq_id SERIAL);"
-                cur.execute(upload_schema)
+        for slot in range(slots):
+            upload = staging_schema(False, slot)
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {upload}")
+            cur.execute(f"SET search_path TO {upload}, public")
+            for t in saved_schema:
+                if saved_schema[t].columns != {}:
+                    upload_schema = f"CREATE {unlogged}TABLE IF NOT EXISTS {upload}.{saved_schema[t].db_table_name} (id UUID, "
+                    for c in saved_schema[t].columns:
+                        # Upload schema columns are all formatted as TEXT simply to make it
+                        # easier to check data match between file and upload schema.
+                        upload_schema += (
+                            f"{saved_schema[t].columns[c].db_column_name} TEXT, "
+                        )
+                    # The row id and the mutable hash are computed on the client
+                    # side while uploading.
+                    upload_schema += "mutable UUID, seq_id SERIAL);"
+                    cur.execute(upload_schema)
+                    if bulk_load:
+                        cur.execute(
+                            f"ALTER TABLE {upload}.{saved_schema[t].db_table_name} SET UNLOGGED"
+                        )
+                    # Columns that are new since the table was created.
+                    for c in saved_schema[t].columns:
+                        cur.execute(
+                            f"ALTER TABLE {upload}.{saved_schema[t].db_table_name} ADD COLUMN IF NOT EXISTS {saved_schema[t].columns[c].db_column_name} TEXT"
+                        )
+                    for column in ["id", "mutable"]:
+                        cur.execute(
+                            f"ALTER TABLE {upload}.{saved_schema[t].db_table_name} ADD COLUMN IF NOT EXISTS {column} UUID"
+                        )
+
+            # Typed staging tables only hold the rows of the current run, so they
+            # are recreated to follow the types of the saved schema.
+            if typed_staging:
+                upload_typed = staging_schema(True, slot)
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {upload_typed}")
+                for t in saved_schema:
+                    if saved_schema[t].columns != {}:
+                        table = f"{upload_typed}.{saved_schema[t].db_table_name}"
+                        typed_schema = f"CREATE {unlogged}TABLE {table} (id UUID, "
+                        for c in saved_schema[t].columns:
+                            typed_schema += f"{saved_schema[t].columns[c].db_column_name} {staging_type(saved_schema[t].columns[c].db_type)}, "
+                        typed_schema += "mutable UUID, seq_id SERIAL);"
+                        cur.execute(f"DROP TABLE IF EXISTS {table}")
+                        cur.execute(typed_schema)
         cur.execute("SET search_path TO api_exposed, public")
 
         # Aside from different data types the difference between upload and
@@ -46,10 +101,62 @@ def database_setup(
                     mutable UUID NOT NULL);
                 """
                 cur.execute(api_exposed_schema)
+                for c in saved_schema[t].columns:
+                    cur.execute(
+                        f"ALTER TABLE api_exposed.{saved_schema[t].db_table_name} ADD COLUMN IF NOT EXISTS {saved_schema[t].columns[c].db_column_name} {saved_schema[t].columns[c].db_type}"
+                    )
+                # Validity periods as generated ranges, for as-of queries.
+                for period in period_columns(saved_schema[t]):
+                    cur.execute(
+                        add_period_query(
+                            f"api_exposed.{saved_schema[t].db_table_name}", period
+                        )
+                    )
 
         cnx.commit()
 
 
+# Columns whose type has been widened by the schema registry since the
+# api_exposed table was created are altered to the new type. This runs
+# before database_setup, which only adds what is missing.
+def widen_columns(
+    registered_schema: dict[str, DbSchema],
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+) -> None:
+    with cnx.cursor() as cur:
+        for t in saved_schema:
+            if t not in registered_schema:
+                continue
+            registered_columns = registered_schema[t].columns
+            for c in saved_schema[t].columns:
+                if c not in registered_columns:
+                    continue
+                old_type = registered_columns[c].db_type
+                new_type = saved_schema[t].columns[c].db_type
+                if old_type == new_type:
+                    continue
+                column = saved_schema[t].columns[c].db_column_name
+                # A generated period can't outlive a change of the type of
+                # its columns. database_setup adds it again if the columns
+                # are still TIMESTAMPTZ.
+                period = column_period(column)
+                if period is not None:
+                    cur.execute(
+                        f"ALTER TABLE api_exposed.{saved_schema[t].db_table_name} DROP COLUMN IF EXISTS {period}"
+                    )
+                using = f"{column}::{new_type}"
+                if old_type.startswith("GEOMETRY") and new_type == "TEXT":
+                    using = f"ST_AsText({column})"
+                cur.execute(
+                    f"ALTER TABLE api_exposed.{saved_schema[t].db_table_name} ALTER COLUMN {column} TYPE {new_type} USING {using}"
+                )
+                print(
+                    f"{saved_schema[t].db_table_name}.{column} widened from {old_type} to {new_type}."
+                )
+    cnx.commit()
+
+
 # This function loops through the entire json file to identify table names,
 # column names, and data types.
 
@@ -79,22 +186,42 @@ def database_setup(
 # 5. What is the value in a key/value pair: event in
 #    ("string", "number", "boolean") and
 #    current_object_mapped == False.
-def map_schema(file_path: str) -> dict[str, DbSchema]:
+#
+# Columns found in known_schema (the latest schema from the schema registry)
+# keep their registered type as long as their values in the first 1000 rows
+# fit it. A value that doesn't fit, and would fail the cast of the upsert,
+# widens the registered type as in evolve_schema (see
+# schema_registry.widen_type).
+# The file is parsed to its end either way, as a new data object can start
+# anywhere in it.
+def map_schema(
+    file_path: str, known_schema: dict[str, DbSchema] | None = None
+) -> dict[str, DbSchema]:
+    known_schema = known_schema or {}
     saved_schema: dict[str, DbSchema] = {}
-    with open(file_path, "rb") as f:
+    with open_data_file(file_path) as f:
         parser = ijson.parse(f)
         current_object = None
         object_prefix = None
         current_object_mapped = False
         current_columns_mapped = False
+        data_types: dict[str, ColumnTypeInference] = {}
+        known_types: dict[str, ColumnTypeInference] = {}
+
+        def set_types() -> None:
+            columns = saved_schema[current_object].columns
+            for dt in data_types:
+                columns[dt].db_type = data_types[dt].result()
+            for dt in known_types:
+                columns[dt].db_type = widen_type(
+                    columns[dt].db_type, known_types[dt].result()
+                )
+
         for prefix, event, value in parser:
             # Start of object (db table)
             if event == "map_key" and prefix == "":
                 if current_object is not None:
-                    for dt in data_types:
-                        saved_schema[current_object].columns[dt].db_type = set_type(
-                            data_types[dt]
-                        )
+                    set_types()
 
                 if value not in saved_schema:
                     current_object = value
@@ -102,7 +229,11 @@ def map_schema(file_path: str) -> dict[str, DbSchema]:
                         db_table_name=sqlify_names(str(value).replace("List", "")),
                         columns={},
                     )
-                    data_types: dict[str, list[str]] = {}
+                    known_columns = (
+                        known_schema[value].columns if value in known_schema else {}
+                    )
+                    data_types = {}
+                    known_types = {}
                     current_object_mapped = False
                     current_columns_mapped = False
                     searched_rows = 0
@@ -119,25 +250,34 @@ def map_schema(file_path: str) -> dict[str, DbSchema]:
                 # Key (db table column)
                 elif event == "map_key":
                     if not current_columns_mapped:
-                        if value not in saved_schema[current_object].columns:
+                        if value in known_columns:
+                            saved_schema[current_object].columns[value] = known_columns[
+                                value
+                            ].model_copy()
+                        elif value not in saved_schema[current_object].columns:
                             saved_schema[current_object].columns[value] = ColumnSchema(
                                 db_column_name=sqlify_names(value),
                                 db_type=None,
                             )
-                            data_types[value] = []
+                            data_types[value] = ColumnTypeInference()
                     last_key = value
                 # Value of key (db table column)
                 elif event in ("string", "number", "boolean"):
                     if (
                         searched_rows < 1000
-                    ):  # To prevent falsey identified data types, each
-                        # unique data type found in the first 1000 row is
-                        # stored in a list. Finally, the is fed to set_type()
-                        # which returns the most "agnostic" data type, e.g.
-                        # if both TEXT and INTEGER are found, TEXT is returned.
-                        data_types[last_key].append(get_type(str(value)))
+                    ):  # To prevent falsey identified data types, the
+                        # data types found in the first 1000 row are counted
+                        # per column. Finally, set_type() returns the most
+                        # "agnostic" data type, e.g. if both TEXT and INTEGER
+                        # are found, TEXT is returned.
+                        if last_key in data_types:
+                            data_types[last_key].add(str(value))
+                        elif last_key in known_columns:
+                            known_types.setdefault(last_key, ColumnTypeInference()).add(
+                                str(value)
+                            )
                     else:
                         current_object_mapped = True
-        for dt in data_types:
-            saved_schema[current_object].columns[dt].db_type = set_type(data_types[dt])
+        if current_object is not None:
+            set_types()
     return saved_schema
@@ -0,0 +1,304 @@
+# Multi-file delta ingestion: applies every daily delta archive in a
+# directory, oldest first, e.g. to catch up on weeks of deltas after an
+# outage. The archives are ordered by the timestamp in their name
+# (BBR_Totaludtraek_DeltaDaily_JSON_HF_<yyyymmddhhmmss>.zip) and read
+# straight from the zip, so nothing is extracted to disk.
+#
+# A producer thread maps the schema of every file and stages it, while the
+# main thread checks and upserts the file staged before it. Parsing and
+# staging of file N+1 thereby overlaps with the upsert of file N. The files
+# are staged in alternating staging slots (see typed_staging.staging_schema)
+# and handed over in a FIFO queue to a single consumer, so every file is
+# upserted after all older files and the bitemporal history is built in
+# order. A slot is only staged again once the consumer has checked and
+# cleaned up the file staged in it.
+# When a file brings a schema change, the producer waits until every staged
+# file has been upserted before the tables are altered.
+#
+# Files the run ledger records as loaded are skipped. A file that was not
+# loaded completely is loaded again from the start, as every stage of it is
+# idempotent. On the first failing file no newer file is upserted, and a
+# rerun continues with that file.
+
+import argparse
+import os
+import re
+import threading
+
+from datetime import datetime
+from psycopg import connect
+from queue import Queue
+
+from src.current_state import current_state_setup
+from src.database_creation import database_setup, map_schema, widen_columns
+from src.data_load import RED, RESET, cleanup, upload_data
+from src.env import POSTGRES_CONNECTION_STRING
+from src.run_ledger import RunLedger, run_ledger_setup, source_id
+from src.run_report import RunRecorder, data_bytes, write_report
+from src.scheduler import run_table_stages, table_stages
+from src.schema_registry import (
+    evolve_schema,
+    load_schema_registry,
+    save_schema_registry,
+)
+from src.type_models import DbSchema
+from src.typed_staging import STAGING_SLOTS
+
+DELTA_FILE = re.compile(r"_(\d{14})\.zip$")
+
+
+def delta_timestamp(file_path: str) -> datetime | None:
+    match = DELTA_FILE.search(os.path.basename(file_path))
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d%H%M%S")
+
+
+# The delta archives of a directory, oldest first. Other files are ignored.
+def delta_files(directory: str) -> list[str]:
+    files = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if delta_timestamp(name) is not None
+    ]
+    return sorted(files, key=delta_timestamp)
+
+
+def report_path(report_dir: str, file_path: str) -> str:
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(report_dir, f"{name}.json")
+
+
+# Loads the files in the given order and returns whether all of them were
+# loaded. A run report is written per file to report_dir.
+def ingest_deltas(
+    files: list[str],
+    report_dir: str,
+    typed_staging: bool = False,
+    mutable_hash: str = "md5",
+    reinfer: bool = False,
+    batch_size: int = 50000,
+    batch_workers: int = 1,
+    merge: bool = False,
+    workers: int = 4,
+    bulk_load: bool = False,
+) -> bool:
+    os.makedirs(report_dir, exist_ok=True)
+    # Staged files in the order they are to be upserted, None after the last.
+    staged: Queue = Queue()
+    free_slots: Queue = Queue()
+    for slot in range(STAGING_SLOTS):
+        free_slots.put(slot)
+    failed = threading.Event()
+
+    def stage_files() -> None:
+        try:
+            with connect(POSTGRES_CONNECTION_STRING) as cnx:
+                registered_schema = load_schema_registry(cnx)
+                # Schemas the tables have been set up for in this run.
+                set_up: dict[str, DbSchema] = {}
+                for file_path in files:
+                    slot = free_slots.get()
+                    if failed.is_set():
+                        return
+                    ledger = RunLedger.load(source_id(file_path), cnx)
+                    ledger.clear(cnx)
+                    recorder = RunRecorder(file_path)
+                    file_size = data_bytes(file_path)
+                    print(f"Mapping schema of {file_path}...")
+                    with recorder.stage("map schema", bytes_read=file_size):
+                        saved_schema = evolve_schema(
+                            registered_schema,
+                            map_schema(
+                                file_path, None if reinfer else registered_schema
+                            ),
+                        )
+                    if any(set_up.get(t) != saved_schema[t] for t in saved_schema):
+                        # Every other slot is taken, so no staged file is
+                        # left when the tables are altered.
+                        slots = [free_slots.get() for _ in range(STAGING_SLOTS - 1)]
+                        if failed.is_set():
+                            return
+                        print("Setting up database...")
+                        with recorder.stage("database setup"):
+                            widen_columns(registered_schema, saved_schema, cnx)
+                            database_setup(
+                                saved_schema,
+                                cnx,
+                                typed_staging,
+                                STAGING_SLOTS,
+                                bulk_load,
+                            )
+                            current_state_setup(registered_schema, saved_schema, cnx)
+                            save_schema_registry(registered_schema, saved_schema, cnx)
+                            # Releases the locks of the ALTERs before the file
+                            # is staged.
+                            cnx.commit()
+                        registered_schema = {**registered_schema, **saved_schema}
+                        set_up.update(saved_schema)
+                        for other in slots:
+                            free_slots.put(other)
+                    print(f"Staging {file_path} in slot {slot}...")
+                    with recorder.stage("upload", bytes_read=file_size) as timing:
+                        file_digests = upload_data(
+                            saved_schema,
+                            cnx,
+                            file_path,
+                            typed_staging,
+                            mutable_hash,
+                            slot,
+                            bulk_load,
+                        )
+                        timing.rows = sum(d.rows for d in file_digests.values())
+                    recorder.file_digests(
+                        file_digests,
+                        {t: saved_schema[t].db_table_name for t in file_digests},
+                    )
+                    staged.put(
+                        (file_path, slot, saved_schema, file_digests, recorder, ledger)
+                    )
+        except Exception as e:
+            print(f"Staging failed {RED}ERROR{RESET}: {e}")
+            failed.set()
+        finally:
+            staged.put(None)
+
+    producer = threading.Thread(target=stage_files)
+    producer.start()
+    # Set once every staged file has been loaded.
+    done = False
+    try:
+        with connect(POSTGRES_CONNECTION_STRING) as cnx:
+            while (item := staged.get()) is not None:
+                file_path, slot, saved_schema, file_digests, recorder, ledger = item
+                print(f"Checking and upserting {file_path}...")
+                with cnx.cursor() as cur:
+                    cur.execute("SELECT LOCALTIMESTAMP")
+                    run_started = cur.fetchone()[0]
+                cnx.commit()
+                with recorder.stage(
+                    "check and upsert", rows=recorder.report.stages[-1].rows
+                ):
+                    failures = run_table_stages(
+                        saved_schema,
+                        table_stages(
+                            file_digests,
+                            run_started,
+                            typed_staging,
+                            batch_size,
+                            batch_workers,
+                            merge,
+                            slot,
+                            bulk_load,
+                        ),
+                        workers,
+                        recorder,
+                    )
+                if failures:
+                    for failure in failures:
+                        print(
+                            f"{failure.table} failed at {failure.stage} {RED}ERROR{RESET}: {failure.error}"
+                        )
+                    write_report(
+                        recorder.finish(False), report_path(report_dir, file_path)
+                    )
+                    break
+                with recorder.stage("cleanup"):
+                    ledger.record("run", cnx)
+                    cleanup(cnx, None, [slot])
+                write_report(recorder.finish(True), report_path(report_dir, file_path))
+                print(f"{file_path} loaded.")
+                free_slots.put(slot)
+            else:
+                done = True
+    finally:
+        # On a failure or an error the producer is stopped, and woken in case
+        # it waits for slots, before it is joined.
+        if not done:
+            failed.set()
+            for slot in range(STAGING_SLOTS):
+                free_slots.put(slot)
+        producer.join()
+    return not failed.is_set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load every delta archive of a directory in timestamp order"
+    )
+    parser.add_argument(
+        "--directory", default="data", help="Directory with the delta archives."
+    )
+    parser.add_argument(
+        "--report-dir",
+        default="reports",
+        help="Directory the run report of every file is written to.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of tables processed in parallel, each on its own connection.",
+    )
+    parser.add_argument(
+        "--reinfer",
+        action="store_true",
+        help="Infer the type of every column, not only of columns new since the last run.",
+    )
+    parser.add_argument(
+        "--typed-staging",
+        action="store_true",
+        help="Stage typed values with binary COPY instead of TEXT columns.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50000,
+        help="Staged rows upserted and committed per batch, 0 for one batch per table.",
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=1,
+        help="Number of upsert batches of a table run in parallel.",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Upsert with MERGE instead of INSERT ... ON CONFLICT.",
+    )
+    parser.add_argument(
+        "--mutable-hash",
+        choices=["md5", "blake2b"],
+        default="md5",
+        help="Hash used to detect changed rows. Switching it makes every row look changed once.",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Stage in UNLOGGED tables, tune the load sessions and build the indexes of empty tables after the upsert.",
+    )
+    args = parser.parse_args()
+
+    with connect(POSTGRES_CONNECTION_STRING) as cnx:
+        run_ledger_setup(cnx)
+        files = []
+        for file_path in delta_files(args.directory):
+            if RunLedger.load(source_id(file_path), cnx).done("run"):
+                print(f"{file_path} has already been loaded.")
+            else:
+                files.append(file_path)
+    print(f"{len(files)} delta files to load.")
+    if not ingest_deltas(
+        files,
+        args.report_dir,
+        args.typed_staging,
+        args.mutable_hash,
+        args.reinfer,
+        args.batch_size,
+        args.batch_workers,
+        args.merge,
+        args.workers,
+        args.bulk_load,
+    ):
+        raise SystemExit(1)
@@ -6,3 +6,11 @@ import os
 dotenv.load_dotenv()
 POSTGRES_CONNECTION_STRING = os.getenv("POSTGRES_CONNECTION_STRING")
 API_KEY = os.getenv("API_KEY")
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1"))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", "10000"))
+API_CACHE_POLL_SECONDS = float(os.getenv("API_CACHE_POLL_SECONDS", "5"))
+API_BULK_CHUNK_SIZE = int(os.getenv("API_BULK_CHUNK_SIZE", "1000"))
+SPARK_MASTER = os.getenv("SPARK_MASTER", "local[*]")
+SPARK_JDBC_PACKAGE = os.getenv("SPARK_JDBC_PACKAGE", "org.postgresql:postgresql:42.7.5")
+BULK_MAINTENANCE_WORK_MEM = os.getenv("BULK_MAINTENANCE_WORK_MEM", "1GB")
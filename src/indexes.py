@@ -0,0 +1,158 @@
+# Secondary indexes of the api_exposed tables.
+# The indexes are declared once below and created for every table that has
+# the columns they need. They are built with CREATE INDEX CONCURRENTLY after
+# the upsert, so the API keeps reading the tables while they are built, and
+# the load itself doesn't maintain indexes that don't exist yet.
+# The queries of the API look up the rows of an id_lokal_id, optionally only
+# the valid ones (registrering_til IS NULL), sorted by virkning_fra and
+# registrering_fra. The partial index only holds the valid rows, so it stays
+# small. Rows that are both valid and in use are read from the current-state
+# tables (see current_state.py), which have an index of their own. The GiST
+# index over the generated validity periods (see bitemporal.py) serves as-of
+# queries, and every geometry column gets a GiST index for the spatial
+# queries of the API.
+
+from psycopg import Connection, connect
+from typing import Any
+
+from src.bitemporal import period_columns
+from src.bulk_load import tune_session
+from src.data_load import GREEN, RESET
+from src.env import POSTGRES_CONNECTION_STRING
+from src.type_models import DbSchema, IndexDefinition, IndexUsage
+from src.typed_staging import is_geometry_type
+
+TEMPORAL_ORDER = ["id_lokal_id", "virkning_fra DESC", "registrering_fra DESC"]
+
+INDEXES = [
+    IndexDefinition(name="id_lokal_id", columns=TEMPORAL_ORDER),
+    IndexDefinition(
+        name="gyldig",
+        columns=TEMPORAL_ORDER,
+        null_columns=["registrering_til"],
+    ),
+    IndexDefinition(name="periods", columns=["virkning", "registrering"], using="gist"),
+]
+# Indexes that are no longer declared and are dropped where they exist. The
+# current index served the rows that the current-state tables now hold.
+RETIRED_INDEXES = ["current"]
+
+
+def index_name(table: str, index: IndexDefinition) -> str:
+    return f"{table}_{index.name}_idx"
+
+
+# The indexes whose columns all exist in the table, including the generated
+# periods, followed by the indexes of the geometry columns.
+def table_indexes(table_schema: DbSchema) -> list[IndexDefinition]:
+    names = {c.db_column_name for c in table_schema.columns.values()}
+    names |= set(period_columns(table_schema))
+    return [
+        index
+        for index in INDEXES
+        if {c.split()[0] for c in index.columns} | set(index.null_columns) <= names
+    ] + [
+        IndexDefinition(name=c.db_column_name, columns=[c.db_column_name], using="gist")
+        for c in table_schema.columns.values()
+        if c.db_type is not None and is_geometry_type(c.db_type)
+    ]
+
+
+def create_index_query(table: str, index: IndexDefinition) -> str:
+    query = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, index)} ON api_exposed.{table} USING {index.using} ({', '.join(index.columns)})"
+    if index.null_columns:
+        query += " WHERE " + " AND ".join(f"{c} IS NULL" for c in index.null_columns)
+    return query
+
+
+# Table stage (see scheduler.py) creating the missing indexes of a table, and
+# dropping its retired ones.
+# CREATE INDEX CONCURRENTLY can't run inside a transaction, so the indexes
+# are built on a connection of their own in autocommit mode. A concurrent
+# build that failed leaves an invalid index behind, which is dropped and
+# built again. With bulk_load the builds get the memory of the bulk-load
+# session settings.
+def create_table_indexes(
+    t: str,
+    table_schema: DbSchema,
+    cnx: Connection[tuple[Any, ...]],
+    bulk_load: bool = False,
+) -> None:
+    table = table_schema.db_table_name
+    with connect(POSTGRES_CONNECTION_STRING, autocommit=True) as index_cnx:
+        if bulk_load:
+            tune_session(index_cnx)
+        with index_cnx.cursor() as cur:
+            for name in RETIRED_INDEXES:
+                cur.execute(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS api_exposed.{table}_{name}_idx"
+                )
+        for index in table_indexes(table_schema):
+            name = index_name(table, index)
+            with index_cnx.cursor() as cur:
+                cur.execute(
+                    """--sql
+                    SELECT NOT i.indisvalid
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = 'api_exposed' AND c.relname = %s
+                """,
+                    (name,),
+                )
+                invalid = cur.fetchone()
+                if invalid is not None and invalid[0]:
+                    cur.execute(f"DROP INDEX CONCURRENTLY api_exposed.{name}")
+                cur.execute(create_index_query(table, index))
+    print(f"{table} indexes {GREEN}OK{RESET}!")
+
+
+# Table stage (see scheduler.py) of the bulk-load mode, run before the
+# upsert. The secondary indexes of an empty table are dropped, so the first
+# load doesn't maintain them row by row, and create_table_indexes builds them
+# once the rows are in. Tables that hold rows keep their indexes, as the API
+# reads them during the load.
+def drop_deferred_indexes(
+    t: str, table_schema: DbSchema, cnx: Connection[tuple[Any, ...]]
+) -> None:
+    table = table_schema.db_table_name
+    with cnx.cursor() as cur:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM api_exposed.{table})")
+        if cur.fetchone()[0]:
+            return
+        for index in table_indexes(table_schema):
+            cur.execute(f"DROP INDEX IF EXISTS api_exposed.{index_name(table, index)}")
+    print(f"{table} indexes deferred until after the upsert.")
+
+
+# Size and usage of every index of the api_exposed tables since the
+# statistics were last reset.
+def report_indexes(
+    saved_schema: dict[str, DbSchema], cnx: Connection[tuple[Any, ...]]
+) -> list[IndexUsage]:
+    tables = [saved_schema[t].db_table_name for t in saved_schema]
+    with cnx.cursor() as cur:
+        cur.execute(
+            """--sql
+            SELECT relname, indexrelname, pg_relation_size(indexrelid), idx_scan, idx_tup_read
+            FROM pg_stat_user_indexes
+            WHERE schemaname = 'api_exposed' AND relname = ANY(%s)
+            ORDER BY relname, indexrelname
+        """,
+            (tables,),
+        )
+        usage = [
+            IndexUsage(
+                table=row[0],
+                index=row[1],
+                size_bytes=row[2],
+                scans=row[3],
+                tuples_read=row[4],
+            )
+            for row in cur.fetchall()
+        ]
+    for index in usage:
+        print(
+            f"{index.index}: {index.size_bytes / 1024**2:,.1f} MB, {index.scans} scans, {index.tuples_read} tuples read"
+        )
+    return usage
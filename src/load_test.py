@@ -0,0 +1,257 @@
+# Load test of the API against a local stack.
+# Starts src.api_main:app under uvicorn, reads id_lokal_id values of the
+# buildings loaded by the pipeline, and runs one scenario per key
+# distribution: concurrent clients post /bygning lookups for a fixed time,
+# with keys drawn uniformly or Zipf distributed (a few hot buildings and a
+# long tail, like real traffic and a cache would see it) and a mix of the
+# gyldig/ibrug flags. Throughput, latency percentiles, errors and the
+# connections postgres saw are printed and appended to a results file.
+#
+# python -m src.load_test --workers 2 --concurrency 64 --duration 30
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from psycopg import AsyncConnection, connect
+from typing import Callable
+
+from src.env import API_KEY, POSTGRES_CONNECTION_STRING
+from src.type_models import LoadTestResult
+
+# (gyldig, ibrug) by their short names in --mix.
+FLAGS = {
+    "tt": (True, True),
+    "tf": (True, False),
+    "ft": (False, True),
+    "ff": (False, False),
+}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        if name not in FLAGS:
+            raise ValueError(f"Unknown flags {name}, use {', '.join(FLAGS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+# Returns a function drawing a key. With zipf the key of rank k is drawn
+# with a probability proportional to 1 / k^s.
+def key_sampler(
+    keys: list[str], distribution: str, rng: random.Random, s: float
+) -> Callable[[], str]:
+    if distribution == "uniform":
+        return lambda: rng.choice(keys)
+    cum_weights = list(
+        itertools.accumulate(1 / rank**s for rank in range(1, len(keys) + 1))
+    )
+    total = cum_weights[-1]
+    return lambda: keys[bisect.bisect(cum_weights, rng.random() * total)]
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float, float]:
+    if len(latencies) < 2:
+        latency = latencies[0] if latencies else 0.0
+        return latency, latency, latency
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def load_keys(limit: int) -> list[str]:
+    with connect(POSTGRES_CONNECTION_STRING) as cnx, cnx.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT id_lokal_id::TEXT FROM api_exposed.bygning LIMIT %s",
+            (limit,),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def start_api(port: int, workers: int) -> subprocess.Popen:
+    api = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.api_main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ]
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs")
+            return api
+        except httpx.TransportError:
+            time.sleep(0.1)
+    api.terminate()
+    raise RuntimeError("The API did not start")
+
+
+# Samples the client connections of the database until stopped, and returns
+# the highest total and active counts seen.
+async def watch_connections(stop: asyncio.Event) -> tuple[int, int]:
+    max_total = max_active = 0
+    async with await AsyncConnection.connect(
+        POSTGRES_CONNECTION_STRING, autocommit=True
+    ) as cnx:
+        while not stop.is_set():
+            cur = await cnx.execute(
+                """
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE state = 'active')
+                FROM pg_stat_activity
+                WHERE datname = current_database()
+                    AND backend_type = 'client backend'
+                    AND pid <> pg_backend_pid()
+            """
+            )
+            total, active = await cur.fetchone()
+            max_total, max_active = max(max_total, total), max(max_active, active)
+            try:
+                await asyncio.wait_for(stop.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+    return max_total, max_active
+
+
+async def run_scenario(
+    url: str,
+    keys: list[str],
+    distribution: str,
+    mix: dict[str, float],
+    workers: int,
+    concurrency: int,
+    duration: float,
+    zipf_s: float,
+    seed: int,
+) -> LoadTestResult:
+    rng = random.Random(seed)
+    next_key = key_sampler(keys, distribution, rng, zipf_s)
+    flag_names, flag_weights = list(mix), list(mix.values())
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(http: httpx.AsyncClient) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            gyldig, ibrug = FLAGS[rng.choices(flag_names, flag_weights)[0]]
+            start = time.perf_counter()
+            try:
+                response = await http.post(
+                    f"{url}/bygning/",
+                    params={
+                        "id_lokal_id": next_key(),
+                        "gyldig": gyldig,
+                        "ibrug": ibrug,
+                    },
+                    headers={"token": API_KEY},
+                )
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    stop = asyncio.Event()
+    connections = asyncio.create_task(watch_connections(stop))
+    limits = httpx.Limits(max_connections=concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    max_connections, max_active = await connections
+    p50, p95, p99 = percentiles(latencies)
+    return LoadTestResult(
+        scenario=f"{distribution} {','.join(f'{k}={v:g}' for k, v in mix.items())}",
+        distribution=distribution,
+        mix=mix,
+        workers=workers,
+        concurrency=concurrency,
+        requests=len(latencies) + errors,
+        errors=errors,
+        requests_per_second=(len(latencies) + errors) / elapsed,
+        p50_ms=p50,
+        p95_ms=p95,
+        p99_ms=p99,
+        max_connections=max_connections,
+        max_active_connections=max_active,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds.")
+    parser.add_argument(
+        "--distributions",
+        nargs="+",
+        choices=["uniform", "zipf"],
+        default=["uniform", "zipf"],
+    )
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["tt=1", "tt=0.7,tf=0.1,ft=0.1,ff=0.1"],
+        help="gyldig/ibrug mixes, e.g. tt=0.7,ff=0.3 (t: True, f: False).",
+    )
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default="benchmarks/api_results.jsonl")
+    args = parser.parse_args()
+
+    keys = load_keys(args.keys)
+    if not keys:
+        raise SystemExit("No buildings in api_exposed.bygning, run the pipeline first.")
+    random.Random(args.seed).shuffle(keys)
+    api = start_api(args.port, args.workers)
+    try:
+        results = [
+            asyncio.run(
+                run_scenario(
+                    f"http://127.0.0.1:{args.port}",
+                    keys,
+                    distribution,
+                    parse_mix(mix),
+                    args.workers,
+                    args.concurrency,
+                    args.duration,
+                    args.zipf_s,
+                    args.seed,
+                )
+            )
+            for distribution in args.distributions
+            for mix in args.mix
+        ]
+    finally:
+        api.terminate()
+        api.wait()
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as file:
+        for result in results:
+            print(
+                f"{result.scenario}: {result.requests_per_second:,.0f} req/s, p50 {result.p50_ms:.1f} ms, p95 {result.p95_ms:.1f} ms, p99 {result.p99_ms:.1f} ms, {result.errors} errors, {result.max_connections} connections ({result.max_active_connections} active)"
+            )
+            file.write(result.model_dump_json() + "\n")
+    print(f"Results appended to {args.results}.")
@@ -1,10 +1,13 @@
 # Packages
+import ijson
 import json
 import re
 import shapely
 import zipfile
 
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, BinaryIO, Iterator
 from uuid import UUID
 
 
@@ -120,11 +123,13 @@ def get_type(string: str) -> str:
 
 
 def set_type(data_types: list[str]) -> str:
+    geometry_types = {t for t in data_types if t.startswith("GEOMETRY")}
     if "TEXT" in data_types:
         return "TEXT"
-    elif "GEOMETRY(POINT)" in data_types:
-        return "GEOMETRY(POINT)"
-    elif "GEOMETRY" in data_types:
+    elif len(geometry_types) == 1:
+        return geometry_types.pop()
+    elif geometry_types:
+        # Mixed geometry types share the generic GEOMETRY column type.
         return "GEOMETRY"
     elif "TIMESTAMPTZ" in data_types:
         return "TIMESTAMPTZ"
@@ -169,3 +174,44 @@ def sqlify_names(s: str) -> str:
 def unzip_data_file(file_path: str) -> None:
     with zipfile.ZipFile(file_path, "r") as zip_ref:
         zip_ref.extractall("data")
+
+
+# Opens the data file for binary reading. If the path points to a zip archive
+# the json member is read through a decompressing stream, so the archive never
+# has to be extracted to disk.
+@contextmanager
+def open_data_file(file_path: str) -> Iterator[BinaryIO]:
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path, "r") as zip_ref:
+            members = [n for n in zip_ref.namelist() if n.endswith(".json")]
+            if len(members) != 1:
+                raise ValueError(
+                    f"Expected exactly one json file in {file_path}, found {len(members)}"
+                )
+            with zip_ref.open(members[0]) as file:
+                yield file
+    else:
+        with open(file_path, "rb") as file:
+            yield file
+
+
+# Streams every row of every data object in the json file in a single pass,
+# yielding (object_name, row) tuples in file order. Rows are built with
+# ijson's ObjectBuilder from the low level parser events, so the file only has
+# to be parsed once no matter how many data objects it contains.
+def iter_records(file: BinaryIO) -> Iterator[tuple[str, dict[str, Any]]]:
+    current_object = None
+    item_prefix = None
+    builder = None
+    for prefix, event, value in ijson.parse(file):
+        if builder is not None:
+            builder.event(event, value)
+            if event == "end_map" and prefix == item_prefix:
+                yield current_object, builder.value
+                builder = None
+        elif event == "map_key" and prefix == "":
+            current_object = value
+            item_prefix = f"{value}.item"
+        elif event == "start_map" and prefix == item_prefix:
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
@@ -0,0 +1,81 @@
+# Row hashes computed on the client side while the rows are streamed, and
+# staged together with the rows, so postgres only has to compare them.
+# They reproduce the hashes formerly computed in SQL over the TEXT staging
+# columns, so rows loaded before keep their id and mutable.
+
+import hashlib
+
+from typing import Any
+from uuid import UUID
+
+from src.type_models import DbSchema
+
+# Staging columns the row id is computed from, in order.
+ID_COLUMNS = ["id_lokal_id", "virkning_fra", "registrering_fra"]
+
+
+# The text psycopg writes for a value parsed by ijson in a text COPY, i.e.
+# the value stored in the TEXT columns of the upload schema.
+def staged_text(value: Any) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value)
+
+
+def md5_uuid(string: str) -> UUID:
+    return UUID(hashlib.md5(string.encode("utf-8")).hexdigest())
+
+
+# Positions of the id columns among the columns of the table schema.
+def id_positions(table_schema: DbSchema) -> list[int]:
+    db_columns = [table_schema.columns[c].db_column_name for c in table_schema.columns]
+    return [db_columns.index(c) for c in ID_COLUMNS]
+
+
+# MD5(id_lokal_id || virkning_fra || registrering_fra)::UUID. As in SQL the
+# id is NULL if one of the columns is NULL.
+def row_id(texts: list[str | None], positions: list[int]) -> UUID | None:
+    parts = [texts[i] for i in positions]
+    if None in parts:
+        return None
+    return md5_uuid("".join(parts))
+
+
+# MD5(COALESCE(c1, '') || COALESCE(c2, '') || ...)::UUID over all columns.
+# The mutable hash is only compared with the mutable of the previous load of
+# the row, so a faster hash can be used. Changing the hash makes every row
+# look changed once. The row id always stays MD5, as it identifies the row.
+def row_mutable(texts: list[str | None], algorithm: str = "md5") -> UUID:
+    row = "".join(t or "" for t in texts).encode("utf-8")
+    if algorithm == "blake2b":
+        return UUID(bytes=hashlib.blake2b(row, digest_size=16).digest())
+    return UUID(hashlib.md5(row).hexdigest())
+
+
+# Staged texts of a record in the column order of the table schema.
+def staged_texts(rec: dict[str, Any], table_schema: DbSchema) -> list[str | None]:
+    return [staged_text(rec.get(c)) for c in table_schema.columns]
+
+
+# Content digest of a row for the file and staging checks. Columns are
+# separated by a unit separator and NULL is written as a record separator, so
+# NULL, empty strings and shifted values give different digests. The digest is
+# the first 64 bits of the MD5 as a signed integer, which is what
+# ('x' || LEFT(MD5(...), 16))::BIT(64)::BIGINT gives in postgres. Summing the
+# digests of all rows gives an order independent checksum of a table.
+DIGEST_SEPARATOR = "\x1f"
+DIGEST_NULL = "\x1e"
+
+
+def row_digest(texts: list[str | None]) -> int:
+    row = DIGEST_SEPARATOR.join(DIGEST_NULL if t is None else t for t in texts)
+    digest = int(hashlib.md5(row.encode("utf-8")).hexdigest()[:16], 16)
+    return digest - (1 << 64) if digest >= 1 << 63 else digest
+
+
+# The same digest computed in SQL over the given column expressions.
+def sql_row_digest(columns: list[str]) -> str:
+    array = ", ".join(f"COALESCE({c}, E'\\x1e')" for c in columns)
+    return f"('x' || LEFT(MD5(ARRAY_TO_STRING(ARRAY[{array}]::TEXT[], E'\\x1f')), 16))::BIT(64)::BIGINT"
@@ -0,0 +1,115 @@
+# The run ledger records the stages a run of a source file has completed, so
+# a rerun of the same file resumes where the last one failed instead of
+# starting over. A source is identified by the name and size of the zip
+# archive it came from.
+# Run-wide stages (the database setup, the upload) are recorded with an
+# empty object list, the stages of the scheduler per object list. A stage is
+# recorded in the transaction that commits it, with the results a rerun
+# needs: the saved schema, the file digests and the start of the run.
+# Every stage can be run again from the start: the upsert only changes rows
+# whose mutable hash differs, and the checks and index builds only read or
+# create what is missing.
+
+import os
+
+from psycopg import Connection
+from psycopg.types.json import Jsonb
+from pydantic import BaseModel
+from typing import Any
+
+
+def run_ledger_setup(cnx: Connection[tuple[Any, ...]]) -> None:
+    with cnx.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS metadata")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata.run_ledger (
+                source TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                object_list TEXT NOT NULL DEFAULT '',
+                result JSONB,
+                completed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (source, stage, object_list)
+            )
+        """
+        )
+    cnx.commit()
+
+
+def source_id(file_path: str) -> str:
+    return f"{os.path.basename(file_path)}:{os.path.getsize(file_path)}"
+
+
+class RunLedger:
+    def __init__(self, source: str, completed: dict[tuple[str, str], Any]) -> None:
+        self.source = source
+        self.completed = completed
+
+    @classmethod
+    def load(cls, source: str, cnx: Connection[tuple[Any, ...]]) -> "RunLedger":
+        with cnx.cursor() as cur:
+            cur.execute(
+                """
+                SELECT stage, object_list, result
+                FROM metadata.run_ledger
+                WHERE source = %s
+            """,
+                (source,),
+            )
+            completed = {(row[0], row[1]): row[2] for row in cur.fetchall()}
+        cnx.commit()
+        return cls(source, completed)
+
+    def done(self, stage: str, t: str = "") -> bool:
+        return (stage, t) in self.completed
+
+    def result(self, stage: str, t: str = "") -> Any:
+        return self.completed.get((stage, t))
+
+    # Records a completed stage on cnx. The caller commits it together with
+    # the work of the stage.
+    def record(
+        self,
+        stage: str,
+        cnx: Connection[tuple[Any, ...]],
+        t: str = "",
+        result: Any = None,
+    ) -> None:
+        if isinstance(result, BaseModel):
+            result = result.model_dump(mode="json")
+        with cnx.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO metadata.run_ledger (source, stage, object_list, result)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (source, stage, object_list)
+                DO UPDATE SET result = EXCLUDED.result, completed_at = NOW()
+            """,
+                (self.source, stage, t, None if result is None else Jsonb(result)),
+            )
+        self.completed[(stage, t)] = result
+
+    # Forgets completed stages, given as (stage, object list), whose work has
+    # been lost, so they run again.
+    def forget(
+        self, cnx: Connection[tuple[Any, ...]], stages: list[tuple[str, str]]
+    ) -> None:
+        with cnx.cursor() as cur:
+            for stage, t in stages:
+                cur.execute(
+                    """
+                    DELETE FROM metadata.run_ledger
+                    WHERE source = %s AND stage = %s AND object_list = %s
+                """,
+                    (self.source, stage, t),
+                )
+                self.completed.pop((stage, t), None)
+        cnx.commit()
+
+    def clear(self, cnx: Connection[tuple[Any, ...]]) -> None:
+        with cnx.cursor() as cur:
+            cur.execute(
+                "DELETE FROM metadata.run_ledger WHERE source = %s", (self.source,)
+            )
+        cnx.commit()
+        self.completed = {}
@@ -0,0 +1,199 @@
+# Instrumentation of a pipeline run.
+# The RunRecorder times the stages of data_main (wall time, rows, bytes read,
+# rows/s and the peak resident memory of the process after the stage) and,
+# through the scheduler, every stage of every table, together with the row
+# count and checksum of each table in the file and the inserted, updated and
+# unchanged rows of its upsert. The result is a RunReport, written as json,
+# and optionally in the Prometheus text format, e.g. for node_exporter's
+# textfile collector.
+
+import os
+import resource
+import threading
+import time
+import zipfile
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+from src.type_models import (
+    RunReport,
+    StageTiming,
+    TableDigest,
+    TableReport,
+    TableStageReport,
+    UpsertCounts,
+)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Bytes of json read by a pass over the file, i.e. the uncompressed size of
+# the json file of a zip archive.
+def data_bytes(file_path: str) -> int:
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as zip_ref:
+            return sum(i.file_size for i in zip_ref.infolist())
+    return os.path.getsize(file_path)
+
+
+class RunRecorder:
+    def __init__(self, file_path: str) -> None:
+        self.report = RunReport(
+            started_at=datetime.now(timezone.utc),
+            file=file_path,
+            file_bytes=os.path.getsize(file_path),
+        )
+        self.lock = threading.Lock()
+
+    # Times the stage in the with block. rows can be set on the yielded
+    # timing when they are only known after the stage.
+    @contextmanager
+    def stage(
+        self, name: str, rows: int = 0, bytes_read: int = 0
+    ) -> Iterator[StageTiming]:
+        timing = StageTiming(
+            stage=name,
+            seconds=0,
+            rows=rows,
+            rows_per_second=0,
+            peak_rss_mb=0,
+            bytes_read=bytes_read,
+        )
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - start
+            timing.rows_per_second = (
+                timing.rows / timing.seconds if timing.seconds > 0 else 0.0
+            )
+            timing.peak_rss_mb = peak_rss_mb()
+            self.report.stages.append(timing)
+
+    def table(self, table: str) -> TableReport:
+        if table not in self.report.tables:
+            self.report.tables[table] = TableReport(table=table)
+        return self.report.tables[table]
+
+    def file_digests(
+        self, digests: dict[str, TableDigest], tables: dict[str, str]
+    ) -> None:
+        for t, digest in digests.items():
+            report = self.table(tables[t])
+            report.rows = digest.rows
+            report.checksum = digest.checksum
+
+    # Called by the scheduler after every stage of a table, from the worker
+    # threads.
+    def table_stage(
+        self,
+        table: str,
+        stage: str,
+        seconds: float,
+        result: Any = None,
+        error: str | None = None,
+        skipped: bool = False,
+    ) -> None:
+        with self.lock:
+            report = self.table(table)
+            report.stages[stage] = TableStageReport(
+                seconds=seconds, ok=error is None, error=error, skipped=skipped
+            )
+            # Results of skipped stages come from the run ledger as json.
+            if stage == "upsert" and isinstance(result, dict):
+                result = UpsertCounts.model_validate(result)
+            if isinstance(result, UpsertCounts):
+                report.upsert = result
+
+    def finish(self, success: bool) -> RunReport:
+        self.report.finished_at = datetime.now(timezone.utc)
+        self.report.success = success
+        return self.report
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metric_line(name: str, value: float, **labels: str) -> str:
+    if not labels:
+        return f"{name} {value}"
+    label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+    return f"{name}{{{label_text}}} {value}"
+
+
+def prometheus_text(report: RunReport) -> str:
+    lines = [
+        "# TYPE bbr_run_success gauge",
+        metric_line("bbr_run_success", int(bool(report.success))),
+        "# TYPE bbr_run_started_timestamp_seconds gauge",
+        metric_line("bbr_run_started_timestamp_seconds", report.started_at.timestamp()),
+    ]
+    if report.finished_at is not None:
+        lines += [
+            "# TYPE bbr_run_duration_seconds gauge",
+            metric_line(
+                "bbr_run_duration_seconds",
+                (report.finished_at - report.started_at).total_seconds(),
+            ),
+        ]
+    for metric, field in [
+        ("bbr_stage_seconds", "seconds"),
+        ("bbr_stage_rows", "rows"),
+        ("bbr_stage_rows_per_second", "rows_per_second"),
+        ("bbr_stage_bytes_read", "bytes_read"),
+        ("bbr_stage_peak_rss_megabytes", "peak_rss_mb"),
+    ]:
+        lines.append(f"# TYPE {metric} gauge")
+        lines += [
+            metric_line(metric, getattr(timing, field), stage=timing.stage)
+            for timing in report.stages
+        ]
+    lines.append("# TYPE bbr_table_rows gauge")
+    lines += [
+        metric_line("bbr_table_rows", table.rows, table=name)
+        for name, table in report.tables.items()
+    ]
+    lines.append("# TYPE bbr_table_upsert_rows gauge")
+    for name, table in report.tables.items():
+        if table.upsert is not None:
+            for kind in ["inserted", "updated", "unchanged"]:
+                lines.append(
+                    metric_line(
+                        "bbr_table_upsert_rows",
+                        getattr(table.upsert, kind),
+                        table=name,
+                        kind=kind,
+                    )
+                )
+    for metric, field in [
+        ("bbr_table_stage_seconds", "seconds"),
+        ("bbr_table_stage_ok", "ok"),
+    ]:
+        lines.append(f"# TYPE {metric} gauge")
+        for name, table in report.tables.items():
+            for stage, stage_report in table.stages.items():
+                lines.append(
+                    metric_line(
+                        metric,
+                        float(getattr(stage_report, field)),
+                        table=name,
+                        stage=stage,
+                    )
+                )
+    return "\n".join(lines) + "\n"
+
+
+def write_report(
+    report: RunReport, report_path: str, prometheus_path: str | None = None
+) -> None:
+    with open(report_path, "w", encoding="utf-8") as file:
+        file.write(report.model_dump_json(indent=2))
+    if prometheus_path is not None:
+        with open(prometheus_path, "w", encoding="utf-8") as file:
+            file.write(prometheus_text(report))
@@ -0,0 +1,156 @@
+# Per-table work scheduler for the data pipeline.
+# Each table is handed to a worker from a thread pool, and the worker runs the
+# stages of that table in order on its own postgres connection. The heavy
+# lifting (casting, hashing, upserting) happens inside postgres, so threads
+# are enough to keep several server backends busy at the same time.
+# A failing stage is rolled back and stops the remaining stages of that table
+# only. The other tables carry on, and the failures are returned to the
+# caller instead of exiting the process.
+# With a run ledger, stages a previous run has completed for a table are
+# skipped, and every completed stage is recorded in the ledger in the same
+# transaction as its work.
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import partial
+from psycopg import Connection, connect
+from typing import Any, Callable
+
+from src.current_state import refresh_current_state
+from src.data_load import (
+    check_upload_and_api_exposed_table_match,
+    check_upload_and_file_table_match,
+    upsert_table,
+)
+from src.env import POSTGRES_CONNECTION_STRING
+from src.indexes import create_table_indexes, drop_deferred_indexes
+from src.run_ledger import RunLedger
+from src.run_report import RunRecorder
+from src.type_models import DbSchema, TableDigest, TableFailure
+
+# A stage may return a result, e.g. the counts of the upsert, which is handed
+# to the run recorder.
+TableStage = Callable[[str, DbSchema, Connection[tuple[Any, ...]]], Any]
+
+
+def run_table(
+    t: str,
+    table_schema: DbSchema,
+    stages: list[tuple[str, TableStage]],
+    recorder: RunRecorder | None = None,
+    ledger: RunLedger | None = None,
+) -> TableFailure | None:
+    table = table_schema.db_table_name
+    stage_name = "connect"
+    start = time.perf_counter()
+    try:
+        # The connection context rolls back the open transaction on errors.
+        with connect(POSTGRES_CONNECTION_STRING) as cnx:
+            for stage_name, stage in stages:
+                if ledger is not None and ledger.done(stage_name, t):
+                    if recorder is not None:
+                        recorder.table_stage(
+                            table,
+                            stage_name,
+                            0.0,
+                            ledger.result(stage_name, t),
+                            skipped=True,
+                        )
+                    continue
+                start = time.perf_counter()
+                result = stage(t, table_schema, cnx)
+                if ledger is not None:
+                    ledger.record(stage_name, cnx, t, result)
+                cnx.commit()
+                if recorder is not None:
+                    recorder.table_stage(
+                        table, stage_name, time.perf_counter() - start, result
+                    )
+    except Exception as e:
+        if recorder is not None:
+            recorder.table_stage(
+                table, stage_name, time.perf_counter() - start, error=str(e)
+            )
+        return TableFailure(table=table, stage=stage_name, error=str(e))
+    return None
+
+
+# Runs the stages for every table with columns on a pool of workers.
+# Tables are submitted in the order of the saved schema.
+def run_table_stages(
+    saved_schema: dict[str, DbSchema],
+    stages: list[tuple[str, TableStage]],
+    workers: int,
+    recorder: RunRecorder | None = None,
+    ledger: RunLedger | None = None,
+) -> list[TableFailure]:
+    failures: list[TableFailure] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_table, t, saved_schema[t], stages, recorder, ledger)
+            for t in saved_schema
+            if saved_schema[t].columns != {}
+        ]
+        for future in as_completed(futures):
+            failure = future.result()
+            if failure is not None:
+                failures.append(failure)
+    return failures
+
+
+# The stages every table of a staged file goes through, for data_main.py and
+# delta_ingest.py. Rows the upsert changes get an updated_at after
+# run_started. With bulk_load the indexes of empty tables are built after the
+# upsert (see bulk_load.py).
+def table_stages(
+    file_digests: dict[str, TableDigest],
+    run_started: datetime,
+    typed_staging: bool = False,
+    batch_size: int = 50000,
+    batch_workers: int = 1,
+    merge: bool = False,
+    slot: int = 0,
+    bulk_load: bool = False,
+) -> list[tuple[str, TableStage]]:
+    stages: list[tuple[str, TableStage]] = [
+        (
+            "check upload and file",
+            partial(
+                check_upload_and_file_table_match,
+                file_digests=file_digests,
+                typed_staging=typed_staging,
+                slot=slot,
+            ),
+        ),
+    ]
+    if bulk_load:
+        stages.append(("defer indexes", drop_deferred_indexes))
+    return stages + [
+        (
+            "upsert",
+            partial(
+                upsert_table,
+                typed_staging=typed_staging,
+                batch_size=batch_size,
+                batch_workers=batch_workers,
+                merge=merge,
+                slot=slot,
+                bulk_load=bulk_load,
+            ),
+        ),
+        (
+            "check upload and api_exposed",
+            partial(
+                check_upload_and_api_exposed_table_match,
+                typed_staging=typed_staging,
+                slot=slot,
+            ),
+        ),
+        (
+            "refresh current state",
+            partial(refresh_current_state, since=run_started),
+        ),
+        ("create indexes", partial(create_table_indexes, bulk_load=bulk_load)),
+    ]
@@ -0,0 +1,113 @@
+# The schema registry keeps every schema that has been loaded into the
+# database, versioned per data object (object list) in the json file.
+# A run starts from the latest registered schema, so only keys that are new
+# since the last run are inferred. The registered and the inferred schema are
+# merged, where new columns are appended and a changed column type is only
+# ever widened to a type every existing value can be cast to.
+
+from psycopg import Connection
+from psycopg.types.json import Jsonb
+from typing import Any
+
+from src.type_models import DbSchema
+
+# (from type, to type) pairs where every value of the first type can be cast
+# to the second type. Any type can be widened to TEXT.
+SAFE_WIDENINGS = {
+    ("INTEGER", "DECIMAL"),
+    ("DATE", "TIMESTAMP"),
+    ("DATE", "TIMESTAMPTZ"),
+    ("TIMESTAMP", "TIMESTAMPTZ"),
+}
+
+
+def widen_type(old_type: str | None, new_type: str | None) -> str | None:
+    if old_type is None or old_type == new_type:
+        return new_type
+    if new_type is None or (new_type, old_type) in SAFE_WIDENINGS:
+        return old_type
+    if (old_type, new_type) in SAFE_WIDENINGS:
+        return new_type
+    # Any geometry fits in a column of the generic GEOMETRY type.
+    if old_type.startswith("GEOMETRY") and new_type.startswith("GEOMETRY"):
+        return "GEOMETRY"
+    return "TEXT"
+
+
+# Merges the inferred schema into the registered one. Data objects that are
+# not in today's file are left out, as there is nothing to load for them.
+def evolve_schema(
+    registered_schema: dict[str, DbSchema], inferred_schema: dict[str, DbSchema]
+) -> dict[str, DbSchema]:
+    saved_schema: dict[str, DbSchema] = {}
+    for t in inferred_schema:
+        if t not in registered_schema:
+            saved_schema[t] = inferred_schema[t]
+            continue
+        evolved = registered_schema[t].model_copy(deep=True)
+        for c, column in inferred_schema[t].columns.items():
+            if c in evolved.columns:
+                evolved.columns[c].db_type = widen_type(
+                    evolved.columns[c].db_type, column.db_type
+                )
+            else:
+                evolved.columns[c] = column
+        saved_schema[t] = evolved
+    return saved_schema
+
+
+def schema_registry_setup(cnx: Connection[tuple[Any, ...]]) -> None:
+    with cnx.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS metadata")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata.schema_registry (
+                object_list TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                db_schema JSONB NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (object_list, version)
+            )
+        """
+        )
+    cnx.commit()
+
+
+# Returns the latest registered schema of every object list.
+def load_schema_registry(cnx: Connection[tuple[Any, ...]]) -> dict[str, DbSchema]:
+    schema_registry_setup(cnx)
+    with cnx.cursor() as cur:
+        cur.execute(
+            """
+            SELECT DISTINCT ON (object_list) object_list, db_schema
+            FROM metadata.schema_registry
+            ORDER BY object_list, version DESC
+        """
+        )
+        return {row[0]: DbSchema.model_validate(row[1]) for row in cur.fetchall()}
+
+
+# Registers a new version for every object list whose schema differs from
+# the latest registered version.
+def save_schema_registry(
+    registered_schema: dict[str, DbSchema],
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+) -> None:
+    with cnx.cursor() as cur:
+        for t in saved_schema:
+            if saved_schema[t].columns == {} or saved_schema[
+                t
+            ] == registered_schema.get(t):
+                continue
+            cur.execute(
+                """
+                INSERT INTO metadata.schema_registry (object_list, version, db_schema)
+                SELECT %s, COALESCE(MAX(version), 0) + 1, %s
+                FROM metadata.schema_registry
+                WHERE object_list = %s
+            """,
+                (t, Jsonb(saved_schema[t].model_dump()), t),
+            )
+            print(f"{saved_schema[t].db_table_name} schema registered.")
+    cnx.commit()
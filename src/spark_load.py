@@ -0,0 +1,217 @@
+# Spark engine for map_schema and upload_data, for full Totaludtraek files
+# that are too large to load through a single ijson stream in time.
+# Spark runs in local mode by default (SPARK_MASTER), and the same code runs
+# on a cluster.
+#
+# The BBR file is one json object holding a list of rows per data object,
+# written with one key per line:
+# {
+# "BBRSagList": [
+# {
+# "column_name":value,
+# ...
+# }
+# ,{
+# ...
+# }
+# Such a file can't be split by Spark's json reader, which reads a multi line
+# document in a single task. Instead the file is read as text records ending
+# at a line starting with "}", which Hadoop splits across tasks like lines of
+# text. Every record holds one row, which starts at the last line that is
+# only "{" or ",{". The data object of a row is the last "<object_name>": [ line
+# before it, which is found in a first pass over the records.
+# The file must be extracted, as Hadoop can't split a zip archive.
+#
+# Rows are parsed with json.loads into the same values ijson gives, so the
+# staged texts, row ids, mutable hashes and digests are computed with the
+# functions of row_hashes.py on the executors, and are the same as with
+# upload_data. The staged rows are written to the TEXT upload tables over
+# JDBC, with one connection per partition. The parsing of the records is in
+# spark_records.py.
+
+from bisect import bisect_right
+from psycopg import Connection
+from pyspark import RDD, StorageLevel
+from pyspark.sql import SparkSession
+from pyspark.sql.types import StringType, StructField, StructType
+from typing import Any
+
+from src.env import SPARK_JDBC_PACKAGE, SPARK_MASTER
+from src.ressources import set_type, sqlify_names
+from src.row_hashes import (
+    id_positions,
+    row_digest,
+    row_id,
+    row_mutable,
+    staged_texts,
+)
+from src.spark_records import (
+    RECORD_DELIMITER,
+    jdbc_options,
+    object_starts,
+    record_row,
+)
+from src.type_inference import ColumnTypeInference
+from src.type_models import ColumnSchema, DbSchema, TableDigest
+
+
+def spark_session(master: str = SPARK_MASTER) -> SparkSession:
+    return (
+        SparkSession.builder.master(master)
+        .appName("bbr-load")
+        .config("spark.jars.packages", SPARK_JDBC_PACKAGE)
+        .getOrCreate()
+    )
+
+
+# Every row of the file as (object_name, offset, row). The offset orders the
+# rows as in the file.
+def read_rows(spark: SparkSession, file_path: str) -> tuple[RDD, list[tuple[int, str]]]:
+    records = spark.sparkContext.newAPIHadoopFile(
+        file_path,
+        "org.apache.hadoop.mapreduce.lib.input.TextInputFormat",
+        "org.apache.hadoop.io.LongWritable",
+        "org.apache.hadoop.io.Text",
+        conf={"textinputformat.record.delimiter": RECORD_DELIMITER},
+    )
+    objects = sorted(records.flatMap(lambda r: object_starts(*r)).collect())
+    offsets = spark.sparkContext.broadcast([o[0] for o in objects])
+    names = spark.sparkContext.broadcast([o[1] for o in objects])
+
+    def parse(record: tuple[int, str]) -> list[tuple[str, int, dict[str, Any]]]:
+        row = record_row(record[1])
+        if row is None:
+            return []
+        offset = record[0] + row[0]
+        return [(names.value[bisect_right(offsets.value, offset) - 1], offset, row[1])]
+
+    return records.flatMap(parse), objects
+
+
+# Types found per column in a partition of rows. The partial results of the
+# partitions are merged, and set_type() picks the type as in map_schema.
+def partition_types(
+    rows: Any, new_columns: dict[str, list[str]]
+) -> list[tuple[tuple[str, str], set[str]]]:
+    inference: dict[tuple[str, str], ColumnTypeInference] = {}
+    for t, _, row in rows:
+        for c in new_columns.get(t, []):
+            value = row.get(c)
+            if value is not None:
+                inference.setdefault((t, c), ColumnTypeInference()).add(str(value))
+    for column in inference.values():
+        column.flush()
+    return [(key, set(column.types)) for key, column in inference.items()]
+
+
+# map_schema with Spark. The columns of a data object are the keys of its
+# first row, and columns found in known_schema keep their registered type.
+# The type of every new column is inferred from all of its values, not only
+# from the first 1000 rows, as the partitions are inferred in parallel.
+def spark_map_schema(
+    spark: SparkSession,
+    file_path: str,
+    known_schema: dict[str, DbSchema] | None = None,
+) -> dict[str, DbSchema]:
+    known_schema = known_schema or {}
+    rows, objects = read_rows(spark, file_path)
+    first_rows = dict(
+        rows.map(lambda r: (r[0], (r[1], list(r[2])))).reduceByKey(min).collect()
+    )
+    saved_schema: dict[str, DbSchema] = {}
+    new_columns: dict[str, list[str]] = {}
+    for _, t in objects:
+        known_columns = known_schema[t].columns if t in known_schema else {}
+        columns: dict[str, ColumnSchema] = {}
+        for c in first_rows[t][1] if t in first_rows else []:
+            if c in known_columns:
+                columns[c] = known_columns[c].model_copy()
+            else:
+                columns[c] = ColumnSchema(db_column_name=sqlify_names(c), db_type=None)
+                new_columns.setdefault(t, []).append(c)
+        saved_schema[t] = DbSchema(
+            db_table_name=sqlify_names(t.replace("List", "")), columns=columns
+        )
+    types = dict(
+        rows.mapPartitions(lambda part: partition_types(part, new_columns))
+        .reduceByKey(lambda a, b: a | b)
+        .collect()
+    )
+    for t, columns in new_columns.items():
+        for c in columns:
+            saved_schema[t].columns[c].db_type = set_type(list(types.get((t, c), [])))
+    return saved_schema
+
+
+# upload_data with Spark. The upload tables are truncated and the staged rows
+# are appended over JDBC by up to partitions connections per table. The
+# digests for the file check are summed per table in Spark.
+# Typed staging is not supported, as the binary COPY has no JDBC counterpart.
+def spark_upload_data(
+    spark: SparkSession,
+    saved_schema: dict[str, DbSchema],
+    cnx: Connection[tuple[Any, ...]],
+    file_path: str,
+    typed_staging: bool = False,
+    mutable_hash: str = "md5",
+    partitions: int = 8,
+) -> dict[str, TableDigest]:
+    if typed_staging:
+        raise ValueError("The spark engine only stages to the TEXT upload tables.")
+    tables = {t: s for t, s in saved_schema.items() if s.columns != {}}
+    positions = {t: id_positions(tables[t]) for t in tables}
+    with cnx.cursor() as cur:
+        for t in tables:
+            cur.execute(f"TRUNCATE TABLE upload.{tables[t].db_table_name}")
+    cnx.commit()
+
+    def stage_row(
+        row: tuple[str, int, dict[str, Any]],
+    ) -> tuple[str, list[str | None], int]:
+        t = row[0]
+        texts = staged_texts(row[2], tables[t])
+        id = row_id(texts, positions[t])
+        staged = (
+            [None if id is None else str(id)]
+            + texts
+            + [str(row_mutable(texts, mutable_hash))]
+        )
+        return t, staged, row_digest(texts)
+
+    rows, _ = read_rows(spark, file_path)
+    staged = (
+        rows.filter(lambda r: r[0] in tables)
+        .map(stage_row)
+        .persist(StorageLevel.MEMORY_AND_DISK)
+    )
+    digests = dict(
+        staged.map(lambda r: (r[0], (1, r[2])))
+        .reduceByKey(lambda a, b: (a[0] + b[0], a[1] + b[1]))
+        .collect()
+    )
+    url, properties = jdbc_options()
+    properties = {**properties, "numPartitions": str(partitions), "batchsize": "10000"}
+    for t in tables:
+        if t not in digests:
+            continue
+        columns = tables[t].columns
+        names = ["id"] + [columns[c].db_column_name for c in columns] + ["mutable"]
+        spark.createDataFrame(
+            staged.filter(lambda r, t=t: r[0] == t).map(lambda r: r[1]),
+            StructType([StructField(n, StringType()) for n in names]),
+        ).write.jdbc(
+            url,
+            f"upload.{tables[t].db_table_name}",
+            mode="append",
+            properties=properties,
+        )
+        print(f"{tables[t].db_table_name} staged ({digests[t][0]} rows).")
+    staged.unpersist()
+    return {
+        t: (
+            TableDigest(rows=digests[t][0], checksum=digests[t][1])
+            if t in digests
+            else TableDigest()
+        )
+        for t in tables
+    }
@@ -0,0 +1,50 @@
+# Parsing of the text records the spark engine reads the BBR file as (see
+# spark_load.py), and the JDBC options it stages with. Nothing here needs
+# pyspark, so the parsing runs on the executors and is tested without it.
+
+import json
+import re
+
+from decimal import Decimal
+from psycopg.conninfo import conninfo_to_dict
+from typing import Any
+
+from src.env import POSTGRES_CONNECTION_STRING
+
+RECORD_DELIMITER = "\n}"
+OBJECT_START = re.compile(r'^"(\w+)": \[', re.MULTILINE)
+ROW_START = re.compile(r"^,?(\{)\r?$", re.MULTILINE)
+
+
+# JDBC url and connection properties of the postgres connection string.
+# stringtype=unspecified lets postgres cast the staged strings to the UUID
+# columns of the upload tables.
+def jdbc_options(
+    connection_string: str = POSTGRES_CONNECTION_STRING,
+) -> tuple[str, dict[str, str]]:
+    params = conninfo_to_dict(connection_string)
+    url = f"jdbc:postgresql://{params.get('host', 'localhost')}:{params.get('port', 5432)}/{params['dbname']}"
+    properties = {
+        "driver": "org.postgresql.Driver",
+        "user": params.get("user", ""),
+        "password": params.get("password", ""),
+        "stringtype": "unspecified",
+        "reWriteBatchedInserts": "true",
+    }
+    return url, properties
+
+
+# Offsets of the "<object_name>": [ lines in the text of a record.
+def object_starts(offset: int, text: str) -> list[tuple[int, str]]:
+    return [(offset + m.start(), m.group(1)) for m in OBJECT_START.finditer(text)]
+
+
+# The row in the text of a record, and its offset in the record. The first
+# record also holds the opening "{" of the file, the last one only the
+# closing brackets.
+def record_row(text: str) -> tuple[int, dict[str, Any]] | None:
+    starts = list(ROW_START.finditer(text))
+    if not starts:
+        return None
+    start = starts[-1].start(1)
+    return start, json.loads(text[start:] + "}", parse_float=Decimal)
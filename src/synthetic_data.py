@@ -0,0 +1,243 @@
+# Synthetic BBR data for benchmarks.
+# Writes a json file with the layout of the BBR extracts, {"<Object>List":
+# [{...}, ...], ...}, with values generated from the type of every column of
+# a schema, e.g. the schema mapped from the bundled extract. Every row is
+# generated from its own seeded random generator, so a file can be generated
+# again from its seed, row by row, without keeping anything in memory.
+# A delta of an earlier file (base_seed) is made of rows that are copied
+# unchanged from it, rows that keep their id (id_lokal_id, virkning_fra and
+# registrering_fra) but change their other values, and new rows.
+#
+# python -m src.synthetic_data --rows 1000000 --out data/synthetic.zip
+
+import argparse
+import io
+import json
+import random
+import zipfile
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, TextIO
+from uuid import UUID
+
+from src.database_creation import map_schema
+from src.type_models import DbSchema
+from src.typed_staging import is_geometry_type
+
+ID_KEYS = ["id_lokalId", "virkningFra", "registreringFra"]
+# Share of NULL values in the to-columns of the periods and in other columns.
+OPEN_PERIOD_RATIO = 0.7
+NULL_RATIO = 0.3
+PERIOD_TYPES = ["TIMESTAMPTZ", "TIMESTAMP"]
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone(timedelta(hours=2)))
+# Bounds of Denmark in EPSG:25832.
+MIN_X, MAX_X = 440000.0, 900000.0
+MIN_Y, MAX_Y = 6040000.0, 6410000.0
+WORDS = ["BBR", "Registerfører", "Bygning", "Enhed", "Grund", "st", "1", "kl"]
+
+
+# Coordinates of a WKT geometry near a random point within the bounds. A
+# ring is a closed rectangle, so the polygons are valid.
+def synthetic_coordinates(rng: random.Random, ring: bool = False) -> str:
+    x, y = rng.uniform(MIN_X, MAX_X), rng.uniform(MIN_Y, MAX_Y)
+    dx, dy = rng.uniform(1, 100), rng.uniform(1, 100)
+    points = (
+        [(x, y), (x + dx, y), (x + dx, y + dy), (x, y + dy), (x, y)]
+        if ring
+        else [(x, y), (x + dx, y + dy)]
+    )
+    return ", ".join(f"{px:.2f} {py:.2f}" for px, py in points)
+
+
+# WKT of the geometry type of a GEOMETRY(<type>) column. A plain GEOMETRY
+# column gets points.
+def synthetic_geometry(db_type: str, rng: random.Random) -> str:
+    match db_type.removeprefix("GEOMETRY(").removesuffix(")"):
+        case "LINESTRING":
+            return f"LINESTRING({synthetic_coordinates(rng)})"
+        case "LINEARRING":
+            return f"LINEARRING({synthetic_coordinates(rng, ring=True)})"
+        case "POLYGON":
+            return f"POLYGON(({synthetic_coordinates(rng, ring=True)}))"
+        case "MULTIPOINT":
+            return f"MULTIPOINT({synthetic_coordinates(rng)})"
+        case "MULTILINESTRING":
+            return f"MULTILINESTRING(({synthetic_coordinates(rng)}), ({synthetic_coordinates(rng)}))"
+        case "MULTIPOLYGON":
+            return f"MULTIPOLYGON((({synthetic_coordinates(rng, ring=True)})), (({synthetic_coordinates(rng, ring=True)})))"
+        case "GEOMETRYCOLLECTION":
+            return f"GEOMETRYCOLLECTION({synthetic_geometry('GEOMETRY', rng)}, LINESTRING({synthetic_coordinates(rng)}))"
+    return f"POINT({rng.uniform(MIN_X, MAX_X):.2f} {rng.uniform(MIN_Y, MAX_Y):.2f})"
+
+
+def synthetic_value(db_type: str | None, rng: random.Random) -> Any:
+    if db_type is None:
+        return None
+    if is_geometry_type(db_type):
+        return synthetic_geometry(db_type, rng)
+    match db_type:
+        case "UUID":
+            return str(UUID(int=rng.getrandbits(128), version=4))
+        case "TIMESTAMPTZ":
+            return (EPOCH + timedelta(seconds=rng.uniform(0, 8e8))).isoformat()
+        case "TIMESTAMP":
+            return (
+                (EPOCH + timedelta(seconds=rng.uniform(0, 8e8)))
+                .replace(tzinfo=None)
+                .isoformat()
+            )
+        case "DATE":
+            return (EPOCH + timedelta(days=rng.randrange(9000))).date().isoformat()
+        case "INTEGER":
+            return rng.randrange(10000)
+        case "DECIMAL":
+            # Whole numbers are inferred as INTEGER or TEXT, not DECIMAL (see
+            # ressources.is_float), so the cents are never 00.
+            return f"{rng.randrange(10000)}.{rng.randrange(1, 100):02d}"
+    return rng.choice(WORDS)
+
+
+def synthetic_row(
+    table_schema: DbSchema, rng: random.Random, keep: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    row = {}
+    for key, column in table_schema.columns.items():
+        if keep is not None and key in keep:
+            row[key] = keep[key]
+            continue
+        null_ratio = OPEN_PERIOD_RATIO if key.endswith("Til") else NULL_RATIO
+        if key not in ID_KEYS and rng.random() < null_ratio:
+            row[key] = None
+        else:
+            row[key] = synthetic_value(column.db_type, rng)
+    # A period ends after it starts, as its tstzrange (see bitemporal.py)
+    # can't be built otherwise.
+    for key, column in table_schema.columns.items():
+        start = key.removesuffix("Til") + "Fra"
+        if (
+            key.endswith("Til")
+            and row[key] is not None
+            and row.get(start) is not None
+            and column.db_type in PERIOD_TYPES
+            and table_schema.columns[start].db_type in PERIOD_TYPES
+        ):
+            row[key] = (
+                datetime.fromisoformat(row[start])
+                + timedelta(seconds=rng.uniform(1, 8e8))
+            ).isoformat()
+    return row
+
+
+def row_rng(seed: int, t: str, i: int) -> random.Random:
+    return random.Random(f"{seed}:{t}:{i}")
+
+
+# Row i of object list t. In a delta (base_seed given) the row is copied from
+# row i of the base file, changed, or new, in the given ratios.
+def generate_row(
+    table_schema: DbSchema,
+    t: str,
+    i: int,
+    seed: int,
+    base_seed: int | None = None,
+    unchanged: float = 0.0,
+    changed: float = 0.0,
+) -> dict[str, Any]:
+    if base_seed is None:
+        return synthetic_row(table_schema, row_rng(seed, t, i))
+    kind = random.Random(f"{seed}:{base_seed}:{t}:{i}").random()
+    if kind >= unchanged + changed:
+        return synthetic_row(table_schema, row_rng(seed, t, i))
+    base_row = synthetic_row(table_schema, row_rng(base_seed, t, i))
+    if kind < unchanged:
+        return base_row
+    keep = {k: base_row[k] for k in ID_KEYS if k in base_row}
+    return synthetic_row(table_schema, row_rng(seed, t, i), keep)
+
+
+@contextmanager
+def open_output(path: str) -> Iterator[TextIO]:
+    if path.endswith(".zip"):
+        name = path.rsplit("/", 1)[-1][: -len(".zip")] + ".json"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            with zip_ref.open(name, "w", force_zip64=True) as file:
+                with io.TextIOWrapper(file, encoding="utf-8") as text:
+                    yield text
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            yield file
+
+
+# Writes rows rows of every object list of the schema to path, a .json file
+# or a .zip archive holding one, and returns the number of rows per list.
+# The file has the line layout of the BBR extracts, which the spark engine
+# splits into rows (see spark_load.py).
+def generate_file(
+    schema: dict[str, DbSchema],
+    path: str,
+    rows: int,
+    seed: int = 0,
+    base_seed: int | None = None,
+    unchanged: float = 0.0,
+    changed: float = 0.0,
+) -> dict[str, int]:
+    counts = {}
+    with open_output(path) as file:
+        file.write("{\n")
+        for n, t in enumerate(schema):
+            file.write(("\n,\n" if n else "") + json.dumps(t) + ": [\n")
+            count = rows if schema[t].columns != {} else 0
+            for i in range(count):
+                row = generate_row(schema[t], t, i, seed, base_seed, unchanged, changed)
+                # The keys of a row on a line of their own, between lines
+                # holding only "{" (",{" after the first row) and "}".
+                text = json.dumps(row, ensure_ascii=False)[1:-1]
+                file.write(("," if i else "") + "{\n" + text + "\n}\n")
+            file.write("]")
+            counts[t] = count
+        file.write("\n}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic BBR data.")
+    parser.add_argument("--out", required=True, help="Output .json or .zip file.")
+    parser.add_argument(
+        "--rows", type=int, default=100000, help="Rows per object list."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--base-seed",
+        type=int,
+        default=None,
+        help="Seed of an earlier file to generate a delta of.",
+    )
+    parser.add_argument(
+        "--unchanged",
+        type=float,
+        default=0.2,
+        help="Share of rows copied unchanged from the base file.",
+    )
+    parser.add_argument(
+        "--changed",
+        type=float,
+        default=0.3,
+        help="Share of rows of the base file with changed values.",
+    )
+    parser.add_argument(
+        "--template",
+        default="data/BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.zip",
+        help="BBR extract whose schema is used for the generated data.",
+    )
+    args = parser.parse_args()
+    counts = generate_file(
+        map_schema(args.template),
+        args.out,
+        args.rows,
+        args.seed,
+        args.base_seed,
+        args.unchanged,
+        args.changed,
+    )
+    print(f"{sum(counts.values())} rows written to {args.out}.")
@@ -0,0 +1,123 @@
+# Packages
+import json
+import numpy as np
+import re
+import shapely
+
+from collections import Counter
+
+# Modules
+from src.ressources import check_date, is_float, is_int, is_uuid, set_type
+
+# Cheap pre-classification of values. A value is only handed to the expensive
+# parsers (int/float conversion, datetime parsing, shapely, UUID) when its
+# first characters or its length make it a plausible candidate. The order of
+# the checks follows ressources.get_type, so the inferred types are the same.
+NUMBER_START = re.compile(r"^\s*([+\-.\d]|nan|inf)", re.IGNORECASE)
+WKT_START = re.compile(
+    r"^\s*(SRID=|POINT|LINESTRING|LINEARRING|POLYGON|MULTI|GEOMETRYCOLLECTION)",
+    re.IGNORECASE,
+)
+HEX = re.compile(r"^[0-9A-Fa-f]+$")
+
+# Index of the list is shapely's geometry type id.
+GEOMETRY_TYPES = [
+    "POINT",
+    "LINESTRING",
+    "LINEARRING",
+    "POLYGON",
+    "MULTIPOINT",
+    "MULTILINESTRING",
+    "MULTIPOLYGON",
+    "GEOMETRYCOLLECTION",
+]
+
+GEOMETRY_BATCH_SIZE = 512
+
+
+def is_geojson_candidate(string: str) -> bool:
+    try:
+        geojson = json.loads(string)
+    except ValueError:
+        return False
+    return isinstance(geojson, dict) and "type" in geojson and "coordinates" in geojson
+
+
+# Infers the database type of one column from the values fed to add().
+# Instead of keeping every probed type in a list, the number of values per
+# type is counted. Once TEXT has been seen the column is settled, since
+# set_type() returns TEXT whenever it is present, and further values are
+# ignored. Geometry candidates are collected and parsed by shapely in batches.
+class ColumnTypeInference:
+    def __init__(self) -> None:
+        self.types: Counter[str] = Counter()
+        self.wkt: list[str] = []
+        self.geojson: list[str] = []
+        self.wkb: list[str] = []
+
+    @property
+    def settled(self) -> bool:
+        return "TEXT" in self.types
+
+    def add(self, string: str) -> None:
+        if self.settled:
+            return
+        if NUMBER_START.match(string):
+            if is_int(string):
+                self.types["INTEGER"] += 1
+                return
+            if is_float(string):
+                self.types["DECIMAL"] += 1
+                return
+        if string[:1].isdigit():
+            is_date, date_type = check_date(string)
+            if is_date:
+                self.types[date_type] += 1
+                return
+        stripped = string.lstrip()
+        if WKT_START.match(stripped):
+            self.wkt.append(string)
+        elif stripped.startswith("{"):
+            self.geojson.append(string)
+        elif len(string) % 2 == 0 and HEX.match(string):
+            self.wkb.append(string)
+        else:
+            self.types[self.non_geometry_type(string)] += 1
+            return
+        if len(self.wkt) + len(self.geojson) + len(self.wkb) >= GEOMETRY_BATCH_SIZE:
+            self.flush()
+
+    def non_geometry_type(self, string: str) -> str:
+        if 32 <= len(string) <= 45 and is_uuid(string):
+            return "UUID"
+        return "TEXT"
+
+    # Parses the collected geometry candidates with shapely's vectorized
+    # functions. Candidates that turn out not to be geometries fall through
+    # to the remaining checks.
+    def flush(self) -> None:
+        geojson = []
+        for string in self.geojson:
+            if is_geojson_candidate(string):
+                geojson.append(string)
+            else:
+                self.types[self.non_geometry_type(string)] += 1
+        for candidates, parse in (
+            (self.wkt, shapely.from_wkt),
+            (geojson, shapely.from_geojson),
+            (self.wkb, shapely.from_wkb),
+        ):
+            if not candidates:
+                continue
+            geoms = parse(np.array(candidates, dtype=object), on_invalid="ignore")
+            for string, type_id in zip(candidates, shapely.get_type_id(geoms)):
+                if type_id >= 0:
+                    self.types[f"GEOMETRY({GEOMETRY_TYPES[type_id]})"] += 1
+                else:
+                    self.types[self.non_geometry_type(string)] += 1
+        self.wkt, self.geojson, self.wkb = [], [], []
+
+    def result(self) -> str:
+        if not self.settled:
+            self.flush()
+        return set_type(list(self.types))
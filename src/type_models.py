@@ -2,6 +2,7 @@
 
 from datetime import datetime
 from pydantic import BaseModel, Field
+from typing import Any, Literal
 from uuid import UUID
 
 # Class models
@@ -24,6 +25,106 @@ class BygningQuery(BaseModel):
     )
 
 
+class BygningBulkQuery(BaseModel):
+    model_config = {"extra": "forbid"}
+
+    gyldig: bool = Field(
+        True,
+        description="Sæt gyldig til True, hvis du kun ønsker at se den seneste registrering for hver historisk virkningsperiode.",
+    )
+    ibrug: bool = Field(
+        True,
+        description="Hvis gyldig er True, sæt da ibrug til True, for at hente information om bygningerne, som de ser ud i dag.",
+    )
+    format: Literal["ndjson", "csv"] = Field(
+        "ndjson",
+        description="Svarets format, enten en JSON-linje per bygning (ndjson) eller csv.",
+    )
+
+
+class BygningAsOfQuery(BaseModel):
+    model_config = {"extra": "forbid"}
+
+    id_lokal_id: UUID = Field(
+        UUID("918d292d-eb04-4e5d-b9d0-d8026e9e0bd6"),
+        description="UUID på den bygning, du ønsker at hente.",
+    )
+    virkning_tid: datetime | None = Field(
+        None,
+        description="Tidspunktet, registreringerne skal have virkning på. Udelades den, bruges det nuværende tidspunkt.",
+    )
+    registrering_tid: datetime | None = Field(
+        None,
+        description="Hent registreringerne, som de så ud i registret på dette tidspunkt. Udelades den, bruges det nuværende tidspunkt.",
+    )
+
+
+class BygningAsOfBulkQuery(BaseModel):
+    model_config = {"extra": "forbid"}
+
+    virkning_tid: datetime | None = Field(
+        None,
+        description="Tidspunktet, registreringerne skal have virkning på. Udelades den, bruges det nuværende tidspunkt.",
+    )
+    registrering_tid: datetime | None = Field(
+        None,
+        description="Hent registreringerne, som de så ud i registret på dette tidspunkt. Udelades den, bruges det nuværende tidspunkt.",
+    )
+    format: Literal["ndjson", "csv"] = Field(
+        "ndjson",
+        description="Svarets format, enten en JSON-linje per bygning (ndjson) eller csv.",
+    )
+
+
+class SpatialQuery(BaseModel):
+    model_config = {"extra": "forbid"}
+
+    gyldig: bool = Field(
+        True,
+        description="Sæt gyldig til True, hvis du kun ønsker at se den seneste registrering for hver historisk virkningsperiode.",
+    )
+    ibrug: bool = Field(
+        True,
+        description="Hvis gyldig er True, sæt da ibrug til True, for kun at søge blandt objekter, som de ser ud i dag.",
+    )
+    after: UUID | None = Field(
+        None,
+        description="Udelad for første side. Sæt til next_after fra forrige side for at hente den næste.",
+    )
+    limit: int = Field(100, ge=1, le=1000, description="Antal objekter per side.")
+    simplify: float | None = Field(
+        None,
+        ge=0,
+        description="Tolerance i meter for forenkling af geometrierne. Udelades den, returneres de fulde geometrier.",
+    )
+
+
+class BboxQuery(SpatialQuery):
+    min_x: float = Field(description="Mindste x-koordinat (EPSG:25832).")
+    min_y: float = Field(description="Mindste y-koordinat (EPSG:25832).")
+    max_x: float = Field(description="Største x-koordinat (EPSG:25832).")
+    max_y: float = Field(description="Største y-koordinat (EPSG:25832).")
+
+
+class RadiusQuery(SpatialQuery):
+    x: float = Field(description="Centrums x-koordinat (EPSG:25832).")
+    y: float = Field(description="Centrums y-koordinat (EPSG:25832).")
+    radius: float = Field(ge=0, description="Radius i meter.")
+
+
+class SpatialFeature(BaseModel):
+    id: UUID
+    id_lokal_id: UUID
+    virkning_fra: datetime
+    registrering_fra: datetime
+    geometry: dict[str, Any] | None
+
+
+class SpatialPage(BaseModel):
+    features: list[SpatialFeature]
+    next_after: UUID | None
+
+
 class BygningResponse(BaseModel):
     id: UUID
     byg007_bygningsnummer: int | None
@@ -42,3 +143,112 @@ class ColumnSchema(BaseModel):
 class DbSchema(BaseModel):
     db_table_name: str
     columns: dict[str, ColumnSchema]
+
+
+class TableFailure(BaseModel):
+    table: str
+    stage: str
+    error: str
+
+
+class TableDigest(BaseModel):
+    rows: int = 0
+    checksum: int = 0
+
+
+class BucketMismatch(BaseModel):
+    bucket: int
+    id_lokal_id_from: str
+    id_lokal_id_to: str
+    upload_rows: int
+    api_exposed_rows: int
+    rows: list[str]
+
+
+class IndexDefinition(BaseModel):
+    name: str
+    columns: list[str]
+    null_columns: list[str] = []
+    using: str = "btree"
+
+
+class IndexUsage(BaseModel):
+    table: str
+    index: str
+    size_bytes: int
+    scans: int
+    tuples_read: int
+
+
+class TableInfo(BaseModel):
+    table: str
+    columns: dict[str, str | None]
+    filters: list[str]
+
+
+class StageTiming(BaseModel):
+    stage: str
+    seconds: float
+    rows: int
+    rows_per_second: float
+    peak_rss_mb: float
+    bytes_read: int = 0
+
+
+class BenchmarkResult(BaseModel):
+    started_at: datetime
+    commit: str | None
+    file: str
+    file_bytes: int
+    rows: int
+    options: dict[str, Any]
+    stages: list[StageTiming]
+
+
+class LoadTestResult(BaseModel):
+    scenario: str
+    distribution: str
+    mix: dict[str, float]
+    workers: int
+    concurrency: int
+    requests: int
+    errors: int
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_connections: int
+    max_active_connections: int
+
+
+class UpsertCounts(BaseModel):
+    staged: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+class TableStageReport(BaseModel):
+    seconds: float
+    ok: bool
+    error: str | None = None
+    skipped: bool = False
+
+
+class TableReport(BaseModel):
+    table: str
+    rows: int = 0
+    checksum: int = 0
+    stages: dict[str, TableStageReport] = {}
+    upsert: UpsertCounts | None = None
+
+
+class RunReport(BaseModel):
+    started_at: datetime
+    finished_at: datetime | None = None
+    success: bool | None = None
+    file: str
+    file_bytes: int
+    stages: list[StageTiming] = []
+    tables: dict[str, TableReport] = {}
+    indexes: list[IndexUsage] = []
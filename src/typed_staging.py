@@ -0,0 +1,131 @@
+# Typed staging: values are converted to their inferred type on the client
+# side and written with binary COPY to typed tables in the upload_typed
+# schema. The upsert can then insert the staged rows as they are, instead of
+# casting every TEXT column in SQL. Geometries are staged as EWKB in BYTEA
+# columns, since postgres reads those without parsing any text.
+# The conversions follow what NULLIF(column, '')::type does in the upsert of
+# the TEXT staging tables.
+
+import shapely
+
+from datetime import datetime, tzinfo
+from decimal import Decimal
+from typing import Any, Callable
+from uuid import UUID
+
+from src.type_inference import HEX
+from src.type_models import DbSchema
+
+TYPED_STAGING_SCHEMA = "upload_typed"
+
+# Number of staging schemas per staging mode. The pipeline of delta_ingest.py
+# stages the next file in one slot while the previous file is upserted from
+# the other. A single file run only uses slot 0.
+STAGING_SLOTS = 2
+
+# Binary COPY type of each inferred type.
+COPY_TYPES = {
+    "INTEGER": "int4",
+    "DECIMAL": "numeric",
+    "TIMESTAMPTZ": "timestamptz",
+    "TIMESTAMP": "timestamp",
+    "DATE": "date",
+    "UUID": "uuid",
+    "TEXT": "text",
+}
+
+DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%d-%m-%Y",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+]
+
+
+def is_geometry_type(db_type: str) -> bool:
+    return db_type.startswith("GEOMETRY")
+
+
+# Name of the staging schema of a slot: upload or upload_typed for slot 0,
+# upload_1 or upload_typed_1 for slot 1.
+def staging_schema(typed_staging: bool = False, slot: int = 0) -> str:
+    schema = TYPED_STAGING_SCHEMA if typed_staging else "upload"
+    return schema if slot == 0 else f"{schema}_{slot}"
+
+
+def staging_type(db_type: str) -> str:
+    return "BYTEA" if is_geometry_type(db_type) else db_type
+
+
+def copy_type(db_type: str) -> str:
+    return "bytea" if is_geometry_type(db_type) else COPY_TYPES[db_type]
+
+
+# Parses the date and time formats accepted by ressources.check_date.
+def parse_datetime(string: str) -> datetime:
+    try:
+        return datetime.fromisoformat(string)
+    except ValueError:
+        pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(string, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Unknown date format: {string}")
+
+
+def parse_geometry(string: str) -> bytes:
+    if string.lstrip().startswith("{"):
+        geom = shapely.from_geojson(string)
+    elif HEX.match(string):
+        geom = shapely.from_wkb(string)
+    else:
+        geom = shapely.from_wkt(string)
+    return shapely.to_wkb(geom, include_srid=True)
+
+
+# Timestamps without offset in TIMESTAMPTZ columns are read in the time zone
+# of the postgres session, as postgres would do when casting the text.
+def converter(db_type: str, timezone: tzinfo) -> Callable[[str], Any]:
+    if is_geometry_type(db_type):
+        return parse_geometry
+    match db_type:
+        case "INTEGER":
+            return int
+        case "DECIMAL":
+            return Decimal
+        case "TIMESTAMPTZ":
+
+            def parse_timestamptz(s: str) -> datetime:
+                dt = parse_datetime(s)
+                return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone)
+
+            return parse_timestamptz
+        case "TIMESTAMP":
+            return lambda s: parse_datetime(s).replace(tzinfo=None)
+        case "DATE":
+            return lambda s: parse_datetime(s).date()
+        case "UUID":
+            return UUID
+    return str
+
+
+# Returns a function converting the staged texts of a row to typed values.
+# Empty strings become NULL like NULLIF(column, '') does.
+def row_converter(
+    table_schema: DbSchema, timezone: tzinfo
+) -> Callable[[list[str | None]], list[Any]]:
+    converters = [
+        converter(table_schema.columns[c].db_type, timezone)
+        for c in table_schema.columns
+    ]
+
+    def convert(texts: list[str | None]) -> list[Any]:
+        return [
+            None if t is None or t == "" else f(t) for f, t in zip(converters, texts)
+        ]
+
+    return convert
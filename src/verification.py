@@ -0,0 +1,165 @@
+# Verification of the upsert by id_lokal_id ranges.
+# The rows of a table are split into buckets by the leading bits of their
+# id_lokal_id, i.e. into fixed id_lokal_id ranges, and rows without an
+# id_lokal_id into a bucket of their own. For each bucket postgres returns the
+# row count and the sum of the row digests, computed with a plain hash
+# aggregate in a single pass over the table, so no table wide string is built
+# and nothing is sorted. Buckets with the same count and sum on both sides
+# match. Only the rows of the buckets that differ are fetched, to find the
+# exact rows that differ.
+
+from concurrent.futures import ThreadPoolExecutor
+from psycopg import connect
+from typing import Any
+
+from src.env import POSTGRES_CONNECTION_STRING
+from src.row_hashes import sql_row_digest
+from src.type_models import BucketMismatch, DbSchema
+from src.typed_staging import TYPED_STAGING_SCHEMA, is_geometry_type
+
+BUCKET_BITS = 8
+# Bucket of the rows without an id_lokal_id, after the id_lokal_id ranges.
+NULL_BUCKET = 1 << BUCKET_BITS
+MAX_REPORTED_ROWS = 20
+
+
+# SQL expressions for one side of the comparison. Values are compared as the
+# text of their api_exposed type, so staged TEXT values are cast the same way
+# the upsert casts them.
+class TableSide:
+    def __init__(self, table_schema: DbSchema, side: str) -> None:
+        table = table_schema.db_table_name
+        columns = table_schema.columns
+        names = [columns[c].db_column_name for c in columns]
+        types = [columns[c].db_type for c in columns]
+        # The side is api_exposed or the name of a staging schema.
+        self.table = f"{side}.{table}"
+        self.id = "id"
+        if side.startswith(TYPED_STAGING_SCHEMA):
+            self.columns = {
+                n: (
+                    f"ST_GeomFromEWKB({n})::TEXT"
+                    if is_geometry_type(tp)
+                    else f"{n}::TEXT"
+                )
+                for n, tp in zip(names, types)
+            }
+        elif side != "api_exposed":
+            self.columns = {
+                n: f"NULLIF({n}, '')::{tp}::TEXT" for n, tp in zip(names, types)
+            }
+        else:
+            self.columns = {n: f"{n}::TEXT" for n in names}
+        self.filter = "TRUE"
+        self.digest = sql_row_digest(list(self.columns.values()))
+        self.bucket = (
+            f"COALESCE(('x' || LEFT({self.columns['id_lokal_id']}, 4))::BIT(16)::INT"
+            f" >> {16 - BUCKET_BITS}, {NULL_BUCKET})"
+        )
+
+    # Only api_exposed rows with an id in the staging table are compared.
+    def restrict_to(self, staging: "TableSide") -> None:
+        self.filter = f"id IN (SELECT {staging.id} FROM {staging.table})"
+
+    def leaves_query(self) -> str:
+        return f"""
+            SELECT {self.bucket}, COUNT(*), SUM({self.digest})
+            FROM {self.table}
+            WHERE {self.filter}
+            GROUP BY 1
+        """
+
+    def rows_query(self) -> str:
+        return f"""
+            SELECT
+                {self.id}::TEXT,
+                {self.columns['id_lokal_id']},
+                {self.columns['virkning_fra']},
+                {self.columns['registrering_fra']},
+                {self.digest}
+            FROM {self.table}
+            WHERE {self.filter} AND {self.bucket} = %s
+        """
+
+
+def fetch_all(query: str, params: tuple[Any, ...] = ()) -> list[tuple[Any, ...]]:
+    with connect(POSTGRES_CONNECTION_STRING) as cnx, cnx.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+# The buckets whose row count or digest sum differ between the sides.
+def differing_buckets(
+    leaves_a: dict[int, tuple[int, int]], leaves_b: dict[int, tuple[int, int]]
+) -> list[int]:
+    return sorted(
+        bucket
+        for bucket in leaves_a.keys() | leaves_b.keys()
+        if leaves_a.get(bucket, (0, 0)) != leaves_b.get(bucket, (0, 0))
+    )
+
+
+def bucket_range(bucket: int) -> tuple[str, str]:
+    if bucket == NULL_BUCKET:
+        return "NULL", "NULL"
+    shift = 16 - BUCKET_BITS
+    low = bucket << shift
+    high = ((bucket + 1) << shift) - 1
+    return (
+        f"{low:04x}0000-0000-0000-0000-000000000000",
+        f"{high:04x}ffff-ffff-ffff-ffff-ffffffffffff",
+    )
+
+
+def describe_bucket(
+    bucket: int, upload: TableSide, api_exposed: TableSide
+) -> BucketMismatch:
+    upload_rows = {r[0]: r for r in fetch_all(upload.rows_query(), (bucket,))}
+    api_rows = {r[0]: r for r in fetch_all(api_exposed.rows_query(), (bucket,))}
+    rows = []
+    for id in sorted(upload_rows.keys() | api_rows.keys()):
+        upload_row, api_row = upload_rows.get(id), api_rows.get(id)
+        if upload_row is None or api_row is None or upload_row[4] != api_row[4]:
+            row = upload_row or api_row
+            problem = (
+                "missing in api_exposed"
+                if api_row is None
+                else "missing in upload" if upload_row is None else "differs"
+            )
+            rows.append(
+                f"id {id} (id_lokal_id {row[1]}, virkning_fra {row[2]}, registrering_fra {row[3]}) {problem}"
+            )
+    id_lokal_id_from, id_lokal_id_to = bucket_range(bucket)
+    return BucketMismatch(
+        bucket=bucket,
+        id_lokal_id_from=id_lokal_id_from,
+        id_lokal_id_to=id_lokal_id_to,
+        upload_rows=len(upload_rows),
+        api_exposed_rows=len(api_rows),
+        rows=rows[:MAX_REPORTED_ROWS],
+    )
+
+
+# Compares the staged rows of a table with the corresponding api_exposed rows
+# and returns a description of every bucket that differs. The buckets of both
+# sides, and afterwards the rows of the differing buckets, are fetched in
+# parallel on their own connections.
+def verify_table(
+    table_schema: DbSchema, staging_schema: str = "upload", workers: int = 2
+) -> list[BucketMismatch]:
+    upload = TableSide(table_schema, staging_schema)
+    api_exposed = TableSide(table_schema, "api_exposed")
+    api_exposed.restrict_to(upload)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        upload_leaves, api_leaves = executor.map(
+            fetch_all, [upload.leaves_query(), api_exposed.leaves_query()]
+        )
+        buckets = differing_buckets(
+            {r[0]: (r[1], r[2]) for r in upload_leaves},
+            {r[0]: (r[1], r[2]) for r in api_leaves},
+        )
+        return list(
+            executor.map(
+                lambda bucket: describe_bucket(bucket, upload, api_exposed), buckets
+            )
+        )
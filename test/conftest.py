@@ -0,0 +1,51 @@
+# Packages
+
+import pytest
+
+from decimal import Decimal
+from typing import Any
+
+# Modules
+
+from src.type_models import ColumnSchema, DbSchema
+
+
+# A bygning table with a column of every staged type, and a row of it as
+# read from a BBR file.
+@pytest.fixture
+def bygning_schema() -> DbSchema:
+    return DbSchema(
+        db_table_name="bygning",
+        columns={
+            "id_lokalId": ColumnSchema(db_column_name="id_lokal_id", db_type="UUID"),
+            "virkningFra": ColumnSchema(
+                db_column_name="virkning_fra", db_type="TIMESTAMPTZ"
+            ),
+            "registreringFra": ColumnSchema(
+                db_column_name="registrering_fra", db_type="TIMESTAMPTZ"
+            ),
+            "kommunekode": ColumnSchema(
+                db_column_name="kommunekode", db_type="INTEGER"
+            ),
+            "areal": ColumnSchema(db_column_name="areal", db_type="DECIMAL"),
+            "dato": ColumnSchema(db_column_name="dato", db_type="DATE"),
+            "koordinat": ColumnSchema(
+                db_column_name="koordinat", db_type="GEOMETRY(POINT)"
+            ),
+            "status": ColumnSchema(db_column_name="status", db_type="TEXT"),
+        },
+    )
+
+
+@pytest.fixture
+def bygning_record() -> dict[str, Any]:
+    return {
+        "id_lokalId": "918d292d-eb04-4e5d-b9d0-d8026e9e0bd6",
+        "virkningFra": "2025-05-20T08:01:27.961349+02:00",
+        "registreringFra": "2025-05-20T08:01:27",
+        "kommunekode": "0730",
+        "areal": Decimal("12.50"),
+        "dato": "",
+        "koordinat": "POINT(571859.35 6234943.78)",
+        "status": True,
+    }
@@ -0,0 +1,57 @@
+# Packages
+
+import asyncio
+import pytest
+
+from datetime import datetime, timezone
+from uuid import UUID
+
+# Modules
+
+from src.api_bulk import csv_lines, ndjson_lines, parse_id_lokal_ids
+from src.type_models import BygningResponse
+
+ROW = BygningResponse(
+    id=UUID("51226bc9-7a0c-6b9a-7184-049053c95a2d"),
+    byg007_bygningsnummer=2,
+    byg021_bygningens_anvendelse=None,
+    id_lokal_id=UUID("918d292d-eb04-4e5d-b9d0-d8026e9e0bd6"),
+    grund=UUID("5e0ae4a8-b4b3-479d-ab28-864a9bcbc753"),
+    virkning_fra=datetime(2025, 5, 20, 6, 1, 27, tzinfo=timezone.utc),
+    registrering_fra=datetime(2025, 5, 20, 6, 1, 27, tzinfo=timezone.utc),
+)
+
+
+async def rows(n):
+    for _ in range(n):
+        yield ROW
+
+
+async def collect(lines):
+    return [line async for line in lines]
+
+
+# %%
+def test_parse_id_lokal_ids():
+    lines = ["id_lokal_id\n", "918d292d-eb04-4e5d-b9d0-d8026e9e0bd6\n", "\n"]
+    assert parse_id_lokal_ids(lines) == [UUID("918d292d-eb04-4e5d-b9d0-d8026e9e0bd6")]
+    with pytest.raises(ValueError, match="Line 2"):
+        parse_id_lokal_ids(["918d292d-eb04-4e5d-b9d0-d8026e9e0bd6", "x"])
+
+
+# %%
+def test_ndjson_lines():
+    lines = asyncio.run(collect(ndjson_lines(rows(2))))
+    assert len(lines) == 2
+    assert BygningResponse.model_validate_json(lines[0]) == ROW
+
+
+# %%
+def test_csv_lines():
+    text = "".join(asyncio.run(collect(csv_lines(rows(2))))).splitlines()
+    assert text[0] == ",".join(BygningResponse.model_fields)
+    assert text[1] == (
+        "51226bc9-7a0c-6b9a-7184-049053c95a2d,2,,918d292d-eb04-4e5d-b9d0-d8026e9e0bd6,"
+        "5e0ae4a8-b4b3-479d-ab28-864a9bcbc753,2025-05-20T06:01:27Z,2025-05-20T06:01:27Z"
+    )
+    assert len(text) == 3
@@ -0,0 +1,78 @@
+# Packages
+
+import asyncio
+import pytest
+
+# Modules
+
+from src import api_cache
+from src.api_cache import ResponseCache, watch_data_version
+
+
+# %%
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(2)
+    cache.put("a", [1], None)
+    cache.put("b", [2], None)
+    assert cache.get("a") == [1]
+    cache.put("c", [3], None)
+    assert cache.get("b") is None
+    assert cache.get("a") == [1]
+    assert cache.get("c") == [3]
+
+
+# %%
+def test_new_data_version_clears_cache():
+    cache = ResponseCache(10)
+    cache.set_version(1)
+    cache.put("a", [1], 1)
+    cache.set_version(1)
+    assert cache.get("a") == [1]
+    cache.set_version(2)
+    assert cache.get("a") is None
+
+
+# %%
+def test_response_fetched_before_new_version_is_not_stored():
+    cache = ResponseCache(10)
+    cache.set_version(1)
+    version = cache.version
+    cache.set_version(2)
+    cache.put("a", [1], version)
+    assert cache.get("a") is None
+
+
+# %%
+def test_size_zero_disables_cache():
+    cache = ResponseCache(0)
+    cache.put("a", [1], None)
+    assert cache.get("a") is None
+
+
+# %%
+def test_watcher_survives_failing_reload(monkeypatch):
+    versions = iter([1, 2, 2, 3])
+
+    async def get_data_version(pool):
+        version = next(versions, None)
+        if version is None:
+            raise asyncio.CancelledError
+        return version
+
+    reloads = []
+
+    async def reload_schema():
+        reloads.append(cache.version)
+        if len(reloads) == 1:
+            raise TimeoutError("pool timeout")
+
+    monkeypatch.setattr(api_cache, "get_data_version", get_data_version)
+    cache = ResponseCache(10)
+    cache.set_version(1)
+    cache.put("a", [1], 1)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(watch_data_version(None, cache, 0, reload_schema))
+    # The failed reload at version 2 is retried at the next poll.
+    assert reloads == [1, 2, 2]
+    assert cache.version == 3
+    assert cache.get("a") is None
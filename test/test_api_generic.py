@@ -0,0 +1,95 @@
+# Packages
+
+import json
+import pytest
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from uuid import UUID
+
+# Modules
+
+from src.api_generic import filter_columns, json_value, read_query
+from src.type_models import ColumnSchema, DbSchema
+
+SCHEMA = DbSchema(
+    db_table_name="enhed",
+    columns={
+        c: ColumnSchema(db_column_name=c, db_type=tp)
+        for c, tp in [
+            ("id_lokal_id", "UUID"),
+            ("enh026_enhedens_samlede_areal", "INTEGER"),
+            ("koordinat", "GEOMETRY(POINT)"),
+            ("virkning_fra", "TIMESTAMPTZ"),
+            ("virkning_til", "TIMESTAMPTZ"),
+            ("registrering_fra", "TIMESTAMPTZ"),
+            ("registrering_til", "TIMESTAMPTZ"),
+        ]
+    },
+)
+ID_LOKAL_ID = "918d292d-eb04-4e5d-b9d0-d8026e9e0bd6"
+
+
+# %%
+def test_filters_are_indexed_columns():
+    assert filter_columns(SCHEMA) == {"id": "UUID", "id_lokal_id": "UUID"}
+
+
+# %%
+def test_current_rows_with_projection():
+    query, values, names = read_query(
+        SCHEMA, {"fields": "koordinat,id_lokal_id", "id_lokal_id": ID_LOKAL_ID}
+    )
+    assert names == ["id", "koordinat", "id_lokal_id"]
+    assert "SELECT id, ST_AsGeoJSON(koordinat)::JSON AS koordinat, id_lokal_id" in query
+    assert "FROM api_exposed.enhed_current" in query
+    assert values == [None, UUID(ID_LOKAL_ID), 1000]
+
+
+# %%
+def test_current_rows_without_current_state_table():
+    query, _, _ = read_query(SCHEMA, {}, current_state=False)
+    assert "FROM api_exposed.enhed\n" in query
+    assert "virkning_til IS NULL AND registrering_til IS NULL" in query
+
+
+# %%
+def test_history_page():
+    after = "00000000-0000-0000-0000-000000000001"
+    query, values, _ = read_query(
+        SCHEMA, {"gyldig": "true", "ibrug": "false", "after": after, "limit": "10"}
+    )
+    assert "FROM api_exposed.enhed\n" in query
+    assert "registrering_til IS NULL" in query
+    assert "virkning_til IS NULL" not in query
+    assert values == [UUID(after), 10]
+
+
+# %%
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"fields": "nope"},
+        {"limit": "0"},
+        {"gyldig": "maybe"},
+        {"enh026_enhedens_samlede_areal": "10"},
+        {"id_lokal_id": "not a uuid"},
+    ],
+)
+def test_invalid_parameters(params):
+    with pytest.raises(ValueError):
+        read_query(SCHEMA, params)
+
+
+# %%
+def test_json_value():
+    row = {
+        "a": datetime(2025, 5, 20, tzinfo=timezone.utc),
+        "b": Decimal("1.50"),
+        "c": UUID(ID_LOKAL_ID),
+    }
+    assert json.loads(json.dumps(row, default=json_value)) == {
+        "a": "2025-05-20T00:00:00+00:00",
+        "b": "1.50",
+        "c": ID_LOKAL_ID,
+    }
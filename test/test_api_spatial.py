@@ -0,0 +1,93 @@
+# Packages
+
+import pytest
+import shapely
+
+# Modules
+
+from src.api_spatial import polygon_wkb, spatial_query, spatial_tables
+from src.indexes import table_indexes
+from src.ressources import set_type
+from src.schema_registry import widen_type
+from src.type_models import ColumnSchema, DbSchema
+
+SQUARE = {
+    "type": "Polygon",
+    "coordinates": [[[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]],
+}
+
+
+def bitemporal_schema(table, columns):
+    columns = [
+        ("id_lokal_id", "UUID"),
+        ("virkning_fra", "TIMESTAMPTZ"),
+        ("virkning_til", "TIMESTAMPTZ"),
+        ("registrering_fra", "TIMESTAMPTZ"),
+        ("registrering_til", "TIMESTAMPTZ"),
+        *columns,
+    ]
+    return DbSchema(
+        db_table_name=table,
+        columns={n: ColumnSchema(db_column_name=n, db_type=tp) for n, tp in columns},
+    )
+
+
+# %%
+def test_polygon_wkb():
+    assert shapely.from_wkb(polygon_wkb(SQUARE)).area == 100
+    with pytest.raises(ValueError, match="Expected a Polygon"):
+        polygon_wkb({"type": "Point", "coordinates": [0, 0]})
+    with pytest.raises(ValueError, match="Invalid GeoJSON"):
+        polygon_wkb({"type": "Polygon"})
+
+
+# %%
+def test_spatial_query_parameters():
+    # simplify, filter parameters, after and limit
+    geom = "byg404_koordinat"
+    assert spatial_query("bygning", geom, "bbox", True, True).count("%s") == 7
+    assert spatial_query("bygning", geom, "radius", False, False).count("%s") == 6
+    assert "IS NULL" not in spatial_query("bygning", geom, "polygon", False, False)
+
+
+# %%
+def test_spatial_tables_of_schema():
+    schema = {
+        "bygning": bitemporal_schema(
+            "bygning", [("status", "INTEGER"), ("byg404_koordinat", "GEOMETRY(POINT)")]
+        ),
+        "jordstykke": bitemporal_schema("jordstykke", [("geometri", "GEOMETRY")]),
+        "enhed": bitemporal_schema("enhed", [("status", None)]),
+        # Features can't be built from a table without the bitemporal columns.
+        "adresse": DbSchema(
+            db_table_name="adresse",
+            columns={"punkt": ColumnSchema(db_column_name="punkt", db_type="GEOMETRY")},
+        ),
+    }
+    assert spatial_tables(schema) == {
+        "bygning": "byg404_koordinat",
+        "jordstykke": "geometri",
+    }
+
+
+# %%
+def test_geometry_columns_are_indexed():
+    schema = DbSchema(
+        db_table_name="bygning",
+        columns={
+            "byg404Koordinat": ColumnSchema(
+                db_column_name="byg404_koordinat", db_type="GEOMETRY(POINT)"
+            ),
+            "status": ColumnSchema(db_column_name="status", db_type="INTEGER"),
+        },
+    )
+    indexes = table_indexes(schema)
+    assert [(i.name, i.using) for i in indexes] == [("byg404_koordinat", "gist")]
+
+
+# %%
+def test_geometry_types():
+    assert set_type(["GEOMETRY(POLYGON)"]) == "GEOMETRY(POLYGON)"
+    assert set_type(["GEOMETRY(POINT)", "GEOMETRY(POLYGON)"]) == "GEOMETRY"
+    assert widen_type("GEOMETRY(POINT)", "GEOMETRY(POLYGON)") == "GEOMETRY"
+    assert widen_type("GEOMETRY", "GEOMETRY(POINT)") == "GEOMETRY"
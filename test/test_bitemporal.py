@@ -0,0 +1,42 @@
+# Modules
+
+from src.bitemporal import add_period_query, column_period, period_columns
+from src.indexes import table_indexes
+from src.type_models import ColumnSchema, DbSchema
+
+SCHEMA = DbSchema(
+    db_table_name="bygning",
+    columns={
+        c: ColumnSchema(db_column_name=c, db_type=tp)
+        for c, tp in [
+            ("id_lokal_id", "UUID"),
+            ("virkning_fra", "TIMESTAMPTZ"),
+            ("virkning_til", "TIMESTAMPTZ"),
+            ("registrering_fra", "TIMESTAMPTZ"),
+            ("registrering_til", "TEXT"),
+        ]
+    },
+)
+
+
+# %%
+def test_only_timestamptz_bounds_become_periods():
+    assert period_columns(SCHEMA) == {"virkning": ("virkning_fra", "virkning_til")}
+    assert column_period("registrering_til") == "registrering"
+    assert column_period("id_lokal_id") is None
+
+
+# %%
+def test_add_period_query():
+    assert add_period_query("api_exposed.bygning", "virkning") == (
+        "ALTER TABLE api_exposed.bygning ADD COLUMN IF NOT EXISTS virkning TSTZRANGE"
+        " GENERATED ALWAYS AS (tstzrange(virkning_fra, virkning_til, '[)')) STORED"
+    )
+
+
+# %%
+def test_periods_index_needs_both_periods():
+    assert "periods" not in [i.name for i in table_indexes(SCHEMA)]
+    schema = SCHEMA.model_copy(deep=True)
+    schema.columns["registrering_til"].db_type = "TIMESTAMPTZ"
+    assert "periods" in [i.name for i in table_indexes(schema)]
@@ -0,0 +1,45 @@
+# Modules
+
+from src.api_sql_queries import bygning_query
+from src.current_state import current_columns, has_current_state
+from src.type_models import ColumnSchema, DbSchema
+
+
+def schema(*columns):
+    return DbSchema(
+        db_table_name="bygning",
+        columns={c: ColumnSchema(db_column_name=c, db_type="TEXT") for c in columns},
+    )
+
+
+# %%
+def test_has_current_state():
+    assert has_current_state(schema("id_lokal_id", "virkning_til", "registrering_til"))
+    assert not has_current_state(schema("id_lokal_id", "virkning_til"))
+
+
+# %%
+def test_current_columns():
+    assert (
+        current_columns(schema("id_lokal_id", "grund"))
+        == "id, id_lokal_id, grund, created_at, updated_at, mutable"
+    )
+
+
+# %%
+def test_current_rows_are_read_from_current_state_table():
+    query = bygning_query(gyldig=True, ibrug=True)
+    assert "FROM api_exposed.bygning_current" in query
+    assert "IS NULL" not in query
+    query = bygning_query(gyldig=True, ibrug=False)
+    assert "FROM api_exposed.bygning\n" in query
+    assert "registrering_til IS NULL" in query
+
+
+# %%
+# Before a load has created bygning_current, the current rows are filtered
+# from bygning.
+def test_current_rows_without_current_state_table():
+    query = bygning_query(gyldig=True, ibrug=True, current_state=False)
+    assert "FROM api_exposed.bygning\n" in query
+    assert "virkning_til IS NULL AND registrering_til IS NULL" in query
@@ -0,0 +1,69 @@
+# Modules
+
+from src.data_load import merge_inserts_query, upsert_query, upsert_windows
+from src.type_models import ColumnSchema, DbSchema
+
+SCHEMA = DbSchema(
+    db_table_name="bygning",
+    columns={
+        "status": ColumnSchema(db_column_name="status", db_type="INTEGER"),
+        "byg404Koordinat": ColumnSchema(
+            db_column_name="byg404_koordinat", db_type="GEOMETRY(POINT)"
+        ),
+    },
+)
+
+
+def words(query):
+    return " ".join(query.split())
+
+
+# %%
+def test_upsert_windows():
+    assert upsert_windows(1, 10, 5) == [(1, 6), (6, 11)]
+    # The last window holds the remaining rows.
+    assert upsert_windows(1, 12, 5) == [(1, 6), (6, 11), (11, 13)]
+    assert upsert_windows(3, 3, 5) == [(3, 4)]
+    # batch_size=0 upserts the table in one window.
+    assert upsert_windows(7, 1000, 0) == [(7, 1001)]
+
+
+# %%
+def test_insert_query():
+    query = words(upsert_query(SCHEMA))
+    assert (
+        "INSERT INTO api_exposed.bygning (id, status, byg404_koordinat, mutable)"
+        in query
+    )
+    assert (
+        "SELECT id, NULLIF(status, '')::INTEGER AS status, "
+        "NULLIF(byg404_koordinat, '')::GEOMETRY(POINT) AS byg404_koordinat, mutable "
+        "FROM upload.bygning WHERE seq_id >= %s AND seq_id < %s"
+    ) in query
+    assert "WHERE api_exposed.bygning.mutable <> EXCLUDED.mutable" in query
+    assert "RETURNING (xmax = 0) AS inserted" in query
+    assert query.count("%s") == 2
+
+
+# %%
+def test_typed_staging_query_of_slot():
+    query = words(upsert_query(SCHEMA, typed_staging=True, slot=1))
+    assert (
+        "SELECT id, status, ST_GeomFromEWKB(byg404_koordinat) AS byg404_koordinat, "
+        "mutable FROM upload_typed_1.bygning"
+    ) in query
+
+
+# %%
+def test_merge_query():
+    query = words(upsert_query(SCHEMA, merge=True, slot=1))
+    assert query.startswith("MERGE INTO api_exposed.bygning AS target")
+    assert "FROM upload_1.bygning WHERE seq_id >= %s AND seq_id < %s" in query
+    assert "WHEN MATCHED AND target.mutable <> source.mutable THEN" in query
+    assert (
+        "VALUES (source.id, source.status, source.byg404_koordinat, source.mutable)"
+    ) in query
+    assert query.count("%s") == 2
+    assert "FROM upload_1.bygning AS source" in words(
+        merge_inserts_query(SCHEMA, slot=1)
+    )
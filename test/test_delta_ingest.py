@@ -0,0 +1,53 @@
+# Modules
+
+from datetime import datetime
+
+from src.delta_ingest import delta_files, delta_timestamp, report_path
+from src.scheduler import table_stages
+from src.typed_staging import staging_schema
+
+
+# %%
+def test_delta_files(tmp_path):
+    for name in [
+        "BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.zip",
+        "BBR_Totaludtraek_DeltaDaily_JSON_HF_20250519080155.zip",
+        "BBR_Totaludtraek_DeltaDaily_JSON_HF_20250520080312.zip",
+        "BBR_Totaludtraek_DeltaDaily_JSON_HF_20250521080209.json",
+        "notes.txt",
+    ]:
+        (tmp_path / name).write_bytes(b"")
+    files = delta_files(str(tmp_path))
+    assert [delta_timestamp(f) for f in files] == [
+        datetime(2025, 5, 19, 8, 1, 55),
+        datetime(2025, 5, 20, 8, 3, 12),
+        datetime(2025, 5, 21, 8, 2, 9),
+    ]
+    assert report_path("reports", files[0]) == (
+        "reports/BBR_Totaludtraek_DeltaDaily_JSON_HF_20250519080155.json"
+    )
+
+
+# %%
+def test_staging_schema():
+    assert staging_schema() == "upload"
+    assert staging_schema(True) == "upload_typed"
+    assert staging_schema(False, 1) == "upload_1"
+    assert staging_schema(True, 1) == "upload_typed_1"
+
+
+# %%
+def test_table_stages_of_bulk_load():
+    started = datetime(2025, 5, 21)
+    assert [name for name, _ in table_stages({}, started)] == [
+        "check upload and file",
+        "upsert",
+        "check upload and api_exposed",
+        "refresh current state",
+        "create indexes",
+    ]
+    stages = dict(table_stages({}, started, slot=1, bulk_load=True))
+    assert list(stages)[1] == "defer indexes"
+    assert stages["upsert"].keywords["bulk_load"]
+    assert stages["upsert"].keywords["slot"] == 1
+    assert stages["create indexes"].keywords["bulk_load"]
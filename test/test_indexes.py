@@ -0,0 +1,35 @@
+# Modules
+
+from src.indexes import create_index_query, table_indexes
+from src.type_models import ColumnSchema, DbSchema
+
+
+def schema(*columns):
+    return DbSchema(
+        db_table_name="bygning",
+        columns={c: ColumnSchema(db_column_name=c, db_type="TEXT") for c in columns},
+    )
+
+
+# %%
+def test_indexes_need_all_their_columns():
+    temporal = ["id_lokal_id", "virkning_fra", "registrering_fra"]
+    assert table_indexes(schema("id_lokal_id")) == []
+    assert [i.name for i in table_indexes(schema(*temporal))] == ["id_lokal_id"]
+    assert [
+        i.name
+        for i in table_indexes(schema(*temporal, "virkning_til", "registrering_til"))
+    ] == ["id_lokal_id", "gyldig"]
+
+
+# %%
+def test_partial_index_query():
+    gyldig = table_indexes(
+        schema("id_lokal_id", "virkning_fra", "registrering_fra", "registrering_til")
+    )[1]
+    assert create_index_query("bygning", gyldig) == (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bygning_gyldig_idx"
+        " ON api_exposed.bygning USING btree"
+        " (id_lokal_id, virkning_fra DESC, registrering_fra DESC)"
+        " WHERE registrering_til IS NULL"
+    )
@@ -0,0 +1,42 @@
+# Packages
+
+import pytest
+import random
+
+from collections import Counter
+
+# Modules
+
+from src.load_test import key_sampler, parse_mix, percentiles
+
+
+# %%
+def test_zipf_keys_are_skewed():
+    keys = [str(i) for i in range(1000)]
+    draw = key_sampler(keys, "zipf", random.Random(0), 1.1)
+    counts = Counter(draw() for _ in range(20000))
+    assert counts["0"] > 10 * counts.get("100", 0)
+    assert set(counts) <= set(keys)
+
+
+# %%
+def test_uniform_keys():
+    keys = ["a", "b"]
+    draw = key_sampler(keys, "uniform", random.Random(0), 1.1)
+    counts = Counter(draw() for _ in range(2000))
+    assert 800 < counts["a"] < 1200
+
+
+# %%
+def test_percentiles():
+    assert percentiles([float(i) for i in range(1, 101)]) == pytest.approx(
+        (50.5, 95.05, 99.01)
+    )
+    assert percentiles([3.0]) == (3.0, 3.0, 3.0)
+
+
+# %%
+def test_parse_mix():
+    assert parse_mix("tt=0.7,ff=0.3") == {"tt": 0.7, "ff": 0.3}
+    with pytest.raises(ValueError):
+        parse_mix("xx=1")
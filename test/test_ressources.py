@@ -0,0 +1,31 @@
+# Packages
+
+import io
+import zipfile
+
+# Modules
+
+from src.ressources import iter_records, open_data_file
+
+
+# %%
+def test_iter_records_single_pass():
+    file = io.BytesIO(
+        b'{"BygningList": [{"a": "1", "b": {"c": null}}, {"a": "2", "b": {}}],'
+        b' "EnhedList": [], "GrundList": [{"a": "3"}]}'
+    )
+    assert list(iter_records(file)) == [
+        ("BygningList", {"a": "1", "b": {"c": None}}),
+        ("BygningList", {"a": "2", "b": {}}),
+        ("GrundList", {"a": "3"}),
+    ]
+
+
+# %%
+def test_open_data_file_streams_zip_member(tmp_path):
+    zip_path = tmp_path / "data.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("data.json", '{"GrundList": [{"a": "1"}]}')
+    with open_data_file(str(zip_path)) as file:
+        assert list(iter_records(file)) == [("GrundList", {"a": "1"})]
+    assert [p.name for p in tmp_path.iterdir()] == ["data.zip"]
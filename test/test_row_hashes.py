@@ -0,0 +1,50 @@
+# Packages
+
+import hashlib
+
+from uuid import UUID
+
+# Modules
+
+from src.row_hashes import (
+    id_positions,
+    row_digest,
+    row_id,
+    row_mutable,
+    staged_texts,
+)
+
+
+# %%
+def test_row_hashes_match_sql(bygning_schema, bygning_record):
+    texts = staged_texts(bygning_record, bygning_schema)
+    expected_id = hashlib.md5(
+        (
+            "918d292d-eb04-4e5d-b9d0-d8026e9e0bd6"
+            "2025-05-20T08:01:27.961349+02:00"
+            "2025-05-20T08:01:27"
+        ).encode()
+    ).hexdigest()
+    assert row_id(texts, id_positions(bygning_schema)) == UUID(expected_id)
+    assert row_mutable(texts) == UUID(
+        hashlib.md5("".join(t or "" for t in texts).encode()).hexdigest()
+    )
+    assert row_id([None] * 8, id_positions(bygning_schema)) is None
+
+
+# %%
+def test_row_digest_is_signed_md5_prefix():
+    md5 = hashlib.md5("a\x1f\x1e\x1f".encode()).hexdigest()
+    expected = int(md5[:16], 16)
+    if expected >= 1 << 63:
+        expected -= 1 << 64
+    assert row_digest(["a", None, ""]) == expected
+    assert row_digest(["a", None, ""]) != row_digest(["a", "", None])
+
+
+# %%
+def test_blake2b_mutable(bygning_schema, bygning_record):
+    texts = staged_texts(bygning_record, bygning_schema)
+    assert row_mutable(texts, "blake2b") == row_mutable(texts, "blake2b")
+    assert row_mutable(texts, "blake2b") != row_mutable(texts)
+    assert row_mutable(texts, "blake2b") != row_mutable(texts[:-1] + ["f"], "blake2b")
@@ -0,0 +1,38 @@
+# Modules
+
+from src.run_ledger import RunLedger, source_id
+from src.run_report import RunRecorder
+from src.type_models import UpsertCounts
+
+
+# %%
+def test_source_id(tmp_path):
+    path = tmp_path / "delta.zip"
+    path.write_bytes(b"12345")
+    assert source_id(str(path)) == "delta.zip:5"
+
+
+# %%
+def test_run_ledger_done():
+    ledger = RunLedger(
+        "delta.zip:5",
+        {("upload", ""): {"typed_staging": False}, ("upsert", "BygningList"): None},
+    )
+    assert ledger.done("upload")
+    assert ledger.result("upload") == {"typed_staging": False}
+    assert ledger.done("upsert", "BygningList")
+    assert not ledger.done("upsert", "GrundList")
+    assert ledger.result("upsert", "GrundList") is None
+
+
+# %%
+def test_skipped_table_stage(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("{}")
+    recorder = RunRecorder(str(path))
+    counts = {"staged": 10, "inserted": 6, "updated": 3, "unchanged": 1}
+    recorder.table_stage("bygning", "upsert", 0.0, counts, skipped=True)
+    bygning = recorder.finish(True).tables["bygning"]
+    assert bygning.stages["upsert"].skipped
+    assert bygning.stages["upsert"].ok
+    assert bygning.upsert == UpsertCounts(**counts)
@@ -0,0 +1,37 @@
+# Modules
+
+from src.run_report import RunRecorder, prometheus_text
+from src.type_models import TableDigest, UpsertCounts
+
+
+# %%
+def test_run_report(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("{}")
+    recorder = RunRecorder(str(path))
+    with recorder.stage("upload", bytes_read=2) as timing:
+        timing.rows = 10
+    recorder.file_digests(
+        {"BygningList": TableDigest(rows=10, checksum=42)},
+        {"BygningList": "bygning"},
+    )
+    counts = UpsertCounts(staged=10, inserted=6, updated=3, unchanged=1)
+    recorder.table_stage("bygning", "upsert", 0.5, counts)
+    recorder.table_stage("bygning", "check", 0.1, error="mismatch")
+    report = recorder.finish(False)
+
+    assert report.file_bytes == 2
+    assert report.stages[0].stage == "upload"
+    assert report.stages[0].rows == 10
+    assert report.stages[0].rows_per_second > 0
+    assert report.stages[0].peak_rss_mb > 0
+    bygning = report.tables["bygning"]
+    assert (bygning.rows, bygning.checksum, bygning.upsert) == (10, 42, counts)
+    assert bygning.stages["upsert"].ok
+    assert bygning.stages["check"].error == "mismatch"
+
+    text = prometheus_text(report)
+    assert "bbr_run_success 0" in text
+    assert 'bbr_stage_bytes_read{stage="upload"} 2' in text
+    assert 'bbr_table_upsert_rows{table="bygning",kind="inserted"} 6' in text
+    assert 'bbr_table_stage_ok{table="bygning",stage="check"} 0.0' in text
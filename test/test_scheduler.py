@@ -0,0 +1,21 @@
+# Modules
+
+from datetime import datetime
+
+from src.scheduler import table_stages
+
+
+# %%
+# The data version of tables with a current-state table is bumped by the
+# refresh, so it has to run after the upsert and its check.
+def test_refresh_follows_upsert():
+    for bulk_load in (False, True):
+        names = [
+            name
+            for name, _ in table_stages({}, datetime(2025, 5, 21), bulk_load=bulk_load)
+        ]
+        assert (
+            names.index("upsert")
+            < names.index("check upload and api_exposed")
+            < names.index("refresh current state")
+        )
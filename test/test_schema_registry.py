@@ -0,0 +1,73 @@
+# Packages
+
+import json
+
+# Modules
+
+from src.database_creation import map_schema
+from src.schema_registry import evolve_schema, widen_type
+from src.type_models import ColumnSchema, DbSchema
+
+
+# %%
+def test_widen_type():
+    assert widen_type("INTEGER", "DECIMAL") == "DECIMAL"
+    assert widen_type("DECIMAL", "INTEGER") == "DECIMAL"
+    assert widen_type("TIMESTAMP", "TIMESTAMPTZ") == "TIMESTAMPTZ"
+    assert widen_type("UUID", "INTEGER") == "TEXT"
+    assert widen_type("UUID", None) == "UUID"
+
+
+# %%
+def test_evolve_schema_appends_new_columns():
+    registered = {
+        "GrundList": DbSchema(
+            db_table_name="grund",
+            columns={"a": ColumnSchema(db_column_name="a", db_type="INTEGER")},
+        )
+    }
+    inferred = {
+        "GrundList": DbSchema(
+            db_table_name="grund",
+            columns={
+                "b": ColumnSchema(db_column_name="b", db_type="UUID"),
+                "a": ColumnSchema(db_column_name="a", db_type="DECIMAL"),
+            },
+        )
+    }
+    evolved = evolve_schema(registered, inferred)
+    assert list(evolved["GrundList"].columns) == ["a", "b"]
+    assert evolved["GrundList"].columns["a"].db_type == "DECIMAL"
+    assert registered["GrundList"].columns["a"].db_type == "INTEGER"
+
+
+# %%
+def test_known_columns_are_checked(tmp_path):
+    path = tmp_path / "delta.json"
+    rows = [
+        {"status": "1", "areal": "3", "id": None, "ny": "2"},
+        {"status": "under opførelse", "areal": "4", "id": None, "ny": "3"},
+    ]
+    path.write_text(json.dumps({"GrundList": rows}))
+    known = {
+        "GrundList": DbSchema(
+            db_table_name="grund",
+            columns={
+                c: ColumnSchema(db_column_name=c, db_type=tp)
+                for c, tp in [
+                    ("status", "INTEGER"),
+                    ("areal", "DECIMAL"),
+                    ("id", "UUID"),
+                ]
+            },
+        )
+    }
+    columns = map_schema(str(path), known)["GrundList"].columns
+    # A value that doesn't fit widens the registered type, values that fit
+    # keep it, and a column without values keeps it too.
+    assert {c: columns[c].db_type for c in columns} == {
+        "status": "TEXT",
+        "areal": "DECIMAL",
+        "id": "UUID",
+        "ny": "INTEGER",
+    }
@@ -0,0 +1,37 @@
+# Modules
+
+from decimal import Decimal
+
+from src.spark_records import RECORD_DELIMITER, jdbc_options, object_starts, record_row
+
+FILE = (
+    '{\r\n"BBRSagList": [\r\n{\r\n"id_lokalId":"a","areal":12.50,"aktiv":true\r\n}\r\n'
+    ',{\r\n"id_lokalId":"b","areal":3,"aktiv":null\r\n}\r\n] \r\n,\r\n'
+    '"BygningList": [\r\n{\r\n"id_lokalId":"c"\r\n}\r\n]\r\n}'
+)
+
+
+# %%
+def test_records_of_file():
+    records, offset = [], 0
+    for text in FILE.split(RECORD_DELIMITER):
+        records.append((offset, text))
+        offset += len(text) + len(RECORD_DELIMITER)
+    objects = [o for r in records for o in object_starts(*r)]
+    rows = [(r[0] + row[0], row[1]) for r in records if (row := record_row(r[1]))]
+    assert [o[1] for o in objects] == ["BBRSagList", "BygningList"]
+    assert [row for _, row in rows] == [
+        {"id_lokalId": "a", "areal": Decimal("12.50"), "aktiv": True},
+        {"id_lokalId": "b", "areal": 3, "aktiv": None},
+        {"id_lokalId": "c"},
+    ]
+    assert objects[0][0] < rows[1][0] < objects[1][0] < rows[2][0]
+
+
+# %%
+def test_jdbc_options():
+    url, properties = jdbc_options("postgresql://user:pass@db:5433/bbr_db")
+    assert url == "jdbc:postgresql://db:5433/bbr_db"
+    assert properties["user"] == "user"
+    assert properties["password"] == "pass"
+    assert properties["stringtype"] == "unspecified"
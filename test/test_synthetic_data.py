@@ -0,0 +1,113 @@
+# Packages
+
+import pytest
+import random
+
+from datetime import datetime
+
+# Modules
+
+from src.database_creation import map_schema
+from src.ressources import check_geometry, iter_records, open_data_file
+from src.spark_records import RECORD_DELIMITER, object_starts, record_row
+from src.synthetic_data import ID_KEYS, generate_file, synthetic_value
+from src.type_inference import GEOMETRY_TYPES
+from src.type_models import ColumnSchema, DbSchema
+
+SCHEMA = {
+    "BygningList": DbSchema(
+        db_table_name="bygning",
+        columns={
+            key: ColumnSchema(db_column_name=name, db_type=tp)
+            for key, name, tp in [
+                ("id_lokalId", "id_lokal_id", "UUID"),
+                ("virkningFra", "virkning_fra", "TIMESTAMPTZ"),
+                ("registreringFra", "registrering_fra", "TIMESTAMPTZ"),
+                ("virkningTil", "virkning_til", "TIMESTAMPTZ"),
+                ("registreringTil", "registrering_til", "TIMESTAMPTZ"),
+                ("status", "status", "INTEGER"),
+                ("byg041BebyggetAreal", "byg041_bebygget_areal", "DECIMAL"),
+                ("byg404Koordinat", "byg404_koordinat", "GEOMETRY(POINT)"),
+                ("kommunekode", "kommunekode", "TEXT"),
+            ]
+        },
+    ),
+    "FordelingsarealList": DbSchema(db_table_name="fordelingsareal", columns={}),
+}
+
+
+def read_rows(path):
+    with open_data_file(path) as file:
+        return [row for _, row in iter_records(file)]
+
+
+# %%
+@pytest.mark.parametrize("suffix", [".json", ".zip"])
+def test_generated_file_has_the_schema(tmp_path, suffix):
+    path = str(tmp_path / f"synthetic{suffix}")
+    assert generate_file(SCHEMA, path, 300) == {
+        "BygningList": 300,
+        "FordelingsarealList": 0,
+    }
+    assert map_schema(path)["BygningList"] == SCHEMA["BygningList"]
+    generate_file(SCHEMA, str(tmp_path / "again.json"), 300)
+    assert read_rows(path) == read_rows(str(tmp_path / "again.json"))
+
+
+# %%
+def test_delta_file(tmp_path):
+    base, delta = str(tmp_path / "base.json"), str(tmp_path / "delta.json")
+    generate_file(SCHEMA, base, 1000, seed=1)
+    generate_file(SCHEMA, delta, 1000, seed=2, base_seed=1, unchanged=0.2, changed=0.3)
+    unchanged = changed = 0
+    for base_row, delta_row in zip(read_rows(base), read_rows(delta)):
+        if base_row == delta_row:
+            unchanged += 1
+        elif all(base_row[k] == delta_row[k] for k in ID_KEYS):
+            changed += 1
+    assert 150 < unchanged < 250
+    assert 250 < changed < 350
+
+
+# %%
+@pytest.mark.parametrize("geometry_type", GEOMETRY_TYPES)
+def test_geometry_of_column_type(geometry_type):
+    db_type = f"GEOMETRY({geometry_type})"
+    value = synthetic_value(db_type, random.Random(0))
+    assert check_geometry(value) == (True, db_type)
+    assert check_geometry(synthetic_value("GEOMETRY", random.Random(0))) == (
+        True,
+        "GEOMETRY(POINT)",
+    )
+
+
+# %%
+def test_periods_end_after_they_start(tmp_path):
+    path = str(tmp_path / "synthetic.json")
+    generate_file(SCHEMA, path, 1000, seed=2, base_seed=1, changed=0.5)
+    ends = 0
+    for row in read_rows(path):
+        for period in ("virkning", "registrering"):
+            if row[f"{period}Til"] is not None:
+                ends += 1
+                assert datetime.fromisoformat(
+                    row[f"{period}Til"]
+                ) > datetime.fromisoformat(row[f"{period}Fra"])
+    assert ends > 0
+
+
+# %%
+# The rows the spark engine splits the file into are those read with ijson.
+def test_file_splits_into_records(tmp_path):
+    path = str(tmp_path / "synthetic.json")
+    generate_file(SCHEMA, path, 20)
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    records, offset = [], 0
+    for record in text.split(RECORD_DELIMITER):
+        records.append((offset, record))
+        offset += len(record) + len(RECORD_DELIMITER)
+    objects = [o for r in records for o in object_starts(*r)]
+    rows = [row for _, r in records if (row := record_row(r))]
+    assert [o[1] for o in objects] == list(SCHEMA)
+    assert [row for _, row in rows] == read_rows(path)
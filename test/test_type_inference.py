@@ -0,0 +1,60 @@
+# Packages
+
+import pytest
+
+# Modules
+
+from src.ressources import get_type, set_type
+from src.type_inference import ColumnTypeInference
+
+VALUES = [
+    "42",
+    "0730",
+    "-7",
+    "3.14",
+    "1.0",
+    "nan",
+    "2025-05-20T07:58:40.500213+02:00",
+    "2025-05-20T07:58:40",
+    "2023-10-25",
+    "25/10/2023",
+    "POINT(571859.35 6234943.78)",
+    "POLYGON((0 0, 1 0, 1 1, 0 0))",
+    '{"type": "Point", "coordinates": [1, 2]}',
+    '{"type": "Feature"}',
+    "0101000000000000000000F03F0000000000000040",
+    "ABCDEF",
+    "4d2b9e50-61c5-41b7-98f6-66e7c46e1923",
+    "4d2b9e5061c541b798f666e7c46e1923",
+    "Byggesag",
+    "POINT",
+    "",
+    "True",
+]
+
+
+# %%
+@pytest.mark.parametrize("value", VALUES)
+def test_single_value_matches_get_type(value):
+    inference = ColumnTypeInference()
+    inference.add(value)
+    assert inference.result() == set_type([get_type(value)])
+
+
+# %%
+def test_column_settles_on_text():
+    inference = ColumnTypeInference()
+    for value in ["1", "2", "Byggesag", "POINT(1 2)"]:
+        inference.add(value)
+    assert inference.settled
+    assert inference.result() == "TEXT"
+    assert "GEOMETRY(POINT)" not in inference.types
+
+
+# %%
+def test_geometry_batches():
+    inference = ColumnTypeInference()
+    for i in range(1500):
+        inference.add(f"POINT({i} {i})")
+    assert inference.result() == "GEOMETRY(POINT)"
+    assert inference.types["GEOMETRY(POINT)"] == 1500
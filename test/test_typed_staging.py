@@ -0,0 +1,34 @@
+# Packages
+
+import shapely
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+# Modules
+
+from src.row_hashes import staged_texts
+from src.type_models import ColumnSchema, DbSchema
+from src.typed_staging import row_converter
+
+
+# %%
+def test_row_converter(bygning_schema, bygning_record):
+    texts = staged_texts(bygning_record, bygning_schema)
+    values = row_converter(bygning_schema, timezone.utc)(texts)
+    assert values[:6] == [
+        UUID("918d292d-eb04-4e5d-b9d0-d8026e9e0bd6"),
+        datetime(2025, 5, 20, 8, 1, 27, 961349, tzinfo=timezone(timedelta(hours=2))),
+        datetime(2025, 5, 20, 8, 1, 27, tzinfo=timezone.utc),
+        730,
+        Decimal("12.50"),
+        None,
+    ]
+    assert shapely.from_wkb(values[6]).equals(shapely.Point(571859.35, 6234943.78))
+    assert values[7] == "t"
+    dates = DbSchema(
+        db_table_name="dates",
+        columns={"dato": ColumnSchema(db_column_name="dato", db_type="DATE")},
+    )
+    assert row_converter(dates, timezone.utc)(["25/10/2023"]) == [date(2023, 10, 25)]
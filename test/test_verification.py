@@ -0,0 +1,52 @@
+# Modules
+
+from src.type_models import ColumnSchema, DbSchema
+from src.verification import NULL_BUCKET, TableSide, bucket_range, differing_buckets
+
+
+# %%
+def test_differing_buckets():
+    leaves = {0: (10, 123), 7: (2, -5), 255: (1, 1)}
+    changed = dict(leaves)
+    changed[7] = (2, -6)
+    changed[100] = (1, 42)
+    assert differing_buckets(leaves, leaves) == []
+    assert differing_buckets(leaves, changed) == [7, 100]
+    # Rows without an id_lokal_id are compared in a bucket of their own.
+    changed[NULL_BUCKET] = (1, 7)
+    assert differing_buckets(leaves, changed) == [7, 100, NULL_BUCKET]
+    assert differing_buckets(changed, {**changed, NULL_BUCKET: (1, 8)}) == [NULL_BUCKET]
+
+
+# %%
+def test_bucket_range():
+    assert bucket_range(0x3A) == (
+        "3a000000-0000-0000-0000-000000000000",
+        "3affffff-ffff-ffff-ffff-ffffffffffff",
+    )
+    assert bucket_range(NULL_BUCKET) == ("NULL", "NULL")
+
+
+# %%
+def test_table_side_of_staging_slot():
+    schema = DbSchema(
+        db_table_name="bygning",
+        columns={
+            "id_lokal_id": ColumnSchema(db_column_name="id_lokal_id", db_type="UUID"),
+            "byg404_koordinat": ColumnSchema(
+                db_column_name="byg404_koordinat", db_type="GEOMETRY(POINT)"
+            ),
+        },
+    )
+    upload = TableSide(schema, "upload_1")
+    assert upload.table == "upload_1.bygning"
+    assert upload.columns["id_lokal_id"] == "NULLIF(id_lokal_id, '')::UUID::TEXT"
+    assert upload.bucket.endswith(f", {NULL_BUCKET})")
+    typed = TableSide(schema, "upload_typed_1")
+    assert typed.table == "upload_typed_1.bygning"
+    assert (
+        typed.columns["byg404_koordinat"] == "ST_GeomFromEWKB(byg404_koordinat)::TEXT"
+    )
+    assert (
+        TableSide(schema, "api_exposed").columns["id_lokal_id"] == "id_lokal_id::TEXT"
+    )